@@ -1,49 +1,33 @@
 import os
 import sys
-import time
 import logging
-import streamlit as st
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from webdriver_manager.chrome import ChromeDriverManager
-from dotenv import load_dotenv
-from pathlib import Path
 
 # Add project root to sys.path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
+from utils.config import settings
 from utils.preprocessor import load_and_preprocess_alarm_file
+from automation.file_watcher import wait_for_complete_file
+from automation.vnoc_fetcher import fetch_tt_log
 
 # --- Config ---
 DOWNLOAD_DIR = os.path.abspath("data/raw")
 PROCESSED_OUTPUT = "data/processed/cleaned_alarms.csv"
 
-# --- Load credentials ---
-env_path = Path(__file__).resolve().parent.parent / ".env"
-load_dotenv(dotenv_path=env_path)
-
-if "VNOC_USERNAME" in st.secrets:
-    USERNAME = st.secrets["VNOC_USERNAME"]
-    PASSWORD = st.secrets["VNOC_PASSWORD"]
-else:
-    USERNAME = os.getenv("VNOC_USERNAME")
-    PASSWORD = os.getenv("VNOC_PASSWORD")
-
 # --- Logging ---
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
-if not USERNAME or not PASSWORD:
-    logging.error("❌ VNOC credentials missing. Please check .env or Streamlit secrets.toml")
-    sys.exit(1)
 
 # ---------------------------
 # Helpers
 # ---------------------------
+# Selenium and webdriver_manager are imported when a browser is actually started
 def setup_driver(download_dir):
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+    from selenium.webdriver.chrome.service import Service
+    from webdriver_manager.chrome import ChromeDriverManager
+
     chrome_options = Options()
     prefs = {
         "download.default_directory": download_dir,
@@ -55,8 +39,11 @@ def setup_driver(download_dir):
     return webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=chrome_options)
 
 
-def wait_for_element(driver, locator, timeout=20, condition=EC.presence_of_element_located):
-    return WebDriverWait(driver, timeout).until(condition(locator))
+def wait_for_element(driver, locator, timeout=20, condition=None):
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+
+    return WebDriverWait(driver, timeout).until((condition or EC.presence_of_element_located)(locator))
 
 
 def clear_download_folder(folder):
@@ -74,33 +61,28 @@ def clear_download_folder(folder):
 
 
 def wait_for_new_file(folder, timeout=120):
-    """Wait until a new Excel file appears in the folder."""
-    logging.info("⏳ Waiting for a new Excel file in raw folder...")
-    end_time = time.time() + timeout
-    seen = set(os.listdir(folder))  # track current files
-
-    while time.time() < end_time:
-        current_files = set(os.listdir(folder))
-        new_files = [f for f in current_files - seen if f.endswith(".xlsx")]
-        if new_files:
-            new_path = os.path.join(folder, new_files[0])
-            logging.info(f"✅ Detected new Excel file: {new_path}")
-            return new_path
-        time.sleep(3)
-
-    logging.error("❌ No new Excel file detected within timeout.")
-    return None
+    """Wait until a new, fully downloaded Excel file appears in the folder."""
+    return wait_for_complete_file(folder, timeout=timeout)
 
 
 def download_alarm_log():
     """Login and navigate to TT Log page. Manual click required for Excel download."""
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+
+    username, password = settings.vnoc_username, settings.vnoc_password
+    if not username or not password:
+        logging.error("❌ VNOC credentials missing. Please check .env or Streamlit secrets.toml")
+        return None
+
     driver = setup_driver(DOWNLOAD_DIR)
     try:
         logging.info("🔑 Opening login page...")
         driver.get("https://vnoc.atctower.in/vnoc/Default.aspx")
 
-        wait_for_element(driver, (By.NAME, 'appLogin$UserName')).send_keys(USERNAME)
-        driver.find_element(By.NAME, 'appLogin$Password').send_keys(PASSWORD)
+        wait_for_element(driver, (By.NAME, 'appLogin$UserName')).send_keys(username)
+        driver.find_element(By.NAME, 'appLogin$Password').send_keys(password)
         driver.find_element(By.NAME, 'appLogin$LoginImageButton').click()
 
         wait_for_element(driver, (By.ID, 'ctl00_Html1'))  # Post-login page
@@ -135,11 +117,16 @@ def get_latest_downloaded_file(folder):
 if __name__ == "__main__":
     logging.info("🚀 Starting alarm log collection pipeline...")
     clear_download_folder(DOWNLOAD_DIR)
-    driver = download_alarm_log()
-    if not driver:
-        sys.exit(1)
+    driver = None
+    try:
+        latest_file = fetch_tt_log(DOWNLOAD_DIR)  # plain HTTP, no browser
+    except Exception as e:
+        logging.warning(f"⚠️ HTTP export failed ({e}). Falling back to Selenium.")
+        driver = download_alarm_log()
+        if not driver:
+            sys.exit(1)
+        latest_file = wait_for_new_file(DOWNLOAD_DIR, timeout=180)
 
-    latest_file = wait_for_new_file(DOWNLOAD_DIR, timeout=180)
     if latest_file:
         logging.info(f"📂 Latest file: {latest_file}")
         df = load_and_preprocess_alarm_file(latest_file, PROCESSED_OUTPUT)
@@ -147,7 +134,8 @@ if __name__ == "__main__":
     else:
         logging.warning("❌ No Excel file downloaded.")
 
-    try:
-        input("🔍 Press Enter to close browser...")
-    finally:
-        driver.quit()
+    if driver:
+        try:
+            input("🔍 Press Enter to close browser...")
+        finally:
+            driver.quit()
@@ -0,0 +1,187 @@
+import os
+import sys
+import time
+import queue
+import logging
+import zipfile
+
+# Add project root to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+    WATCHDOG = True
+except ImportError:
+    WATCHDOG = False
+
+# --- Config ---
+POLL_INTERVAL = 0.5   # seconds between checks (and polling fallback interval)
+STABLE_FOR = 0.5      # seconds a file's size/mtime must stay unchanged before it is parsed
+TEMP_SUFFIXES = (".crdownload", ".part", ".partial", ".tmp", ".download")
+ZIP_MAGIC = b"PK\x03\x04"
+
+
+# ---------------------------
+# Completeness Checks
+# ---------------------------
+def is_alarm_export(name):
+    """An .xlsx that is not a browser/Office temp file."""
+    lower = name.lower()
+    return lower.endswith(".xlsx") and not lower.endswith(TEMP_SUFFIXES) and not name.startswith(("~$", ".~lock"))
+
+
+def is_valid_xlsx(path):
+    """Zip header present and central directory readable (i.e. the file is fully written)."""
+    try:
+        with open(path, "rb") as f:
+            if f.read(4) != ZIP_MAGIC:
+                return False
+        return zipfile.is_zipfile(path)
+    except OSError:
+        return False
+
+
+def prune_exports(folder, keep):
+    """Delete all but the newest `keep` alarm exports in folder. Returns the deleted paths."""
+    paths = [os.path.join(folder, f) for f in os.listdir(folder) if is_alarm_export(f)]
+    deleted = []
+    for path in sorted(paths, key=os.path.getmtime, reverse=True)[max(keep, 1):]:
+        try:
+            os.remove(path)
+            deleted.append(path)
+        except OSError as e:
+            logging.warning(f"⚠️ Could not delete old export {path}: {e}")
+    if deleted:
+        logging.info(f"🧹 Deleted {len(deleted)} old export(s) from {folder}")
+    return deleted
+
+
+def _file_state(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+# ---------------------------
+# Event Sources
+# ---------------------------
+if WATCHDOG:
+    class _EventQueueHandler(FileSystemEventHandler):
+        """Push names of created/modified/renamed-into files onto a queue."""
+
+        def __init__(self, events):
+            self.events = events
+
+        def on_created(self, event):
+            if not event.is_directory:
+                self.events.put(os.path.basename(event.src_path))
+
+        def on_modified(self, event):
+            self.on_created(event)
+
+        def on_moved(self, event):
+            # Chrome finishes a download by renaming *.crdownload → *.xlsx
+            if not event.is_directory:
+                self.events.put(os.path.basename(event.dest_path))
+
+
+def _start_observer(folder):
+    """Start an inotify (watchdog) observer on folder; (None, None) when unavailable."""
+    if not WATCHDOG:
+        return None, None
+    events = queue.Queue()
+    observer = Observer()
+    try:
+        observer.schedule(_EventQueueHandler(events), folder, recursive=False)
+        observer.start()
+    except Exception as e:
+        logging.warning(f"⚠️ File watcher unavailable ({e}). Falling back to polling.")
+        return None, None
+    return observer, events
+
+
+def wait_for_complete_file(folder, timeout=120, seen=None, stop_event=None, quiet=False):
+    """
+    Wait until a new, fully written Excel export appears in folder and return its path.
+    Uses filesystem events when watchdog is installed (polling otherwise); a file is
+    accepted only when it has no temp suffix, its size has been stable for STABLE_FOR
+    seconds and it is a readable zip (xlsx) archive. Returns None on timeout or when
+    stop_event (threading.Event) is set. quiet=True skips the waiting/timeout logs.
+    """
+    os.makedirs(folder, exist_ok=True)
+    seen = set(os.listdir(folder)) if seen is None else set(seen)
+    end_time = time.monotonic() + timeout
+    pending = {}  # name → (state, since)
+
+    observer, events = _start_observer(folder)
+    if not quiet:
+        logging.info(f"⏳ Waiting for a new Excel file in {folder} ({'events' if observer else 'polling'})...")
+    # Files that landed before the observer started never produce an event
+    for name in set(os.listdir(folder)) - seen:
+        if is_alarm_export(name):
+            pending[name] = (None, 0.0)
+    try:
+        while time.monotonic() < end_time:
+            if stop_event is not None and stop_event.is_set():
+                return None
+            if events is not None:
+                names = set()
+                try:
+                    names.add(events.get(timeout=POLL_INTERVAL))
+                    while True:
+                        names.add(events.get_nowait())
+                except queue.Empty:
+                    pass
+            else:
+                time.sleep(POLL_INTERVAL)
+                names = set(os.listdir(folder)) - seen
+
+            for name in names:
+                if name not in seen and is_alarm_export(name):
+                    pending.setdefault(name, (None, 0.0))
+
+            now = time.monotonic()
+            for name, (last_state, since) in list(pending.items()):
+                path = os.path.join(folder, name)
+                state = _file_state(path)
+                if state is None:
+                    pending.pop(name)  # renamed away / deleted
+                elif state != last_state:
+                    pending[name] = (state, now)
+                elif now - since >= STABLE_FOR and state[0] > 0 and is_valid_xlsx(path):
+                    logging.info(f"✅ Detected new Excel file: {path}")
+                    return path
+    finally:
+        if observer:
+            observer.stop()
+            observer.join()
+
+    if not quiet:
+        logging.error("❌ No new Excel file detected within timeout.")
+    return None
+
+
+def watch_and_preprocess(folder, output_path, stop_event=None, streaming=False):
+    """
+    Keep watching folder and preprocess every new complete export as soon as it lands.
+    Runs until stop_event (threading.Event) is set.
+    """
+    from utils.preprocessor import load_and_preprocess_alarm_file
+
+    seen = set(os.listdir(folder)) if os.path.exists(folder) else set()
+    while not (stop_event and stop_event.is_set()):
+        path = wait_for_complete_file(folder, timeout=float("inf"), seen=seen, stop_event=stop_event)
+        if path:
+            seen.add(os.path.basename(path))
+            try:
+                load_and_preprocess_alarm_file(path, output_path, streaming=streaming, keep_frame=False)
+            except Exception as e:
+                logging.error(f"❌ Preprocessing failed for {path}: {e}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    watch_and_preprocess(os.path.abspath("data/raw"), "data/processed/cleaned_alarms.csv")
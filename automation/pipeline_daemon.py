@@ -0,0 +1,477 @@
+"""
+Headless alarm pipeline: download → preprocess → store → escalate on a fixed interval.
+
+    python -m automation.pipeline_daemon                 # run until SIGINT/SIGTERM
+    python -m automation.pipeline_daemon --once          # one cycle on the newest export in data/raw
+    python -m automation.pipeline_daemon --fetch         # also download the TT log over HTTP each cycle
+
+Ingestion (new export → preprocess → MongoDB upsert → rollups) and escalation run in separate
+threads, so batch N is escalated while batch N+1 is being parsed. A lock file keeps a
+second daemon (or a --once run) from starting overlapping cycles, and a stop request
+lets the running stage finish before exiting. With delta ingestion (default) an export
+identical to the last one is skipped and only new, changed and cleared alarms are stored
+(see utils.delta_ingest); --full processes every export in full. --outbox-workers N queues
+escalation messages in the outbox (telegram_bot.outbox) and runs N delivery processes
+alongside, so a slow Telegram send never holds up the next cycle. Per-stage timings go to
+data/state/pipeline_metrics.json; --metrics-port also serves them (and the finer stage
+timings of utils.instrumentation) in Prometheus format.
+"""
+import os
+import sys
+import json
+import time
+import signal
+import logging
+import argparse
+import threading
+from contextlib import contextmanager
+
+# Add project root to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from utils.config import (
+    PIPELINE_INTERVAL, RAW_ALARM_DIR, CLEANED_ALARM_FILE, PIPELINE_LOCK_FILE, PIPELINE_METRICS_FILE, DELTA_INGEST,
+    RAW_EXPORTS_KEPT, ALARM_COLLECTION,
+)
+from utils.preprocessor import load_and_preprocess_alarm_file
+from utils.alarm_store import processed_alarms_exist
+from utils.delta_ingest import IngestIndex, preprocess_delta
+from automation.file_watcher import wait_for_complete_file, is_alarm_export, is_valid_xlsx, prune_exports
+from automation.vnoc_fetcher import fetch_tt_log
+from telegram_bot.escalate_alarms import escalate_alarms
+from telegram_bot.outbox import start_workers, stop_workers
+from utils.rollups import update_rollups
+from utils.instrumentation import span, start_metrics_server, trace
+
+COLLECTION_NAME = ALARM_COLLECTION
+STAGES = ("download", "preprocess", "store", "rollup", "escalate", "deliver")
+
+
+# ---------------------------
+# Single-instance Lock
+# ---------------------------
+class PipelineLock:
+    """Exclusive non-blocking lock file; the OS releases it if the process dies."""
+
+    def __init__(self, path=PIPELINE_LOCK_FILE):
+        self.path = path
+        self._file = None
+
+    def acquire(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        f = open(self.path, "a+")
+        try:
+            if os.name == "nt":
+                import msvcrt
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            raise RuntimeError(f"❌ Another pipeline run holds the lock ({self.path})")
+        f.seek(0)
+        f.truncate()
+        f.write(str(os.getpid()))
+        f.flush()
+        self._file = f
+        return self
+
+    def release(self):
+        if self._file is None:
+            return
+        try:
+            if os.name == "nt":
+                import msvcrt
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        finally:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+# ---------------------------
+# Stage Metrics
+# ---------------------------
+class StageMetrics:
+    """Run counts, failures and timings per stage (thread-safe), saved as JSON after every stage."""
+
+    def __init__(self, path=PIPELINE_METRICS_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        self.counters = {
+            "cycles": 0, "batches": 0, "rows": 0, "overruns": 0, "superseded": 0,
+            "unchanged_exports": 0, "changed_rows": 0,
+        }
+        self.stages = {
+            name: {"runs": 0, "failures": 0, "last_seconds": None, "total_seconds": 0.0,
+                   "max_seconds": 0.0, "last_error": None}
+            for name in STAGES
+        }
+
+    @contextmanager
+    def timed(self, stage):
+        start = time.perf_counter()
+        error = None
+        try:
+            with span(f"pipeline.{stage}"):
+                yield
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                stats = self.stages[stage]
+                stats["runs"] += 1
+                stats["last_seconds"] = round(elapsed, 3)
+                stats["total_seconds"] = round(stats["total_seconds"] + elapsed, 3)
+                stats["max_seconds"] = round(max(stats["max_seconds"], elapsed), 3)
+                if error is not None:
+                    stats["failures"] += 1
+                    stats["last_error"] = str(error)
+            logging.info(f"⏱️ {stage} took {elapsed:.2f}s" + (" (failed)" if error is not None else ""))
+            self.save()
+
+    def incr(self, counter, n=1):
+        with self._lock:
+            self.counters[counter] += n
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "started_at": self.started_at,
+                "updated_at": time.time(),
+                **self.counters,
+                "stages": {name: dict(stats) for name, stats in self.stages.items()},
+            }
+
+    def save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.snapshot(), f, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+# ---------------------------
+# Pipeline
+# ---------------------------
+def latest_complete_export(folder):
+    """Newest fully written alarm export in folder, or None."""
+    if not os.path.isdir(folder):
+        return None
+    paths = [os.path.join(folder, f) for f in os.listdir(folder) if is_alarm_export(f)]
+    paths = [p for p in paths if is_valid_xlsx(p)]
+    return max(paths, key=os.path.getmtime) if paths else None
+
+
+class PipelineDaemon:
+    """
+    Runs the alarm pipeline every `interval` seconds. `fetch(raw_dir)` is the download
+    stage (e.g. vnoc_fetcher.fetch_tt_log); without it exports are expected to be
+    dropped into raw_dir by the VNOC download or by hand. Escalation also re-runs every
+    interval on the latest batch so alarms that age into a higher escalation level are
+    picked up without a new export. With delta=True only the alarms that changed since the
+    last ingested export are stored, and escalation is only handed batches with changes.
+    With outbox_workers > 0 escalation only enqueues and that many outbox workers deliver.
+    """
+
+    def __init__(self, raw_dir=RAW_ALARM_DIR, output_path=CLEANED_ALARM_FILE, interval=PIPELINE_INTERVAL,
+                 fetch=None, store=True, streaming=False, lock_path=PIPELINE_LOCK_FILE, metrics=None,
+                 delta=DELTA_INGEST, outbox_workers=0):
+        self.raw_dir = os.path.abspath(raw_dir)
+        self.output_path = output_path
+        self.interval = interval
+        self.fetch = fetch
+        self.store = store
+        self.streaming = streaming
+        self.lock_path = lock_path
+        self.metrics = metrics or StageMetrics()
+        self.index = IngestIndex() if delta else None
+        self.outbox_workers = outbox_workers
+        self.stop_event = threading.Event()
+        self._batch_ready = threading.Condition()
+        self._pending = None  # newest cleaned batch waiting for escalation
+        self._latest = None   # last batch handed to escalation
+        self._startup_done = False  # start-up ingest finished (escalation may read the file on disk)
+        self._ingest_done = False
+
+    def stop(self):
+        if not self.stop_event.is_set():
+            logging.info("🛑 Stop requested; finishing the running stage...")
+        self.stop_event.set()
+        with self._batch_ready:
+            self._batch_ready.notify_all()
+
+    # --- Stages ---
+    def download(self):
+        if self.fetch is None:
+            return None
+        with self.metrics.timed("download"):
+            return self.fetch(self.raw_dir)
+
+    def preprocess(self, path):
+        """(cleaned batch, delta) — delta is None without delta ingestion; None for an unchanged export."""
+        with self.metrics.timed("preprocess"):
+            if self.index is None:
+                df, delta = load_and_preprocess_alarm_file(path, self.output_path, streaming=self.streaming), None
+            else:
+                batch = preprocess_delta(path, self.output_path, self.index, streaming=self.streaming)
+                if batch is None:
+                    self.metrics.incr("unchanged_exports")
+                    return None
+                df, delta = batch
+        self.metrics.incr("batches")
+        self.metrics.incr("rows", len(df))
+        if delta is not None:
+            self.metrics.incr("changed_rows", sum(delta.summary().values()))
+        logging.info(f"✅ Preprocessed {os.path.basename(path)}: {len(df)} active alarms")
+        return df, delta
+
+    def store_batch(self, df, delta=None):
+        """Upsert the batch, or with a delta only its new/changed alarms (and close cleared ones)."""
+        if not self.store:
+            return None
+        if delta is not None and delta.empty:
+            logging.info("✅ MongoDB already up to date (no alarm changed since the last export)")
+            return None
+        # Imported here so the Mongo client is only created when storing is enabled
+        from mongodb.mongo_crud import close_cleared_alarms, upsert_bulk_alarms
+        from utils.mongo_utils import iter_documents
+
+        with self.metrics.timed("store"):
+            counts = upsert_bulk_alarms(iter_documents(df if delta is None else delta.upserts), COLLECTION_NAME)
+            if delta is not None:
+                counts["closed"] = close_cleared_alarms(delta.cleared, COLLECTION_NAME)
+        logging.info(
+            f"✅ MongoDB updated → inserted: {counts['inserted']}, "
+            f"updated: {counts['updated']}, unchanged: {counts['unchanged']}"
+            + (f", closed: {counts['closed']}" if "closed" in counts else "")
+        )
+        return counts
+
+    def rollup_batch(self, df):
+        with self.metrics.timed("rollup"):
+            return update_rollups(df)
+
+    def escalate_batch(self, df=None):
+        """Escalate df (None → the processed alarm file on disk)."""
+        with self.metrics.timed("escalate"):
+            if self.outbox_workers:
+                return escalate_alarms(alarm_df=df, outbox=True)
+            return escalate_alarms(alarm_df=df)
+
+    def ingest_and_prune(self, path, seen):
+        """ingest(path), then drop old exports from raw_dir (and from `seen`)."""
+        self._guard("preprocess", self.ingest, path)
+        self._guard("prune", prune_exports, self.raw_dir, RAW_EXPORTS_KEPT)
+        seen.intersection_update(os.listdir(self.raw_dir))
+
+    def ingest(self, path):
+        """Preprocess and store one export, then hand it to the escalation thread."""
+        with trace("ingest"):
+            batch = self.preprocess(path)
+            if batch is None:
+                return None  # same file as last time: nothing to store or escalate early
+            df, delta = batch
+            self._store(df, delta)
+            self._guard("rollup", self.rollup_batch, df)
+        if delta is None or not delta.empty:
+            self._hand_off(df)
+        return df
+
+    def _store(self, df, delta):
+        """Store a batch; its delta only becomes the new baseline once it is stored."""
+        try:
+            self.store_batch(df, delta)
+        except Exception as e:
+            # Escalation works from the batch itself, so a MongoDB outage does not hold it back
+            logging.error(f"❌ Storing batch in MongoDB failed: {e}")
+            return
+        if delta is not None:
+            self._guard("delta index", self.index.save, delta)
+
+    # --- Threads ---
+    def _hand_off(self, df):
+        with self._batch_ready:
+            if self._pending is not None:
+                # Exports are full snapshots, so only the newest unescalated batch matters
+                self.metrics.incr("superseded")
+                logging.info("⏩ Escalation still busy; replacing the queued batch with a newer one")
+            self._pending = df
+            self._batch_ready.notify()
+
+    def _guard(self, stage, func, *args):
+        try:
+            return func(*args)
+        except Exception as e:
+            logging.error(f"❌ {stage} failed: {e}")
+            return None
+
+    def _ingest_loop(self):
+        seen = set(os.listdir(self.raw_dir))
+        # An export dropped while the daemon was down is picked up too (exports are full
+        # snapshots, so the newest one is enough; an already ingested one is skipped by its hash)
+        latest = latest_complete_export(self.raw_dir)
+        try:
+            if latest:
+                self.ingest_and_prune(latest, seen)
+        finally:
+            with self._batch_ready:
+                self._startup_done = True
+                self._batch_ready.notify_all()
+        while not self.stop_event.is_set():
+            cycle_end = time.monotonic() + self.interval
+            self.metrics.incr("cycles")
+            self._guard("download", self.download)
+
+            # Process every export that lands before the next cycle is due
+            while not self.stop_event.is_set():
+                remaining = cycle_end - time.monotonic()
+                if remaining <= 0:
+                    break
+                path = wait_for_complete_file(
+                    self.raw_dir, timeout=remaining, seen=seen, stop_event=self.stop_event, quiet=True
+                )
+                if path is None:
+                    break
+                seen.add(os.path.basename(path))
+                self.ingest_and_prune(path, seen)
+
+            overrun = time.monotonic() - cycle_end
+            if overrun > 1 and not self.stop_event.is_set():
+                self.metrics.incr("overruns")
+                logging.warning(f"⚠️ Cycle overran the {self.interval:g}s interval by {overrun:.1f}s; starting the next one now")
+
+    def _escalate_loop(self):
+        next_run = time.monotonic()  # escalate right away once the start-up ingest is done
+        while True:
+            with self._batch_ready:
+                while self._pending is None and not self._ingest_done:
+                    if not self._startup_done:
+                        # The start-up ingest may be rewriting the processed file: wait for its batch
+                        self._batch_ready.wait()
+                        continue
+                    # While stopping, only wait for the batch ingestion may still hand over
+                    timeout = None if self.stop_event.is_set() else next_run - time.monotonic()
+                    if timeout is not None and timeout <= 0:
+                        break
+                    self._batch_ready.wait(timeout)
+                df, self._pending = self._pending, None
+
+            if df is None and self._ingest_done:
+                return  # every handed-over batch is escalated before shutting down
+            if df is not None:
+                self._latest = df
+            if self._latest is not None or processed_alarms_exist(self.output_path):
+                self._guard("escalate", self.escalate_batch, self._latest)
+            next_run = time.monotonic() + self.interval
+
+    def run(self):
+        """Run until stop() (or SIGINT/SIGTERM via install_signal_handlers)."""
+        with PipelineLock(self.lock_path):
+            os.makedirs(self.raw_dir, exist_ok=True)
+            logging.info(f"🚀 Pipeline daemon started: every {self.interval:g}s, watching {self.raw_dir}")
+            escalator = threading.Thread(target=self._escalate_loop, name="pipeline-escalate", daemon=True)
+            escalator.start()
+            outbox = start_workers(self.outbox_workers) if self.outbox_workers else None
+            try:
+                self._ingest_loop()
+            finally:
+                self.stop()
+                with self._batch_ready:
+                    self._ingest_done = True
+                    self._batch_ready.notify_all()
+                escalator.join()
+                if outbox:
+                    stop_workers(*outbox)
+                self.metrics.save()
+                logging.info("👋 Pipeline daemon stopped.")
+        return self.metrics.snapshot()
+
+    def run_once(self, path=None):
+        """One sequential cycle on path (default: newest complete export in raw_dir)."""
+        with PipelineLock(self.lock_path):
+            self.metrics.incr("cycles")
+            self._guard("download", self.download)
+            path = path or latest_complete_export(self.raw_dir)
+            if not path:
+                logging.warning(f"⚠️ No complete Excel export found in {self.raw_dir}")
+                return self.metrics.snapshot()
+            with trace("cycle"):
+                batch = self.preprocess(path)
+                df = None  # unchanged export: escalate the processed file, alarms may have aged
+                if batch is not None:
+                    df, delta = batch
+                    self._store(df, delta)
+                    self._guard("rollup", self.rollup_batch, df)
+                self._guard("escalate", self.escalate_batch, df)
+            self._guard("prune", prune_exports, self.raw_dir, RAW_EXPORTS_KEPT)
+            if self.outbox_workers:
+                with self.metrics.timed("deliver"):
+                    processes, _stop = start_workers(self.outbox_workers, exit_when_empty=True)
+                    for process in processes:
+                        process.join()
+            self.metrics.save()
+        return self.metrics.snapshot()
+
+
+def install_signal_handlers(daemon):
+    """First SIGINT/SIGTERM stops gracefully, a second one exits immediately."""
+    def handle(signum, frame):
+        if daemon.stop_event.is_set():
+            logging.warning("⚠️ Second stop signal; exiting immediately.")
+            os._exit(1)
+        daemon.stop()
+
+    signal.signal(signal.SIGINT, handle)
+    signal.signal(signal.SIGTERM, handle)
+
+
+# ---------------------------
+# Runner
+# ---------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--interval", type=float, default=PIPELINE_INTERVAL, help="seconds between cycles")
+    parser.add_argument("--raw-dir", default=RAW_ALARM_DIR)
+    parser.add_argument("--once", action="store_true", help="run a single cycle and exit")
+    parser.add_argument("--file", help="export to process with --once (default: newest in --raw-dir)")
+    parser.add_argument("--fetch", action="store_true", help="download the TT log from VNOC every cycle")
+    parser.add_argument("--no-store", action="store_true", help="skip the MongoDB upsert stage")
+    parser.add_argument("--streaming", action="store_true", help="stream-parse large workbooks")
+    parser.add_argument("--full", action="store_true", help="store every export in full (no delta ingestion)")
+    parser.add_argument("--outbox-workers", type=int, default=0,
+                        help="queue escalations in the outbox and deliver them with this many worker processes")
+    parser.add_argument("--metrics-port", type=int, default=None, help="serve Prometheus metrics on this port")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    if args.metrics_port is not None:
+        start_metrics_server(args.metrics_port)
+    daemon = PipelineDaemon(raw_dir=args.raw_dir, interval=args.interval, fetch=fetch_tt_log if args.fetch else None,
+                            store=not args.no_store, streaming=args.streaming, delta=DELTA_INGEST and not args.full,
+                            outbox_workers=args.outbox_workers)
+    try:
+        if args.once:
+            daemon.run_once(args.file)
+        else:
+            install_signal_handlers(daemon)
+            daemon.run()
+    except RuntimeError as e:
+        logging.error(str(e))
+        sys.exit(1)
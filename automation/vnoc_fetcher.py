@@ -0,0 +1,208 @@
+"""
+Lightweight VNOC TT log export over plain HTTP (no browser).
+
+Replays what the browser does: GET Default.aspx, post the login form back with its
+ASP.NET hidden fields (__VIEWSTATE, __EVENTVALIDATION, ...), then GET
+TroubleTicketLogDetail.aspx and post the "Download Excel" postback. The export is
+streamed to data/raw (or into memory). automation.download_and_preprocess keeps the
+Selenium flow as a fallback.
+"""
+import io
+import os
+import re
+import sys
+import time
+import logging
+from html.parser import HTMLParser
+from urllib.parse import urljoin
+
+# Add project root to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from utils.config import settings, VNOC_BASE_URL, VNOC_EXPORT_TARGET, RAW_ALARM_DIR
+
+LOGIN_PAGE = "Default.aspx"
+TT_LOG_PAGE = "aspx/TroubleTicketLogDetail.aspx"
+LOGIN_FIELDS = ("appLogin$UserName", "appLogin$Password", "appLogin$LoginImageButton")
+REQUEST_TIMEOUT = 60
+CHUNK_SIZE = 1 << 16
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36"
+
+_POSTBACK_RE = re.compile(r"__doPostBack\(\s*['\"]([^'\"]+)['\"]\s*,\s*['\"]([^'\"]*)['\"]")
+
+
+# ---------------------------
+# ASP.NET Form Parsing
+# ---------------------------
+class _FormParser(HTMLParser):
+    """Collect the first form's action, its <input> fields and postback links mentioning Excel."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.action = None
+        self.fields = {}
+        self.buttons = []   # (name, type, label) of submit/image inputs
+        self.postbacks = []  # (target, argument, link text)
+        self._link = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = {k: (v or "") for k, v in attrs}
+        if tag == "form" and self.action is None:
+            self.action = attrs.get("action", "")
+        elif tag == "input" and attrs.get("name"):
+            kind = attrs.get("type", "text").lower()
+            if kind in ("submit", "image", "button"):
+                label = " ".join(attrs.get(k, "") for k in ("value", "alt", "title", "id", "src"))
+                self.buttons.append((attrs["name"], kind, label))
+            elif kind not in ("checkbox", "radio") or "checked" in attrs:
+                self.fields[attrs["name"]] = attrs.get("value", "")
+        elif tag == "a":
+            match = _POSTBACK_RE.search(attrs.get("href", ""))
+            if match:
+                self._link = [match.group(1), match.group(2), " ".join((attrs.get("title", ""), attrs.get("id", "")))]
+
+    def handle_data(self, data):
+        if self._link is not None:
+            self._link[2] += " " + data
+
+    def handle_endtag(self, tag):
+        if tag == "a" and self._link is not None:
+            self.postbacks.append(tuple(self._link))
+            self._link = None
+
+
+def parse_form(html):
+    parser = _FormParser()
+    parser.feed(html)
+    return parser
+
+
+def find_export_control(form):
+    """
+    Pick the export postback: VNOC_EXPORT_TARGET if set, else the first button or
+    __doPostBack link whose label mentions Excel. Returns the extra form fields to post.
+    """
+    if VNOC_EXPORT_TARGET:
+        for name, kind, _ in form.buttons:
+            if name == VNOC_EXPORT_TARGET:
+                return _button_fields(name, kind)
+        return {"__EVENTTARGET": VNOC_EXPORT_TARGET, "__EVENTARGUMENT": ""}
+
+    for name, kind, label in form.buttons:
+        if "excel" in label.lower():
+            return _button_fields(name, kind)
+    for target, argument, text in form.postbacks:
+        if "excel" in text.lower() or "excel" in target.lower():
+            return {"__EVENTTARGET": target, "__EVENTARGUMENT": argument}
+    raise RuntimeError("❌ Could not find the Excel export control on the TT log page (set VNOC_EXPORT_TARGET)")
+
+
+def _button_fields(name, kind):
+    # Image buttons post their click coordinates instead of a value
+    if kind == "image":
+        return {f"{name}.x": "10", f"{name}.y": "10"}
+    return {name: ""}
+
+
+# ---------------------------
+# HTTP Flow
+# ---------------------------
+def _page_url(base_url, page):
+    return urljoin(base_url.rstrip("/") + "/", page)
+
+
+def _get_form(session, url):
+    response = session.get(url, timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+    form = parse_form(response.text)
+    if "__VIEWSTATE" not in form.fields:
+        raise RuntimeError(f"❌ No ASP.NET form state found at {url}")
+    return urljoin(response.url, form.action or response.url), form
+
+
+def login(session, username=None, password=None, base_url=VNOC_BASE_URL):
+    """Post the Default.aspx login form; raises RuntimeError if VNOC shows the login form again."""
+    username = username or settings.vnoc_username
+    password = password or settings.vnoc_password
+    if not username or not password:
+        raise RuntimeError("❌ VNOC credentials missing. Please check .env or Streamlit secrets.toml")
+
+    action, form = _get_form(session, _page_url(base_url, LOGIN_PAGE))
+    user_field, password_field, button = LOGIN_FIELDS
+    data = {**form.fields, user_field: username, password_field: password,
+            f"{button}.x": "10", f"{button}.y": "10"}
+    response = session.post(action, data=data, timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+    if password_field in parse_form(response.text).fields:
+        raise RuntimeError("❌ VNOC login failed (check VNOC_USERNAME / VNOC_PASSWORD)")
+    logging.info("🔑 Logged in to VNOC over HTTP")
+
+
+def _export_filename(response):
+    """Server filename with a timestamp added, so every download is a new file in data/raw."""
+    disposition = response.headers.get("Content-Disposition", "")
+    match = re.search(r"filename\*?=(?:UTF-8'')?\"?([^\";]+)\"?", disposition, re.IGNORECASE)
+    stem, ext = os.path.splitext(os.path.basename(match.group(1).strip())) if match else ("TroubleTicketLog", "")
+    return f"{stem}_{time.strftime('%Y%m%d_%H%M%S')}{ext or '.xlsx'}"
+
+
+def _is_attachment(response):
+    content_type = response.headers.get("Content-Type", "").lower()
+    return "attachment" in response.headers.get("Content-Disposition", "").lower() or not content_type.startswith("text/html")
+
+
+def fetch_tt_log(dest_dir=RAW_ALARM_DIR, to_memory=False, session=None, base_url=VNOC_BASE_URL,
+                 username=None, password=None, extra_fields=None):
+    """
+    Log in and download the TT log export without a browser.
+    Streams the file to dest_dir (written as *.part, renamed when complete) and returns
+    its path, or returns an io.BytesIO with to_memory=True. extra_fields are posted with
+    the export postback (e.g. date filters of the TT log page).
+    """
+    own_session = session is None
+    if own_session:
+        import requests
+        session = requests.Session()
+        session.headers["User-Agent"] = USER_AGENT
+    try:
+        login(session, username, password, base_url)
+
+        action, form = _get_form(session, _page_url(base_url, TT_LOG_PAGE))
+        data = {**form.fields, "__EVENTTARGET": "", "__EVENTARGUMENT": "", **find_export_control(form), **(extra_fields or {})}
+        logging.info("📥 Requesting TT log export...")
+
+        with session.post(action, data=data, timeout=REQUEST_TIMEOUT, stream=True) as response:
+            response.raise_for_status()
+            if not _is_attachment(response):
+                raise RuntimeError("❌ VNOC returned a page instead of the Excel export (session expired or form changed)")
+
+            if to_memory:
+                buffer = io.BytesIO()
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    buffer.write(chunk)
+                buffer.seek(0)
+                logging.info(f"✅ Downloaded TT log into memory ({buffer.getbuffer().nbytes / 1024:.0f} KB)")
+                return buffer
+
+            os.makedirs(dest_dir, exist_ok=True)
+            path = os.path.join(dest_dir, _export_filename(response))
+            part_path = f"{path}.part"  # ignored by the raw-folder watcher until renamed
+            try:
+                with open(part_path, "wb") as f:
+                    for chunk in response.iter_content(CHUNK_SIZE):
+                        f.write(chunk)
+                os.replace(part_path, path)
+            except Exception:
+                if os.path.exists(part_path):
+                    os.remove(part_path)
+                raise
+            logging.info(f"✅ Downloaded TT log: {path} ({os.path.getsize(path) / 1024:.0f} KB)")
+            return path
+    finally:
+        if own_session:
+            session.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    fetch_tt_log(os.path.abspath(RAW_ALARM_DIR))
@@ -0,0 +1,70 @@
+"""
+Round-trip benchmark: cleaned alarms as CSV vs Parquet (utils.alarm_store).
+
+    python -m benchmarks.bench_alarm_store --rows 100000
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from utils.alarm_store import write_processed_alarms, read_processed_alarms
+
+
+def synthetic_cleaned_alarms(rows, seed=0):
+    """Frame shaped like the preprocessor output."""
+    rng = np.random.default_rng(seed)
+    events = np.array(["2G OUTAGE", "3G OUTAGE", "4G OUTAGE", "SITE ON BATTERY", "MAINS FAIL/EB FAIL", "DG ON LOAD"])
+    df = pd.DataFrame({
+        "OpenTime": pd.Timestamp("2025-03-10") + pd.to_timedelta(rng.integers(0, 30 * 86400, rows), unit="s"),
+        "TTNumber": [f"TT{699000000 + i}" for i in range(rows)],
+        "Cluster": rng.choice(["PUNE-1", "PUNE-2", "PUNE-3", "NASHIK", "SATARA"], rows),
+        "SiteID": rng.integers(400000, 600000, rows),
+        "SiteName": [f"Site {i % 2000}" for i in range(rows)],
+        "SourceInput": rng.choice(["Airtel", "Jio", "VIL"], rows),
+        "EventName": rng.choice(events, rows),
+        "ClusterEngineer": "CE Name",
+        "Technician": "Technician Name",
+        "EsclationStatus": "OPEN",
+    })
+    df["Is_SiteDown"] = df["EventName"].isin(events[:3])
+    return df
+
+
+def bench(df, fmt, workdir, repeat):
+    target = os.path.join(workdir, "cleaned_alarms.csv")
+    write_s, read_s = [], []
+    for _ in range(repeat):
+        for ext in (".csv", ".parquet"):
+            if os.path.exists(target[:-4] + ext):
+                os.remove(target[:-4] + ext)
+        t = time.perf_counter()
+        path = write_processed_alarms(df, target, fmt=fmt)
+        write_s.append(time.perf_counter() - t)
+        t = time.perf_counter()
+        read_processed_alarms(target)
+        read_s.append(time.perf_counter() - t)
+    return {
+        "format": fmt,
+        "write_ms": round(min(write_s) * 1000, 1),
+        "read_ms": round(min(read_s) * 1000, 1),
+        "size_kb": round(os.path.getsize(path) / 1024, 1),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    df = synthetic_cleaned_alarms(args.rows)
+    with tempfile.TemporaryDirectory() as workdir:
+        results = [bench(df, fmt, workdir, args.repeat) for fmt in ("csv", "parquet")]
+    print(pd.DataFrame(results).to_string(index=False))
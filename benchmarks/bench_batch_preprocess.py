@@ -0,0 +1,48 @@
+"""
+Throughput of batch preprocessing (utils.batch_preprocess) by worker count.
+
+    python -m benchmarks.bench_batch_preprocess "data/archive/*.xlsx" --workers 1,2,4
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from utils.batch_preprocess import batch_preprocess, expand_inputs
+
+
+def bench(sources, workers, repeat):
+    best = None
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as out_dir:
+            t = time.perf_counter()
+            summary = batch_preprocess(sources, out_dir, workers=workers)
+            elapsed = time.perf_counter() - t
+        if best is None or elapsed < best[0]:
+            best = (elapsed, summary)
+    elapsed, summary = best
+    return {
+        "workers": workers,
+        "files": summary["files"],
+        "rows": summary["raw_rows"],
+        "parse_s": summary["parse_seconds"],
+        "total_s": round(elapsed, 2),
+        "rows_per_s": round(summary["raw_rows"] / elapsed),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("sources", nargs="+", help="directories and/or glob patterns of .xlsx exports")
+    parser.add_argument("--workers", default="1,2,4", help="comma-separated worker counts")
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"{len(expand_inputs(args.sources))} files, {os.cpu_count()} cores")
+    results = [bench(args.sources, int(w), args.repeat) for w in args.workers.split(",")]
+    print(pd.DataFrame(results).to_string(index=False))
@@ -0,0 +1,72 @@
+"""
+Import cost of every entry point, measured with `python -X importtime` in fresh interpreters.
+
+    python -m benchmarks.bench_import_time --repeat 5
+
+Run from the directory the app normally runs in (its .env / .streamlit/secrets.toml apply).
+"""
+import os
+import sys
+import argparse
+import statistics
+import subprocess
+
+import pandas as pd
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+ENTRY_POINTS = [
+    "utils.config",
+    "utils.preprocessor",
+    "mongodb.mongo_crud",
+    "telegram_bot.escalate_alarms",
+    "automation.download_and_preprocess",
+    "automation.pipeline_daemon",
+    "frontend.app",
+]
+
+# Packages worth knowing about when they are pulled in at import time
+HEAVY_PACKAGES = ["streamlit", "selenium", "webdriver_manager", "pymongo", "aiohttp", "requests", "pyarrow"]
+
+
+def import_profile(module):
+    """(cumulative µs of the module's import, top-level packages loaded) in a fresh interpreter."""
+    code = f"import sys, {module}; print(' '.join(sorted({{m.split('.')[0] for m in sys.modules}})))"
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [REPO_ROOT, os.getenv("PYTHONPATH")]))}
+    run = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True, env=env)
+    if run.returncode != 0:
+        reason = (run.stderr.strip().splitlines() or ["failed"])[-1]
+        return None, reason[:80]
+
+    cumulative = None
+    for line in run.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cum, name = [part.strip() for part in line[len("import time:"):].split("|")]
+        if name == module:
+            cumulative = int(cum)
+    return cumulative, set(run.stdout.split())
+
+
+def bench(module, repeat):
+    timings, loaded = [], set()
+    for _ in range(repeat):
+        cumulative, loaded = import_profile(module)
+        if cumulative is None:
+            return {"entry_point": module, "import_ms": None, "heavy_imports": f"❌ {loaded}"}
+        timings.append(cumulative)
+    return {
+        "entry_point": module,
+        "import_ms": round(statistics.median(timings) / 1000, 1),
+        "heavy_imports": ", ".join(p for p in HEAVY_PACKAGES if p in loaded) or "-",
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("modules", nargs="*", default=ENTRY_POINTS)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    results = [bench(module, args.repeat) for module in args.modules]
+    print(pd.DataFrame(results).to_string(index=False))
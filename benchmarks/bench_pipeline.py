@@ -0,0 +1,286 @@
+"""
+Stage benchmark suite: preprocess → merge → message building → documents → Mongo upsert.
+
+    python -m benchmarks.bench_pipeline --rows 50000 --repeat 5
+    python -m benchmarks.bench_pipeline --rows 50000 --compare benchmarks/results/<earlier run>.json
+
+Runs on a deterministic synthetic TT export and site mapping (benchmarks.synthetic_tt) in an
+isolated work directory, upserts into mongomock (benchmarks/requirements.txt), never sends to Telegram, and saves the
+timings as JSON under benchmarks/results/ so runs from different commits can be compared.
+"""
+import os
+import gc
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import statistics
+import subprocess
+from datetime import datetime
+from importlib.metadata import version, PackageNotFoundError
+
+import numpy as np
+import pandas as pd
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(REPO_ROOT)
+
+from benchmarks.synthetic_tt import synthetic_mapping, write_synthetic_dataset
+
+RESULTS_DIR = os.path.join(REPO_ROOT, "benchmarks", "results")
+EXPORT_FILE = "data/raw/tt_synthetic_{rows}_{sites}_{outage_ratio}_{cleared_ratio}_{seed}.xlsx"
+MAPPING_FILE = "data/mapping/site_escalation_mapping.xlsx"  # where utils.config looks for it
+PROCESSED_FILE = "data/processed/cleaned_alarms.csv"
+
+# Local secrets for the work directory: nothing real is configured, nothing is sent
+BENCH_SECRETS = 'BOT_TOKEN = "benchmark"\nTEST_MODE = "True"\nMONGO_URI = "mongodb://localhost:27017"\nMONGO_DB = "BENCHMARK"\n'
+
+# Escalation "now": the end of the synthetic alarm window, so rule ages never drift
+BENCH_NOW = pd.Timestamp("2025-04-09")
+MONGO_STAGE = "mongo_upsert (mongomock)"  # skipped when mongomock is missing or does not work with the installed pymongo
+
+
+# ---------------------------
+# Setup
+# ---------------------------
+def prepare_workdir(workdir, params):
+    """Write the export, mapping and secrets (kept if already there) and chdir into workdir."""
+    os.makedirs(os.path.join(workdir, ".streamlit"), exist_ok=True)
+    with open(os.path.join(workdir, ".streamlit", "secrets.toml"), "w") as f:
+        f.write(BENCH_SECRETS)
+
+    export_path = os.path.join(workdir, EXPORT_FILE.format(**params))
+    mapping_path = os.path.join(workdir, MAPPING_FILE)
+    if not os.path.exists(export_path):
+        t = time.perf_counter()
+        write_synthetic_dataset(export_path, mapping_path, **params)
+        print(f"🧪 Generated {params['rows']} synthetic alarms in {time.perf_counter() - t:.1f}s")
+    elif not os.path.exists(mapping_path):
+        synthetic_mapping(params["sites"], params["seed"]).to_excel(mapping_path, index=False)
+
+    os.chdir(workdir)  # relative data/ paths in utils.config now point at the synthetic data
+    return os.path.relpath(export_path, workdir)
+
+
+def git_revision():
+    try:
+        run = lambda *cmd: subprocess.run(cmd, cwd=REPO_ROOT, capture_output=True, text=True, check=True).stdout.strip()
+        return run("git", "rev-parse", "--short", "HEAD"), bool(run("git", "status", "--porcelain", "--untracked-files=no"))
+    except Exception:
+        return None, None
+
+
+# ---------------------------
+# Stages
+# ---------------------------
+def build_stages(export_path, raw_rows):
+    """
+    Stage name → (setup, run). setup() builds the stage input outside the timed region;
+    run(input) returns the number of rows it handled (raw export rows for preprocessing).
+    """
+    from mongodb import mongo_crud
+    from utils.preprocessor import load_and_preprocess_alarm_file
+    from utils.mongo_utils import df_to_dicts
+    from utils.mapping_cache import load_mapping
+    from utils.delta_ingest import compute_delta
+    from telegram_bot.outage_correlation import correlate_outages
+    from telegram_bot.escalate_alarms import load_and_merge, plan_deliveries, build_jobs, build_digest_jobs
+    from telegram_bot.escalation_rules import EscalationRules, DEFAULT_RULES
+
+    cleaned = load_and_preprocess_alarm_file(export_path, PROCESSED_FILE)
+    load_mapping(MAPPING_FILE)  # compiled mapping cache, as on every run but the first
+    merged = load_and_merge(cleaned)
+    rules = EscalationRules(DEFAULT_RULES)
+    previous = compute_delta(cleaned).hashes
+    previous.iloc[::20] += 1  # index of a "last export" that differs in 5% of the alarms
+
+    def preprocess(_):
+        load_and_preprocess_alarm_file(export_path, PROCESSED_FILE)
+        return raw_rows
+
+    def merge(_):
+        return len(load_and_merge(cleaned))
+
+    def build_messages(_):
+        jobs = build_jobs(merged, plan_deliveries(merged, rules=rules, now=BENCH_NOW))
+        return len(merged) if jobs else 0
+
+    def build_digests(_):
+        jobs = build_digest_jobs(merged, plan_deliveries(merged, rules=rules, now=BENCH_NOW))
+        return len(merged) if jobs else 0
+
+    def correlate(_):
+        correlate_outages(merged)
+        return len(merged)
+
+    def delta_diff(_):
+        compute_delta(cleaned, previous)
+        return len(cleaned)
+
+    def to_documents(frame):
+        return len(df_to_dicts(frame))
+
+    def fresh_mongo():
+        import mongomock
+        mongo_crud._client = mongomock.MongoClient()  # empty in-memory database per run
+        mongo_crud._indexed.clear()                   # so its indexes are created again
+        return df_to_dicts(cleaned.copy())
+
+    def mongo_upsert(records):
+        counts = mongo_crud.upsert_bulk_alarms(records, "AlarmLogs")
+        return counts["inserted"] + counts["updated"] + counts["unchanged"]
+
+    return {
+        "load_and_preprocess_alarm_file": (lambda: None, preprocess),
+        "delta_diff": (lambda: None, delta_diff),
+        "load_and_merge": (lambda: None, merge),
+        "build_messages": (lambda: None, build_messages),
+        "build_digests": (lambda: None, build_digests),
+        "correlate_outages": (lambda: None, correlate),
+        "df_to_dicts": (lambda: cleaned.copy(), to_documents),
+        MONGO_STAGE: (fresh_mongo, mongo_upsert),
+    }
+
+
+def time_stage(setup, run, repeat):
+    timings, rows = [], 0
+    for _ in range(repeat):
+        stage_input = setup()
+        gc.collect()
+        t = time.perf_counter()
+        rows = run(stage_input)
+        timings.append(time.perf_counter() - t)
+    median = statistics.median(timings)
+    return {
+        "rows": rows,
+        "runs_ms": [round(s * 1000, 2) for s in timings],
+        "min_ms": round(min(timings) * 1000, 2),
+        "median_ms": round(median * 1000, 2),
+        "rows_per_s": round(rows / median) if median else None,
+    }
+
+
+# ---------------------------
+# Results
+# ---------------------------
+def compare(current, baseline, threshold):
+    """Median of every stage against a saved run; stages slower than threshold are flagged."""
+    rows = []
+    for stage, result in current["stages"].items():
+        old = baseline["stages"].get(stage)
+        if not old or "median_ms" not in old or "median_ms" not in result:
+            continue
+        change = result["median_ms"] / old["median_ms"] - 1 if old["median_ms"] else 0.0
+        rows.append({
+            "stage": stage,
+            "baseline_ms": old["median_ms"],
+            "current_ms": result["median_ms"],
+            "change": f"{change:+.1%}",
+            "": "⚠️ slower" if change > threshold else ("✅ faster" if change < -threshold else ""),
+        })
+    print(f"\nvs {baseline['git']['commit']} ({baseline['created']}):")
+    print(pd.DataFrame(rows).to_string(index=False))
+    if baseline["params"] != current["params"]:
+        print("⚠️ Baseline used different parameters:", baseline["params"])
+
+
+def package_version(name):
+    try:
+        return version(name)
+    except PackageNotFoundError:
+        return None
+
+
+def mongomock_unsupported():
+    """Why the mongomock upsert stage cannot run with the installed packages (None when it can)."""
+    try:
+        import mongomock
+        from pymongo import UpdateOne
+    except ImportError as e:
+        return f"{e.name} not installed (pip install -r benchmarks/requirements.txt)"
+    try:
+        mongomock.MongoClient().bench.probe.bulk_write([UpdateOne({"_id": 1}, {"$set": {"x": 1}}, upsert=True)])
+    except Exception as e:
+        return (f"pymongo {package_version('pymongo')} and mongomock {package_version('mongomock')} "
+                f"do not work together ({type(e).__name__}); see benchmarks/requirements.txt")
+    return None
+
+
+def run_suite(params, repeat=3, workdir=None):
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            export_path = prepare_workdir(os.path.abspath(workdir or tmp), params)
+            stages = build_stages(export_path, params["rows"])
+            results, skip = {}, {MONGO_STAGE: mongomock_unsupported()}
+            for name, (setup, run) in stages.items():
+                if skip.get(name):
+                    results[name] = {"skipped": skip[name]}
+                    print(f"⏭ {name} skipped: {skip[name]}")
+                    continue
+                try:
+                    results[name] = time_stage(setup, run, repeat)
+                    print(f"⏱ {name}: {results[name]['median_ms']} ms")
+                except Exception as e:
+                    results[name] = {"error": f"{type(e).__name__}: {e}"}
+                    print(f"⚠️ {name} failed: {results[name]['error']}")
+        finally:
+            os.chdir(cwd)
+
+    commit, dirty = git_revision()
+    return {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "git": {"commit": commit, "dirty": dirty},
+        "params": {**params, "repeat": repeat},
+        "environment": {
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "pymongo": package_version("pymongo"),
+            "mongomock": package_version("mongomock"),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "stages": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=20_000)
+    parser.add_argument("--sites", type=int, default=500)
+    parser.add_argument("--outage-ratio", type=float, default=0.3)
+    parser.add_argument("--cleared-ratio", type=float, default=0.8)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--workdir", default=None, help="keep the synthetic data here and reuse it between runs")
+    parser.add_argument("--out", default=None, help="result file (default: benchmarks/results/<time>_<commit>.json)")
+    parser.add_argument("--compare", default=None, help="earlier result file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative change flagged by --compare")
+    args = parser.parse_args()
+
+    params = {
+        "rows": args.rows, "sites": args.sites, "outage_ratio": args.outage_ratio,
+        "cleared_ratio": args.cleared_ratio, "seed": args.seed,
+    }
+    report = run_suite(params, args.repeat, args.workdir)
+
+    table = pd.DataFrame(report["stages"]).T.drop(columns="runs_ms", errors="ignore")
+    print(table.to_string())
+
+    out = args.out or os.path.join(RESULTS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}_{report['git']['commit'] or 'nogit'}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"💾 Saved {out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f), args.threshold)
+
+    failed = [name for name, result in report["stages"].items() if "error" in result]
+    if failed:
+        print(f"❌ Failed stages: {', '.join(failed)}")
+        sys.exit(1)
@@ -0,0 +1,171 @@
+"""
+Repeatable integration checks against local stand-ins (benchmarks.mock_services): no VNOC,
+Telegram or MongoDB is contacted.
+
+    python -m benchmarks.check_integration --rows 2000 --sites 100
+
+- vnoc_download (submit button and __doPostBack link): HTTP login with the hidden ASP.NET fields
+  replayed, export streamed to *.part and renamed; the file must be byte-identical to the served one
+- vnoc_wrong_password: fetch_tt_log raises RuntimeError and leaves nothing in the download folder
+- daemon_once: one `pipeline_daemon --once` cycle on a synthetic export with Telegram sent to
+  StubBotApi and MongoDB in mongomock (storing is skipped when mongomock is unusable, see
+  benchmarks/requirements.txt); a second cycle on the same export must send nothing new
+
+Exits non-zero when a check fails.
+"""
+import os
+import sys
+import argparse
+import tempfile
+from unittest import mock
+
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from benchmarks.mock_services import BackgroundServer, MockVnoc, StubBotApi, free_port
+
+# utils.config reads these on import: Telegram goes to the stub, ledger and rollups stay in local files
+BOT_API_PORT = free_port()
+os.environ.update({
+    "TELEGRAM_API_BASE": f"http://127.0.0.1:{BOT_API_PORT}",
+    "TELEGRAM_CHAT_RATE": "1000",
+    "TELEGRAM_GLOBAL_RATE": "1000",
+    "LEDGER_BACKEND": "sqlite",
+    "ROLLUP_BACKEND": "file",
+    "ESCALATION_SOURCE": "file",
+    "OUTBOX": "False",
+    "VNOC_EXPORT_TARGET": "",
+})
+
+from benchmarks.bench_pipeline import prepare_workdir, mongomock_unsupported  # noqa: E402
+
+
+# ---------------------------
+# Checks
+# ---------------------------
+def check_vnoc_download(export_path, dest_dir, export_control):
+    from automation.vnoc_fetcher import fetch_tt_log
+
+    with open(export_path, "rb") as f:
+        expected = f.read()
+    vnoc = MockVnoc(expected, export_control=export_control)
+    with BackgroundServer(vnoc) as server, mock.patch("os.replace", wraps=os.replace) as replace:
+        path = fetch_tt_log(dest_dir, base_url=server.url("vnoc/"), username=vnoc.username, password=vnoc.password)
+
+    with open(path, "rb") as f:
+        assert f.read() == expected, "downloaded file differs from the served export"
+    assert replace.call_args_list == [mock.call(f"{path}.part", path)], f"not renamed from .part: {replace.call_args_list}"
+    assert not [name for name in os.listdir(dest_dir) if name.endswith(".part")], ".part file left behind"
+    assert (vnoc.logins, vnoc.exports) == (1, 1), f"logins={vnoc.logins}, exports={vnoc.exports}"
+    return f"{len(expected) / 1024:.0f} KB, {os.path.basename(path)}"
+
+
+def check_vnoc_wrong_password(export_path, dest_dir):
+    from automation.vnoc_fetcher import fetch_tt_log
+
+    with open(export_path, "rb") as f:
+        vnoc = MockVnoc(f.read())
+    with BackgroundServer(vnoc) as server:
+        try:
+            fetch_tt_log(dest_dir, base_url=server.url("vnoc/"), username=vnoc.username, password="wrong")
+        except RuntimeError as e:
+            error = str(e)
+        else:
+            raise AssertionError("no RuntimeError for a wrong password")
+    assert vnoc.exports == 0, "export served without a login"
+    assert not os.path.exists(dest_dir) or not os.listdir(dest_dir), "files written after a failed login"
+    return error
+
+
+def check_daemon_once(export_path, bot):
+    from automation.pipeline_daemon import PipelineDaemon
+    from mongodb import mongo_crud
+    from telegram_bot.escalation_ledger import SQLiteLedger
+    from telegram_bot.telegram_utils import resolve_target_chat
+    from utils.alarm_store import read_processed_alarms
+    from utils.config import ALARM_COLLECTION, CLEANED_ALARM_FILE, MAPPING_FILE
+    from utils.preprocessor import load_and_preprocess_alarm_file
+
+    skipped = mongomock_unsupported()
+    if not skipped:
+        import mongomock
+        mongo_crud._client = mongomock.MongoClient()
+        mongo_crud._indexed.clear()
+
+    daemon = PipelineDaemon(raw_dir=os.path.dirname(export_path), store=not skipped)
+    metrics = daemon.run_once(export_path)
+    failed = {name: stage["last_error"] for name, stage in metrics["stages"].items() if stage["failures"]}
+    assert not failed, f"failed stages: {failed}"
+    assert metrics["batches"] == 1, f"batches={metrics['batches']}"
+
+    expected = load_and_preprocess_alarm_file(export_path, None)
+    processed = read_processed_alarms(CLEANED_ALARM_FILE)
+    assert sorted(processed["TTNumber"]) == sorted(expected["TTNumber"]), "processed file does not match the export"
+    if not skipped:
+        stored = mongo_crud.get_db()[ALARM_COLLECTION].count_documents({})
+        assert stored == len(expected), f"{stored} alarms stored, expected {len(expected)}"
+
+    mapping = pd.read_excel(MAPPING_FILE)
+    chats = {resolve_target_chat(int(c)) for col in ("Technician_Chat_id", "Supervisor_Chat_id", "CE_Chat_id")
+             for c in mapping[col].dropna()}
+    sent = len(bot.messages)
+    assert sent, "no Telegram message sent"
+    assert {chat for chat, _ in bot.messages} <= chats, "message sent to a chat outside the mapping"
+    ledger = SQLiteLedger().load()
+    assert not ledger.empty and set(ledger["TTNumber"]) <= set(expected["TTNumber"]), "ledger does not match the escalated alarms"
+
+    PipelineDaemon(raw_dir=os.path.dirname(export_path), store=not skipped).run_once(export_path)
+    assert len(bot.messages) == sent, f"second cycle on the same export sent {len(bot.messages) - sent} more messages"
+
+    stored = f"store skipped ({skipped})" if skipped else f"{len(expected)} alarms in mongomock"
+    return f"{len(expected)} active alarms, {sent} messages to {len({c for c, _ in bot.messages})} chats, {stored}"
+
+
+# ---------------------------
+# Runner
+# ---------------------------
+def run_checks(params):
+    """Run every check in a fresh temp work directory (no state from earlier runs). Check name → error or None."""
+    cwd = os.getcwd()
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            export_path = os.path.abspath(prepare_workdir(os.path.join(tmp, "work"), params))
+            checks = {
+                "vnoc_download (button)": lambda: check_vnoc_download(export_path, os.path.join(tmp, "button"), "button"),
+                "vnoc_download (link)": lambda: check_vnoc_download(export_path, os.path.join(tmp, "link"), "link"),
+                "vnoc_wrong_password": lambda: check_vnoc_wrong_password(export_path, os.path.join(tmp, "denied")),
+            }
+            bot = StubBotApi()
+            with BackgroundServer(bot, port=BOT_API_PORT):
+                checks["daemon_once"] = lambda: check_daemon_once(export_path, bot)
+                for name, check in checks.items():
+                    try:
+                        results[name] = None
+                        print(f"✅ {name}: {check()}")
+                    except Exception as e:
+                        results[name] = f"{type(e).__name__}: {e}"
+                        print(f"❌ {name}: {results[name]}")
+        finally:
+            os.chdir(cwd)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=2_000)
+    parser.add_argument("--sites", type=int, default=100)
+    parser.add_argument("--outage-ratio", type=float, default=0.3)
+    parser.add_argument("--cleared-ratio", type=float, default=0.8)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    params = {
+        "rows": args.rows, "sites": args.sites, "outage_ratio": args.outage_ratio,
+        "cleared_ratio": args.cleared_ratio, "seed": args.seed,
+    }
+    failed = [name for name, error in run_checks(params).items() if error]
+    if failed:
+        print(f"❌ Failed checks: {', '.join(failed)}")
+        sys.exit(1)
@@ -0,0 +1,188 @@
+"""
+Local stand-ins for the external services, served from a background thread:
+
+- MockVnoc: the ASP.NET WebForms pages automation.vnoc_fetcher talks to (Default.aspx login,
+  TroubleTicketLogDetail.aspx export). Every page carries fresh __VIEWSTATE/__EVENTVALIDATION
+  values and a post that does not replay them is rejected, like the real portal.
+- StubBotApi: a Bot API sendMessage endpoint that records every message.
+
+    with BackgroundServer(MockVnoc(export_bytes)) as vnoc:
+        fetch_tt_log(dest, base_url=vnoc.url("vnoc/"), username="user", password="secret")
+
+Used by benchmarks.check_integration.
+"""
+import socket
+import asyncio
+import secrets
+import threading
+
+from aiohttp import web
+
+XLSX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+AUTH_COOKIE = ".ASPXAUTH"
+EXPORT_BUTTON = "ctl00$ContentPlaceHolder1$btnExportExcel"
+EXPORT_LINK = "ctl00$ContentPlaceHolder1$lnkExcel"
+
+LOGIN_FIELDS = (
+    '<input name="appLogin$UserName" type="text" />'
+    '<input name="appLogin$Password" type="password" />'
+    '<input type="image" name="appLogin$LoginImageButton" src="login.gif" />'
+)
+
+
+# ---------------------------
+# Server Thread
+# ---------------------------
+def free_port():
+    """A currently unused local port, for a server whose URL has to be known before it starts."""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class BackgroundServer:
+    """Run a service's aiohttp app on 127.0.0.1 in a background thread for the `with` block (port 0: any free port)."""
+
+    def __init__(self, service, port=0):
+        self.service = service
+        self.port = port
+        self._loop = asyncio.new_event_loop()
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=type(service).__name__, daemon=True)
+
+    def url(self, path=""):
+        return f"http://127.0.0.1:{self.port}/{path}"
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        runner = web.AppRunner(self.service.app())
+        self._loop.run_until_complete(runner.setup())
+        self._loop.run_until_complete(web.TCPSite(runner, "127.0.0.1", self.port).start())
+        self.port = runner.addresses[0][1]
+        self._ready.set()
+        self._loop.run_forever()
+        self._loop.run_until_complete(runner.cleanup())
+        self._loop.close()
+
+    def __enter__(self):
+        self._thread.start()
+        self._ready.wait()
+        return self
+
+    def __exit__(self, *exc):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+
+# ---------------------------
+# VNOC Portal
+# ---------------------------
+class MockVnoc:
+    """
+    VNOC under /vnoc/: cookie login with username/password, then the export as a chunked
+    attachment. export_control is "button" (a submit input) or "link" (a __doPostBack link).
+    """
+
+    def __init__(self, export_bytes, username="user", password="secret", export_control="button",
+                 filename="TTLogDetail.xlsx", chunk_size=8192):
+        self.export_bytes = export_bytes
+        self.username = username
+        self.password = password
+        self.export_control = export_control
+        self.filename = filename
+        self.chunk_size = chunk_size
+        self.logins = 0
+        self.exports = 0
+        self._state = {}  # page → (viewstate, eventvalidation) last issued
+
+    def app(self):
+        app = web.Application()
+        app.router.add_get("/vnoc/Default.aspx", self.login_page)
+        app.router.add_post("/vnoc/Default.aspx", self.login_post)
+        app.router.add_get("/vnoc/aspx/Home.aspx", self.home)
+        app.router.add_get("/vnoc/aspx/TroubleTicketLogDetail.aspx", self.tt_page)
+        app.router.add_post("/vnoc/aspx/TroubleTicketLogDetail.aspx", self.tt_post)
+        return app
+
+    def _form(self, page, action, body):
+        viewstate, validation = secrets.token_urlsafe(40) + "/+==", secrets.token_hex(16)
+        self._state[page] = (viewstate, validation)
+        return web.Response(content_type="text/html", text=(
+            f'<html><body><form method="post" action="./{action}" id="aspnetForm">'
+            '<input type="hidden" name="__EVENTTARGET" id="__EVENTTARGET" value="" />'
+            '<input type="hidden" name="__EVENTARGUMENT" id="__EVENTARGUMENT" value="" />'
+            f'<input type="hidden" name="__VIEWSTATE" id="__VIEWSTATE" value="{viewstate}" />'
+            '<input type="hidden" name="__VIEWSTATEGENERATOR" id="__VIEWSTATEGENERATOR" value="CA0B0334" />'
+            f'<input type="hidden" name="__EVENTVALIDATION" id="__EVENTVALIDATION" value="{validation}" />'
+            f"{body}</form></body></html>"
+        ))
+
+    def _replayed(self, page, data):
+        return self._state.get(page) == (data.get("__VIEWSTATE"), data.get("__EVENTVALIDATION"))
+
+    async def login_page(self, request):
+        return self._form("login", "Default.aspx", LOGIN_FIELDS)
+
+    async def login_post(self, request):
+        data = await request.post()
+        if not self._replayed("login", data) or "appLogin$LoginImageButton.x" not in data:
+            return web.Response(status=500, text="Invalid postback or callback argument")
+        if (data.get("appLogin$UserName"), data.get("appLogin$Password")) != (self.username, self.password):
+            return self._form("login", "Default.aspx", LOGIN_FIELDS + "<span>Login failed</span>")
+        self.logins += 1
+        response = web.HTTPFound("aspx/Home.aspx")
+        response.set_cookie(AUTH_COOKIE, "ok")
+        raise response
+
+    async def home(self, request):
+        return web.Response(text='<html><div id="ctl00_Html1">Home</div></html>', content_type="text/html")
+
+    async def tt_page(self, request):
+        if request.cookies.get(AUTH_COOKIE) != "ok":
+            raise web.HTTPFound("/vnoc/Default.aspx")
+        if self.export_control == "button":
+            export = f'<input type="submit" name="{EXPORT_BUTTON}" value="Download Excel" />'
+        else:
+            export = f"<a id=\"ctl00_lnkExcel\" href=\"javascript:__doPostBack('{EXPORT_LINK}','')\">Download Excel</a>"
+        search = '<input type="submit" name="ctl00$ContentPlaceHolder1$btnSearch" value="Search" />'
+        return self._form("tt", "TroubleTicketLogDetail.aspx", export + search)
+
+    async def tt_post(self, request):
+        if request.cookies.get(AUTH_COOKIE) != "ok":
+            raise web.HTTPFound("/vnoc/Default.aspx")
+        data = await request.post()
+        if not self._replayed("tt", data):
+            return web.Response(status=500, text="Invalid postback or callback argument")
+        if EXPORT_BUTTON not in data and data.get("__EVENTTARGET") != EXPORT_LINK:
+            return web.Response(text="<html>No export requested</html>", content_type="text/html")
+
+        self.exports += 1
+        response = web.StreamResponse(headers={
+            "Content-Type": XLSX_CONTENT_TYPE,
+            "Content-Disposition": f'attachment; filename="{self.filename}"',
+        })
+        await response.prepare(request)
+        for start in range(0, len(self.export_bytes), self.chunk_size):
+            await response.write(self.export_bytes[start:start + self.chunk_size])
+        await response.write_eof()
+        return response
+
+
+# ---------------------------
+# Telegram Bot API
+# ---------------------------
+class StubBotApi:
+    """sendMessage that answers {"ok": true} and keeps (chat_id, text) of every message in `messages`."""
+
+    def __init__(self):
+        self.messages = []
+
+    def app(self):
+        app = web.Application()
+        app.router.add_post("/bot{token}/sendMessage", self.send_message)
+        return app
+
+    async def send_message(self, request):
+        data = await request.post()
+        self.messages.append((int(data["chat_id"]), data["text"]))
+        return web.json_response({"ok": True, "result": {"message_id": len(self.messages)}})
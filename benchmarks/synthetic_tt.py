@@ -0,0 +1,139 @@
+"""
+Deterministic synthetic VNOC TT log exports and matching site escalation mapping.
+
+    python -m benchmarks.synthetic_tt data/raw/tt_synthetic.xlsx --rows 50000 --mapping data/mapping/site_escalation_mapping.xlsx
+"""
+import os
+import sys
+import argparse
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from utils.preprocessor import REQUIRED_COLUMNS, OUTAGE_KEYWORDS
+
+OTHER_EVENTS = ["SITE ON BATTERY", "MAINS FAIL/EB FAIL", "DG ON LOAD", "HIGH TEMPERATURE", "DOOR OPEN"]
+CLUSTERS = ["PUNE-1", "PUNE-2", "PUNE-3", "NASHIK", "SATARA"]
+OPERATORS = ["Airtel", "Jio", "VIL"]
+
+# Export layout: a report title on row 1, the header on row 2, then the alarms
+REPORT_TITLE = "TT Log Detail Report"
+EXPORT_COLUMNS = ["SrNo"] + REQUIRED_COLUMNS + ["Remarks"]
+
+# Columns of data/mapping/site_escalation_mapping.xlsx (same as the escalation matrix)
+MAPPING_COLUMNS = [
+    "GLOBAL ID", "SITE NAME", "ONE ATC CLUSTER", "IME", "Site Status",
+    "Tchnician Name", "Tchnician NO", "USER ID", "Technician_Chat_id",
+    "supervisor Name", "Supervisor NO", "USER ID.1", "Supervisor_Chat_id",
+    "Cluster Eng", "CE NO", "USER ID.2", "CE_Chat_id",
+]
+
+FIRST_SITE_ID = 400000
+FIRST_TT_NUMBER = 699000000
+
+
+def site_ids(sites):
+    return np.arange(FIRST_SITE_ID, FIRST_SITE_ID + sites)
+
+
+def synthetic_alarms(rows, sites=500, outage_ratio=0.3, cleared_ratio=0.8, start="2025-03-10", days=30, seed=0):
+    """
+    Raw export rows: outage_ratio of the alarms are 2G/3G/4G outages, cleared_ratio of them
+    carry a ClearedDateTime. The same arguments always give the same frame.
+    """
+    rng = np.random.default_rng(seed)
+    ids = site_ids(sites)
+    site = rng.integers(0, sites, rows)
+    open_time = pd.Timestamp(start) + pd.to_timedelta(rng.integers(0, days * 86400, rows), unit="s")
+    cleared = rng.random(rows) < cleared_ratio
+    outage = rng.random(rows) < outage_ratio
+
+    df = pd.DataFrame({
+        "SrNo": np.arange(1, rows + 1),
+        "OpenTime": open_time,
+        "TTNumber": [f"TT{FIRST_TT_NUMBER + i}" for i in range(rows)],
+        "Cluster": np.array(CLUSTERS)[site % len(CLUSTERS)],
+        "SiteID": ids[site],
+        "SiteName": [f"SITE {s:04d}" for s in site],
+        "SourceInput": rng.choice(OPERATORS, rows),
+        "EventName": np.where(outage, rng.choice(OUTAGE_KEYWORDS, rows), rng.choice(OTHER_EVENTS, rows)),
+        "ClusterEngineer": [f"CE {s % 25:02d}" for s in site],
+        "Technician": [f"TECH {s:04d}" for s in site],
+        "EsclationStatus": np.where(cleared, "CLOSED", "OPEN"),
+        "ClearedDateTime": open_time + pd.to_timedelta(rng.integers(5, 720, rows), unit="m"),
+        "Remarks": None,
+    })
+    df.loc[~cleared, "ClearedDateTime"] = pd.NaT
+    return df[EXPORT_COLUMNS]
+
+
+def write_tt_export(df, path):
+    """Write rows the way VNOC exports them (title row, header on row 2), streamed with openpyxl."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("TT Log")
+    ws.append([REPORT_TITLE])
+    ws.append(EXPORT_COLUMNS)
+    for row in df.astype(object).where(df.notna(), None).itertuples(index=False):
+        ws.append([v.to_pydatetime() if isinstance(v, pd.Timestamp) else v for v in row])
+    wb.save(path)
+    return path
+
+
+def synthetic_mapping(sites=500, seed=0):
+    """One mapping row per synthetic site; chat ids are shared like real supervisor/CE areas."""
+    rng = np.random.default_rng(seed)
+    ids = site_ids(sites)
+    n = np.arange(sites)
+    return pd.DataFrame({
+        "GLOBAL ID": ids,
+        "SITE NAME": [f"SITE {s:04d}" for s in n],
+        "ONE ATC CLUSTER": np.array(CLUSTERS)[n % len(CLUSTERS)],
+        "IME": "ATS",
+        "Site Status": "Active",
+        "Tchnician Name": [f"TECH {s:04d}" for s in n],
+        "Tchnician NO": 9000000000 + rng.integers(0, 10**9, sites),
+        "USER ID": None,
+        "Technician_Chat_id": 1000000 + n // 2,
+        "supervisor Name": [f"SUPERVISOR {s // 10:03d}" for s in n],
+        "Supervisor NO": 8000000000 + rng.integers(0, 10**9, sites),
+        "USER ID.1": None,
+        "Supervisor_Chat_id": 2000000 + n // 10,
+        "Cluster Eng": [f"CE {s % 25:02d}" for s in n],
+        "CE NO": 7000000000 + rng.integers(0, 10**9, sites),
+        "USER ID.2": None,
+        "CE_Chat_id": 3000000 + n % 25,
+    })[MAPPING_COLUMNS]
+
+
+def write_synthetic_dataset(export_path, mapping_path=None, rows=10000, sites=500,
+                            outage_ratio=0.3, cleared_ratio=0.8, seed=0):
+    """Write a TT export (and optionally its site mapping). Returns the generated export rows."""
+    df = synthetic_alarms(rows, sites, outage_ratio, cleared_ratio, seed=seed)
+    write_tt_export(df, export_path)
+    if mapping_path:
+        os.makedirs(os.path.dirname(mapping_path) or ".", exist_ok=True)
+        synthetic_mapping(sites, seed).to_excel(mapping_path, index=False)
+    return df
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("export_path")
+    parser.add_argument("--mapping", default=None, help="also write the matching site mapping here")
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--sites", type=int, default=500)
+    parser.add_argument("--outage-ratio", type=float, default=0.3)
+    parser.add_argument("--cleared-ratio", type=float, default=0.8)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    started = datetime.now()
+    df = write_synthetic_dataset(args.export_path, args.mapping, args.rows, args.sites,
+                                 args.outage_ratio, args.cleared_ratio, args.seed)
+    open_rows = df["ClearedDateTime"].isna().sum()
+    print(f"✅ {len(df)} alarms ({open_rows} open) → {args.export_path} in {(datetime.now() - started).total_seconds():.1f}s")
@@ -1,31 +1,187 @@
 import os
 import sys
+import time
 import logging
+import threading
 import streamlit as st
 import pandas as pd
 
 # Fix import path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
+from utils.config import ALARM_COLLECTION, ESCALATION_SOURCE
 from utils.preprocessor import load_and_preprocess_alarm_file
-from telegram_bot.escalate_alarms import escalate_alarms
-from mongodb.mongo_crud import insert_bulk_alarms
-from automation.download_and_preprocess import (
-    get_latest_downloaded_file,
-    clear_download_folder,
-    download_alarm_log,      # ✅ works locally only
-    wait_for_new_file        # ✅ works locally only
-)
-from utils.mongo_utils import df_to_dicts
+from utils.alarm_store import read_processed_alarms, write_processed_alarms
+from utils.mapping_cache import file_sha256
+from utils.mongo_utils import iter_documents
+from utils.rollups import update_rollups
+from frontend.jobs import JobRegistry
 
 # Constants
 DOWNLOAD_DIR = os.path.abspath("data/raw")
 PROCESSED_OUTPUT = "data/processed/cleaned_alarms.csv"
-COLLECTION_NAME = "AlarmLogs"
+COLLECTION_NAME = ALARM_COLLECTION
+SUMMARY_TTL = 30  # seconds the open-alarm summary is shared between operators
+
+
+# ---------------------------
+# Shared Resources & Caches
+# ---------------------------
+@st.cache_resource
+def get_jobs():
+    """Background workers and job registry shared by every session of this server."""
+    return JobRegistry(max_workers=2)
+
+
+@st.cache_resource
+def get_handoff():
+    """Serializes writes and escalation reads of PROCESSED_OUTPUT; `written` is the submit time of the upload it holds."""
+    return {"lock": threading.Lock(), "written": 0}
+
+
+@st.cache_resource
+def init_indexes():
+    """Create query indexes once per server process, the first time they are needed (not on page load)."""
+    try:
+        from mongodb.alarm_queries import ensure_query_indexes
+        ensure_query_indexes(COLLECTION_NAME)
+    except Exception as e:
+        logging.warning(f"⚠️ Could not create MongoDB indexes: {e}")
+
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def parse_alarm_file(file_hash, path):
+    """Cleaned alarms for a raw export, cached by file content (re-uploads skip parsing)."""
+    return load_and_preprocess_alarm_file(path, None)
+
+
+@st.cache_data(ttl=SUMMARY_TTL, show_spinner=False)
+def load_open_summary(collection_name):
+    from mongodb.alarm_queries import open_counts_by_cluster_event, site_down_totals
+    init_indexes()
+    return (
+        pd.DataFrame(site_down_totals(collection_name)),
+        pd.DataFrame(open_counts_by_cluster_event(collection_name)),
+    )
+
+
+# ---------------------------
+# Background Jobs
+# ---------------------------
+def download_job(job):
+    """Fetch the TT log over HTTP; locally fall back to Selenium (manual click in the browser)."""
+    from automation.vnoc_fetcher import fetch_tt_log
+    from automation.download_and_preprocess import (
+        get_latest_downloaded_file,
+        clear_download_folder,
+        download_alarm_log,      # ✅ works locally only
+        wait_for_new_file        # ✅ works locally only
+    )
+
+    job.update(0.1, "Downloading TT log from VNOC...")
+    try:
+        return fetch_tt_log(DOWNLOAD_DIR)
+    except Exception as e:
+        logging.warning(f"⚠️ Direct download failed ({e}). Falling back.")
+
+    if os.getenv("STREAMLIT_RUNTIME"):
+        # 🚀 Cloud mode → no Selenium, just check for file in raw folder
+        latest_file = get_latest_downloaded_file(DOWNLOAD_DIR)
+        if not latest_file:
+            raise FileNotFoundError("No Excel file found in raw folder. Please upload manually.")
+        return latest_file
+
+    # 🖥 Local mode → use Selenium
+    clear_download_folder(DOWNLOAD_DIR)
+    driver = download_alarm_log()
+    if not driver:
+        raise RuntimeError("Failed to open VNOC portal.")
+    try:
+        job.update(0.3, "Waiting for the Excel download in the browser...")
+        latest_file = wait_for_new_file(DOWNLOAD_DIR, timeout=180)
+    finally:
+        driver.quit()
+    if not latest_file:
+        raise FileNotFoundError("No new Excel file detected in raw folder.")
+    return latest_file
+
+
+def upload_job(job, path, file_hash, submitted):
+    from mongodb.mongo_crud import upsert_bulk_alarms
+
+    job.update(0.05, "Preprocessing...")
+    df = parse_alarm_file(file_hash, path)  # cached by content, re-selecting a file skips parsing
+    handoff = get_handoff()
+    with handoff["lock"]:
+        # Escalation reads the latest processed batch: an older selection never overwrites a newer one
+        if submitted > handoff["written"]:
+            write_processed_alarms(df, PROCESSED_OUTPUT)
+            handoff["written"] = submitted
+    try:
+        update_rollups(df)  # backlog analytics page
+    except Exception as e:
+        logging.warning(f"⚠️ Could not update alarm rollups: {e}")
+
+    total = max(len(df), 1)
+    job.update(0.3, f"Uploading {len(df)} alarms to MongoDB...")
+    records = iter_documents(df)  # streamed straight into the bulk upserts
+    return upsert_bulk_alarms(
+        records, COLLECTION_NAME,
+        progress=lambda counts, done: job.update(0.3 + 0.7 * done / total, f"Uploaded {done}/{len(df)} alarms"),
+    )
+
+
+def escalate_job(job):
+    from telegram_bot.escalate_alarms import escalate_alarms
+
+    job.update(0.1, "Escalating alarms via Telegram...")
+    alarm_df = None  # ESCALATION_SOURCE=mongo: escalation reads the open alarms itself
+    if ESCALATION_SOURCE == "file":
+        with get_handoff()["lock"]:  # never while an upload is replacing the processed file
+            alarm_df = read_processed_alarms(PROCESSED_OUTPUT)
+    return escalate_alarms(alarm_df=alarm_df)
+
+
+def start_job(kind, label, func, *args, key=None, reuse_done=False):
+    job = get_jobs().submit(key or (kind,), label, func, *args, reuse_done=reuse_done)
+    st.session_state["jobs"][kind] = job.id
+
+
+def render_job(kind, job):
+    if job.active:
+        st.progress(job.progress, text=f"⏳ {job.label}: {job.message}")
+    elif job.status == "failed":
+        st.error(f"❌ {job.label} failed: {job.error}")
+    elif kind == "download":
+        if st.session_state.get("download_used") != job.id:  # a later manual upload is not overridden
+            st.session_state["source_file"] = job.result
+            st.session_state["download_used"] = job.id
+        st.success(f"✅ Detected new Excel file: {os.path.basename(job.result)}")
+    elif kind == "upload":
+        counts = job.result
+        st.success(
+            f"✅ MongoDB updated → inserted: {counts['inserted']}, "
+            f"updated: {counts['updated']}, unchanged: {counts['unchanged']}"
+        )
+    elif kind == "escalate":
+        counts = job.result or {}
+        st.success(
+            f"📢 Telegram alarm escalation completed → Technician: {counts.get('Technician', 0)}, "
+            f"Supervisor: {counts.get('Supervisor', 0)}, CE: {counts.get('Cluster Engineer', 0)}"
+        )
+
+
+def session_jobs():
+    jobs = get_jobs()
+    found = {kind: jobs.get(job_id) for kind, job_id in st.session_state["jobs"].items()}
+    return {kind: job for kind, job in found.items() if job is not None}
+
 
 # --- Initialize session state ---
 if "source_file" not in st.session_state:
     st.session_state["source_file"] = None
+if "jobs" not in st.session_state:
+    st.session_state["jobs"] = {}  # kind → job id in the shared registry
 
 # UI
 st.title("🚨 Alarm Automation Dashboard")
@@ -35,10 +191,12 @@ mode = st.radio("Choose Input Mode", ["📤 Manual Upload" ,"🖐 Auto Download
 # --- Manual Upload ---
 if mode == "📤 Manual Upload":
     uploaded_file = st.file_uploader("Upload Alarm Log File", type=["xlsx", "csv"])
-    if uploaded_file is not None:
+    if uploaded_file is not None and st.session_state.get("uploaded_id") != uploaded_file.file_id:
         uploaded_path = os.path.join(DOWNLOAD_DIR, uploaded_file.name)
+        os.makedirs(DOWNLOAD_DIR, exist_ok=True)
         with open(uploaded_path, "wb") as f:
             f.write(uploaded_file.getbuffer())
+        st.session_state["uploaded_id"] = uploaded_file.file_id  # save once, not on every rerun
         st.session_state["source_file"] = uploaded_path
         st.success(f"📂 Uploaded file saved: {uploaded_file.name}")
 
@@ -46,53 +204,46 @@ if mode == "📤 Manual Upload":
 else:
     st.info("👉 Download the alarm log file from VNOC.")
     if st.button("🔄 Get File from VNOC"):
-        try:
-            # Detect environment
-            if os.getenv("STREAMLIT_RUNTIME"):  
-                # 🚀 Cloud mode → no Selenium, just check for file in raw folder
-                latest_file = get_latest_downloaded_file(DOWNLOAD_DIR)
-                if latest_file:
-                    st.session_state["source_file"] = latest_file
-                    st.success(f"✅ Found downloaded file: {os.path.basename(latest_file)}")
-                else:
-                    st.error("❌ No Excel file found in raw folder. Please upload manually.")
-            else:
-                # 🖥 Local mode → use Selenium
-                clear_download_folder(DOWNLOAD_DIR)
-                driver = download_alarm_log()
-                if not driver:
-                    st.error("❌ Failed to open VNOC portal.")
-                else:
-                    latest_file = wait_for_new_file(DOWNLOAD_DIR, timeout=180)
-                    driver.quit()
-                    if latest_file:
-                        st.session_state["source_file"] = latest_file
-                        st.success(f"✅ Detected new Excel file: {os.path.basename(latest_file)}")
-                    else:
-                        st.error("❌ No new Excel file detected in raw folder.")
-        except Exception as e:
-            st.error(f"❌ Error during manual download: {e}")
+        start_job("download", "VNOC download", download_job)
 
 # --- Preprocess & Upload ---
 if st.button("⚙️ Preprocess & Upload to MongoDB"):
     source_file = st.session_state.get("source_file")
     if source_file:
-        try:
-            df = load_and_preprocess_alarm_file(source_file, PROCESSED_OUTPUT)
-            st.success("✅ Preprocessing complete.")
-
-            records = df_to_dicts(df)
-            insert_bulk_alarms(records, COLLECTION_NAME)
-            st.success("✅ Data inserted into MongoDB.")
-        except Exception as e:
-            st.error(f"❌ Error during processing: {e}")
+        file_hash = file_sha256(source_file)
+        # Same file content while it is still running → same job; a finished one runs again so
+        # the processed file escalation reads always matches the selected source
+        start_job("upload", "Preprocess & upload", upload_job, source_file, file_hash, time.monotonic_ns(),
+                  key=("upload", file_hash))
     else:
         st.warning("⚠️ No file selected or detected.")
 
 # --- Escalation ---
 if st.button("📣 Escalate Alarms via Telegram"):
+    start_job("escalate", "Escalation", escalate_job)
+
+# --- Background job progress (polls only while something is running) ---
+polling = any(job.active for job in session_jobs().values())
+
+
+@st.fragment(run_every=1.0 if polling else None)
+def job_panel():
+    jobs = session_jobs()
+    for kind, job in jobs.items():
+        render_job(kind, job)
+    if polling and not any(job.active for job in jobs.values()):
+        st.rerun()  # full rerun once everything finished, which also stops the polling
+
+
+job_panel()
+
+# --- Open Alarm Summary (aggregated inside MongoDB) ---
+if st.button("📊 Show Open Alarm Summary"):
     try:
-        escalate_alarms()
-        st.success("📢 Telegram alarm escalation completed.")
+        site_down_df, open_df = load_open_summary(COLLECTION_NAME)
+        st.subheader("🚨 Site Down by Cluster")
+        st.dataframe(site_down_df)
+        st.subheader("📋 Open Alarms by Cluster / Event")
+        st.dataframe(open_df)
     except Exception as e:
-        st.error(f"❌ Escalation failed: {e}")
+        st.error(f"❌ Could not load summary: {e}")
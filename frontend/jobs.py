@@ -0,0 +1,89 @@
+import time
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+RUNNING = ("queued", "running")
+MAX_FINISHED_JOBS = 20
+
+
+class Job:
+    """One background task with progress the dashboard can poll."""
+
+    def __init__(self, key, label):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.label = label
+        self.status = "queued"  # queued → running → done | failed
+        self.progress = 0.0
+        self.message = "Queued..."
+        self.result = None
+        self.error = None
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def active(self):
+        return self.status in RUNNING
+
+    def update(self, progress=None, message=None):
+        if progress is not None:
+            self.progress = min(max(float(progress), 0.0), 1.0)
+        if message is not None:
+            self.message = message
+
+
+class JobRegistry:
+    """
+    Thread pool plus a registry of jobs shared by every dashboard session.
+    Submitting a key that is already running returns the running job, so two operators
+    clicking the same button share one run instead of repeating the work.
+    """
+
+    def __init__(self, max_workers=2):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="dashboard-job")
+        self._lock = threading.Lock()
+        self._jobs = {}     # id → Job
+        self._by_key = {}   # key → id of the latest job for that key
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def submit(self, key, label, func, *args, reuse_done=False):
+        """
+        Run func(job, *args) in the background and return its Job. The running job for key
+        is returned instead of starting a new one (and with reuse_done, a finished one too).
+        """
+        with self._lock:
+            existing = self._jobs.get(self._by_key.get(key))
+            if existing and (existing.active or (reuse_done and existing.status == "done")):
+                return existing
+
+            job = Job(key, label)
+            self._jobs[job.id] = job
+            self._by_key[key] = job.id
+            self._prune()
+        self._executor.submit(self._run, job, func, args)
+        return job
+
+    def _run(self, job, func, args):
+        job.status, job.started_at = "running", time.time()
+        job.update(message="Running...")
+        try:
+            job.result = func(job, *args)
+            job.status = "done"
+            job.update(1.0, "Done")
+        except Exception as e:
+            logging.error(f"❌ {job.label} failed: {e}")
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            job.finished_at = time.time()
+
+    def _prune(self):
+        finished = sorted((j for j in self._jobs.values() if not j.active), key=lambda j: j.finished_at or 0)
+        for job in finished[:max(len(finished) - MAX_FINISHED_JOBS, 0)]:
+            self._jobs.pop(job.id)
+            if self._by_key.get(job.key) == job.id:
+                self._by_key.pop(job.key)
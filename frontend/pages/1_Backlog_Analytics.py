@@ -0,0 +1,71 @@
+import os
+import sys
+from datetime import datetime
+
+import pandas as pd
+import streamlit as st
+
+# Fix import path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from utils.rollups import AGE_BUCKETS, load_rollups
+
+REFRESH_SECONDS = 15  # rollups are shared between operators for this long
+TOP_SITES = 20
+
+
+@st.cache_data(ttl=REFRESH_SECONDS, show_spinner=False)
+def get_rollups():
+    """Pre-aggregated backlog (a few hundred small rows), never a scan of AlarmLogs."""
+    return load_rollups()
+
+
+st.title("📈 Alarm Backlog")
+
+try:
+    rollups, as_of = get_rollups()
+except Exception as e:
+    st.error(f"❌ Could not load alarm rollups: {e}")
+    st.stop()
+
+if rollups.empty:
+    st.info("👉 No rollups yet. Preprocess & upload an alarm file (or run the pipeline daemon).")
+    st.stop()
+
+st.caption(f"🕐 As of {as_of:%Y-%m-%d %H:%M} (updated on every ingest)")
+
+by_dimension = {name: part.set_index("key") for name, part in rollups.groupby("dimension")}
+clusters = by_dimension["cluster"]
+selected = st.multiselect("Clusters", sorted(clusters.index), default=sorted(clusters.index))
+clusters = clusters.loc[selected]
+
+cluster_events = by_dimension["cluster_event"]
+cluster_events = cluster_events[cluster_events["Cluster"].isin(selected)]
+sites = by_dimension["site"]
+sites = sites[sites["Cluster"].isin(selected)]
+
+# --- Headline numbers ---
+oldest = clusters["oldest_open"].min()
+col1, col2, col3, col4 = st.columns(4)
+col1.metric("🚨 Open alarms", f"{clusters['open'].sum():,}")
+col2.metric("📴 Site-down alarms", f"{clusters['site_down'].sum():,}")
+col3.metric("🗼 Sites with open alarms", f"{len(sites):,}")
+col4.metric("⏳ Oldest open", f"{(datetime.now() - oldest).total_seconds() / 3600:,.0f} h" if pd.notna(oldest) else "-")
+
+# --- Charts ---
+st.subheader("📴 Open outages by cluster")
+st.bar_chart(clusters[["site_down"]].sort_values("site_down", ascending=False))
+
+st.subheader("⏳ Age of open alarms by cluster")
+st.bar_chart(clusters[list(AGE_BUCKETS)])
+
+st.subheader("📋 Open alarms by cluster / event")
+st.bar_chart(cluster_events.pivot_table(index="Cluster", columns="EventName", values="open", aggfunc="sum", fill_value=0))
+
+st.subheader(f"🏚 Oldest {TOP_SITES} sites with open alarms")
+oldest_sites = sites.sort_values("oldest_open").head(TOP_SITES).reset_index()
+oldest_sites["age_hours"] = ((datetime.now() - oldest_sites["oldest_open"]).dt.total_seconds() / 3600).round(1)
+st.dataframe(
+    oldest_sites[["SiteID", "SiteName", "Cluster", "open", "site_down", "oldest_open", "age_hours"]],
+    hide_index=True,
+)
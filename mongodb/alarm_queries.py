@@ -0,0 +1,121 @@
+from datetime import datetime, timedelta
+
+from pymongo import ASCENDING
+
+from mongodb.mongo_crud import get_db
+
+# Compound indexes backing the filters and aggregations below (all start with the OPEN status)
+QUERY_INDEXES = [
+    [("EsclationStatus", ASCENDING), ("Cluster", ASCENDING), ("EventName", ASCENDING)],
+    [("EsclationStatus", ASCENDING), ("SiteID", ASCENDING), ("OpenTime", ASCENDING)],
+    [("EsclationStatus", ASCENDING), ("OpenTime", ASCENDING)],
+    [("EsclationStatus", ASCENDING), ("Is_SiteDown", ASCENDING), ("Cluster", ASCENDING)],
+]
+
+# Fields escalation and the dashboard actually read
+OPEN_ALARM_PROJECTION = {
+    "_id": 0, "TTNumber": 1, "OpenTime": 1, "Cluster": 1, "SiteID": 1, "SiteName": 1,
+    "SourceInput": 1, "EventName": 1, "Is_SiteDown": 1,
+}
+
+
+def ensure_query_indexes(collection_name):
+    """Create the compound indexes used by the open-alarm queries (call once on startup)."""
+    collection = get_db()[collection_name]
+    return [collection.create_index(keys) for keys in QUERY_INDEXES]
+
+
+def _match(value):
+    return {"$in": list(value)} if isinstance(value, (list, tuple, set)) else value
+
+
+def build_open_filter(cluster=None, site_id=None, event_name=None, min_age_minutes=None,
+                      max_age_minutes=None, site_down=None, now=None):
+    """
+    Mongo filter for OPEN alarms. cluster/site_id/event_name take one value or a list;
+    ages are minutes since OpenTime.
+    """
+    query = {"EsclationStatus": "OPEN"}
+    if cluster is not None:
+        query["Cluster"] = _match(cluster)
+    if site_id is not None:
+        query["SiteID"] = _match(site_id)
+    if event_name is not None:
+        query["EventName"] = _match(event_name)
+    if site_down is not None:
+        query["Is_SiteDown"] = site_down
+
+    now = now or datetime.now()
+    if min_age_minutes is not None:
+        query.setdefault("OpenTime", {})["$lte"] = now - timedelta(minutes=min_age_minutes)
+    if max_age_minutes is not None:
+        query.setdefault("OpenTime", {})["$gte"] = now - timedelta(minutes=max_age_minutes)
+    return query
+
+
+# ---------------------------
+# Paged Queries
+# ---------------------------
+def find_open_alarms(collection_name, projection=OPEN_ALARM_PROJECTION, page=1, page_size=100,
+                     sort=(("OpenTime", ASCENDING),), **filters):
+    """One page of open alarms (oldest first), with only the projected fields."""
+    cursor = (
+        get_db()[collection_name]
+        .find(build_open_filter(**filters), projection)
+        .sort(list(sort))
+        .skip(max(page - 1, 0) * page_size)
+        .limit(page_size)
+    )
+    return list(cursor)
+
+
+def count_open_alarms(collection_name, **filters):
+    return get_db()[collection_name].count_documents(build_open_filter(**filters))
+
+
+# ---------------------------
+# Server-side Summaries
+# ---------------------------
+def open_counts_by_cluster_event(collection_name, **filters):
+    """Open alarm counts per (Cluster, EventName), largest first."""
+    pipeline = [
+        {"$match": build_open_filter(**filters)},
+        {"$group": {"_id": {"Cluster": "$Cluster", "EventName": "$EventName"}, "count": {"$sum": 1}}},
+        {"$project": {"_id": 0, "Cluster": "$_id.Cluster", "EventName": "$_id.EventName", "count": 1}},
+        {"$sort": {"count": -1}},
+    ]
+    return list(get_db()[collection_name].aggregate(pipeline))
+
+
+def oldest_open_per_site(collection_name, limit=None, **filters):
+    """Oldest open alarm per site with the site's open count, oldest sites first."""
+    pipeline = [
+        {"$match": build_open_filter(**filters)},
+        {"$sort": {"OpenTime": 1}},
+        {"$group": {
+            "_id": "$SiteID",
+            "Cluster": {"$first": "$Cluster"},
+            "OldestOpenTime": {"$first": "$OpenTime"},
+            "TTNumber": {"$first": "$TTNumber"},
+            "EventName": {"$first": "$EventName"},
+            "open_alarms": {"$sum": 1},
+        }},
+        {"$project": {"_id": 0, "SiteID": "$_id", "Cluster": 1, "OldestOpenTime": 1,
+                      "TTNumber": 1, "EventName": 1, "open_alarms": 1}},
+        {"$sort": {"OldestOpenTime": 1}},
+    ]
+    if limit:
+        pipeline.append({"$limit": limit})
+    return list(get_db()[collection_name].aggregate(pipeline))
+
+
+def site_down_totals(collection_name, **filters):
+    """Open site-down alarms and distinct affected sites per cluster."""
+    filters["site_down"] = True
+    pipeline = [
+        {"$match": build_open_filter(**filters)},
+        {"$group": {"_id": "$Cluster", "alarms": {"$sum": 1}, "site_ids": {"$addToSet": "$SiteID"}}},
+        {"$project": {"_id": 0, "Cluster": "$_id", "alarms": 1, "sites": {"$size": "$site_ids"}}},
+        {"$sort": {"sites": -1}},
+    ]
+    return list(get_db()[collection_name].aggregate(pipeline))
@@ -0,0 +1,94 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from mongodb.mongo_connection import get_db
+from mongodb.alarm_queries import OPEN_ALARM_PROJECTION
+from utils.config import settings
+from utils.mongo_utils import ALARM_INDEXES, BULK_BATCH_SIZE, add_write_counts, batched, build_upsert_ops
+
+OPEN_FILTER = {"EsclationStatus": "OPEN"}
+
+# (database, collection) pairs whose indexes this process already ensured
+_indexed = set()
+
+
+def run(coro):
+    """Blocking entry point for sync callers (escalation, Streamlit jobs)."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+
+    # Already inside an event loop (e.g. a notebook) → run on a helper thread
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        return pool.submit(asyncio.run, coro).result()
+
+
+async def ensure_alarm_indexes(collection_name):
+    """Async counterpart of mongo_crud.ensure_alarm_indexes (TTNumber unique), once per collection and process."""
+    from pymongo import ASCENDING
+    from pymongo.errors import DuplicateKeyError
+
+    key = (settings.mongo_db, collection_name)
+    if key in _indexed:
+        return
+    collection = get_db()[collection_name]
+    for field, unique in ALARM_INDEXES:
+        try:
+            await collection.create_index([(field, ASCENDING)], unique=unique)
+        except DuplicateKeyError:
+            logging.error(f"❌ {collection_name} has duplicate {field} values; remove them so the unique index can be built")
+            await collection.create_index([(field, ASCENDING)])
+    _indexed.add(key)
+
+
+async def iter_open_alarms(collection_name, batch_size=1000, projection=OPEN_ALARM_PROJECTION, filters=None):
+    """
+    Async-iterate over open alarms in lists of up to `batch_size` documents.
+    Only projected fields are transferred, and the cursor streams from the server
+    instead of materializing the whole open set.
+    """
+    query = {**OPEN_FILTER, **(filters or {})}
+    cursor = get_db()[collection_name].find(query, projection, batch_size=batch_size)
+
+    batch = []
+    async for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def load_open_alarms_df(collection_name, **kwargs):
+    """Open alarms as a DataFrame, built batch by batch from iter_open_alarms."""
+    frames = [pd.DataFrame(batch) async for batch in iter_open_alarms(collection_name, **kwargs)]
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=list(OPEN_ALARM_PROJECTION)[1:])
+
+
+async def count_open_alarms(collection_name, filters=None):
+    return await get_db()[collection_name].count_documents({**OPEN_FILTER, **(filters or {})})
+
+
+async def upsert_alarms(records, collection_name, batch_size=BULK_BATCH_SIZE):
+    """
+    Async counterpart of mongo_crud.upsert_bulk_alarms: upsert on TTNumber with unordered
+    bulk_write batches. Returns counts of inserted, updated and unchanged documents.
+    """
+    counts = {"inserted": 0, "updated": 0, "unchanged": 0, "skipped": 0}
+    collection = get_db()[collection_name]
+    await ensure_alarm_indexes(collection_name)
+
+    for batch in batched(records, batch_size):
+        ops, skipped = build_upsert_ops(batch)
+        counts["skipped"] += skipped
+        if ops:
+            add_write_counts(counts, await collection.bulk_write(ops, ordered=False))
+
+    if counts["skipped"]:
+        logging.warning(f"⚠️ Skipped {counts['skipped']} alarms without TTNumber")
+    return counts
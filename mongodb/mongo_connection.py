@@ -1,11 +1,26 @@
-import os
+import asyncio
 from motor.motor_asyncio import AsyncIOMotorClient
-from dotenv import load_dotenv
 
-load_dotenv()
+from utils.config import settings
+from utils.mongo_utils import MONGO_CLIENT_OPTIONS
 
-MONGO_URI = os.getenv("MONGO_URI")
-DB_NAME = os.getenv("MONGO_DB")
+# Motor clients are bound to the event loop that first uses them, so one shared,
+# pool-tuned client is kept per running loop and created on first use.
+_clients = {}
 
-client = AsyncIOMotorClient(MONGO_URI)
-db = client[DB_NAME]
+
+def get_client():
+    """Shared AsyncIOMotorClient for the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        # Drop clients whose loop has finished (e.g. earlier asyncio.run calls)
+        for old_loop in [l for l in _clients if l.is_closed()]:
+            _clients.pop(old_loop).close()
+        client = _clients[loop] = AsyncIOMotorClient(settings.mongo_uri, **MONGO_CLIENT_OPTIONS)
+    return client
+
+
+def get_db():
+    """Database handle on the shared async client."""
+    return get_client()[settings.mongo_db]
@@ -1,22 +1,37 @@
-import os
-from pymongo import MongoClient
-import streamlit as st
-from dotenv import load_dotenv
+import logging
+import threading
+from datetime import datetime
 
-# Load .env if running locally
-load_dotenv()
+from utils.config import settings
+from utils.mongo_utils import (
+    ALARM_INDEXES, BULK_BATCH_SIZE, MONGO_CLIENT_OPTIONS, add_write_counts, batched, build_upsert_ops,
+)
+from utils.instrumentation import count, span, traced
 
-# Read Mongo URI and DB name from secrets or env
-if "MONGO_URI" in st.secrets:
-    MONGO_URI = st.secrets["MONGO_URI"]
-    MONGO_DB = st.secrets["MONGO_DB"]
-else:
-    MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
-    MONGO_DB = os.getenv("MONGO_DB", "TELCOM_AI")
+# Connect lazily: one pooled client per process, created on first use (not at import);
+# pymongo itself and the Mongo URI/DB from secrets or env are only loaded then too
+_client = None
+_client_lock = threading.Lock()
 
-# Connect
-client = MongoClient(MONGO_URI)
-db = client[MONGO_DB]  # explicitly define DB
+# (database, collection) pairs whose indexes this process already ensured
+_indexed = set()
+
+# Server codes for an existing index on the same key with other options (e.g. not unique)
+_INDEX_CONFLICT_CODES = (85, 86)
+
+
+def get_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from pymongo import MongoClient
+                _client = MongoClient(settings.mongo_uri, **MONGO_CLIENT_OPTIONS)
+    return _client
+
+
+def get_db():
+    return get_client()[settings.mongo_db]
 
 
 # Insert alarms
@@ -24,13 +39,108 @@ def insert_bulk_alarms(records, collection_name):
     """Insert multiple alarms into MongoDB and return count only."""
     if not records:
         return 0
-    collection = db[collection_name]
+    collection = get_db()[collection_name]
     result = collection.insert_many(records)
     return len(result.inserted_ids)   # ✅ return just the count
 
 
+def _create_index(collection, keys, unique):
+    from pymongo.errors import OperationFailure
+
+    try:
+        collection.create_index(keys, unique=unique)
+    except OperationFailure as e:
+        if e.code not in _INDEX_CONFLICT_CODES:
+            raise
+        # Replace the older index on the same key (created before TTNumber was unique)
+        collection.drop_index(keys)
+        collection.create_index(keys, unique=unique)
+
+
+def ensure_alarm_indexes(collection_name):
+    """
+    Create the indexes needed for upserts and open-alarm lookups, once per collection and process.
+    TTNumber is unique, so two concurrent upserts of a new alarm cannot insert it twice.
+    """
+    key = (settings.mongo_db, collection_name)
+    if key in _indexed:
+        return
+    from pymongo import ASCENDING
+    from pymongo.errors import DuplicateKeyError
+
+    collection = get_db()[collection_name]
+    for field, unique in ALARM_INDEXES:
+        keys = [(field, ASCENDING)]
+        try:
+            _create_index(collection, keys, unique)
+        except DuplicateKeyError:
+            logging.error(f"❌ {collection_name} has duplicate {field} values; remove them so the unique index can be built")
+            collection.create_index(keys)  # plain index meanwhile, lookups stay fast
+    _indexed.add(key)
+
+
+# Upsert alarms
+@traced("mongo_upsert")
+def upsert_bulk_alarms(records, collection_name, batch_size=BULK_BATCH_SIZE, progress=None):
+    """
+    Idempotently load alarms: upsert on TTNumber with unordered bulk_write batches.
+    Re-uploading the same export updates documents in place instead of duplicating them.
+    `records` may be any iterable of dicts (e.g. a generator).
+    progress(counts, done) is called after every batch with the records processed so far.
+    Returns counts of inserted, updated and unchanged documents.
+    """
+    counts = {"inserted": 0, "updated": 0, "unchanged": 0, "skipped": 0}
+    collection = get_db()[collection_name]
+    with span("mongo.ensure_indexes"):
+        ensure_alarm_indexes(collection_name)
+
+    done = 0
+    for batch in batched(records, batch_size):
+        ops, skipped = build_upsert_ops(batch)
+        counts["skipped"] += skipped
+        if ops:
+            with span("mongo.bulk_write"):
+                add_write_counts(counts, collection.bulk_write(ops, ordered=False))
+        done += len(batch)
+        if progress:
+            progress(counts, done)
+
+    for result, n in counts.items():
+        count("mongo_documents_total", n, result=result)
+
+    if counts["skipped"]:
+        logging.warning(f"⚠️ Skipped {counts['skipped']} alarms without TTNumber")
+    return counts
+
+
+# Close cleared alarms
+def close_cleared_alarms(tt_numbers, collection_name, cleared_at=None):
+    """
+    Mark OPEN alarms that are no longer in the export as CLOSED (with ClearedDateTime),
+    so the open-alarm queries stop counting them. Returns the number of documents closed.
+    """
+    tt_numbers = list(tt_numbers)
+    if not tt_numbers:
+        return 0
+    collection = get_db()[collection_name]
+    cleared_at = cleared_at or datetime.now().replace(microsecond=0)
+    closed = 0
+    for batch in batched(tt_numbers, BULK_BATCH_SIZE):
+        with span("mongo.close_cleared"):
+            result = collection.update_many(
+                {"TTNumber": {"$in": batch}, "EsclationStatus": "OPEN"},
+                {"$set": {"EsclationStatus": "CLOSED", "ClearedDateTime": cleared_at}},
+            )
+        closed += result.modified_count
+    count("mongo_documents_total", closed, result="closed")
+    return closed
+
+
 # Get open alarms
-def get_open_alarms(collection_name):
-    """Fetch alarms with EsclationStatus OPEN."""
-    collection = db[collection_name]
-    return list(collection.find({"EsclationStatus": "OPEN"}))
+def get_open_alarms(collection_name, projection=None):
+    """
+    Fetch alarms with EsclationStatus OPEN.
+    Prefer mongodb.alarm_queries for filtered, paged or aggregated access.
+    """
+    collection = get_db()[collection_name]
+    return list(collection.find({"EsclationStatus": "OPEN"}, projection))
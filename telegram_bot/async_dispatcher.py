@@ -0,0 +1,151 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.config import settings, TELEGRAM_CONCURRENCY, TELEGRAM_MAX_RETRIES
+from telegram_bot.rate_limiter import limiter, is_retryable, retry_delay
+from utils.instrumentation import count, span
+from telegram_bot.telegram_utils import (
+    is_valid_chat_id,
+    resolve_target_chat,
+    split_message,
+    telegram_api_url,
+)
+
+REQUEST_TIMEOUT = 30  # seconds per Bot API call
+
+# Lower value = sent first. Site-down/CE alerts go out before routine Technician messages.
+ROLE_PRIORITY = {"Cluster Engineer": 0, "Supervisor": 1, "Technician": 2}
+
+
+# ---------------------------
+# Jobs
+# ---------------------------
+def make_job(chat_id, text, role, alarms=0, priority=None, deliveries=None, parts=None):
+    """
+    Bundle one recipient's message so it can be dispatched concurrently with others.
+    `deliveries` optionally carries the ledger rows this message covers; after dispatch
+    `job["delivered"]` tells whether every chunk went out. `parts` are chunks packed by the
+    caller (e.g. digests); otherwise the text is split with split_message.
+    """
+    if priority is None:
+        priority = ROLE_PRIORITY.get(role, len(ROLE_PRIORITY))
+    if deliveries is not None and not alarms:
+        alarms = len(deliveries)
+    return {
+        "chat_id": chat_id, "text": text, "role": role, "alarms": alarms,
+        "priority": priority, "deliveries": deliveries, "delivered": False, "parts": parts,
+    }
+
+
+# ---------------------------
+# Async Send Helpers
+# ---------------------------
+async def _post_message(session, target_chat, text, api_url, parse_mode="HTML"):
+    """POST one chunk to the Bot API. Returns (status, body); status is None on network errors."""
+    import aiohttp
+
+    payload = {"chat_id": target_chat, "text": text, "parse_mode": parse_mode}
+    try:
+        async with session.post(api_url, data=payload) as response:
+            return response.status, await response.text()
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        return None, str(e)
+
+
+async def _send_chunk(session, chat_id, text, api_url):
+    """Rate-limited send with retries. Redirect to TEST_CHAT_ID if TEST_MODE is enabled."""
+    target_chat = resolve_target_chat(chat_id)
+
+    for attempt in range(TELEGRAM_MAX_RETRIES + 1):
+        with span("telegram.rate_limit_wait"):
+            await limiter.acquire_async(target_chat)
+        with span("telegram.round_trip"):
+            status, body = await _post_message(session, target_chat, text, api_url)
+        count("telegram_requests_total", status=status or "error")
+
+        if status == 200:
+            count("telegram_messages_total", result="sent")
+            logging.info(f"✅ Sent message to {target_chat} ({'TEST' if settings.test_mode else 'LIVE'})")
+            return True
+        if not is_retryable(status) or attempt == TELEGRAM_MAX_RETRIES:
+            break
+
+        delay = retry_delay(status, body, attempt)
+        if status == 429:
+            limiter.pause(target_chat, delay)
+        logging.warning(f"⏳ Retry {attempt + 1}/{TELEGRAM_MAX_RETRIES} for {target_chat} in {delay:.1f}s ({status})")
+        await asyncio.sleep(delay)
+
+    count("telegram_messages_total", result="failed")
+    logging.error(f"❌ Failed to send to {target_chat}: {body}")
+    return False
+
+
+async def _send_job(session, job, api_url, progress=None):
+    """
+    Send every chunk of a job in order. Returns True only if all chunks were delivered.
+    progress(job, n) is called after the n-th chunk went out.
+    """
+    if not is_valid_chat_id(job["chat_id"]):
+        return False
+    chat_id = int(job["chat_id"])
+    for n, part in enumerate(job["parts"] or split_message(job["text"]), 1):
+        if not await _send_chunk(session, chat_id, part, api_url):
+            return False
+        if progress:
+            progress(job, n)
+    return True
+
+
+async def dispatch_jobs(jobs, concurrency=TELEGRAM_CONCURRENCY, api_url=None, progress=None):
+    """
+    Send all jobs over one pooled HTTP session using `concurrency` workers that pull from a
+    priority queue, so higher-priority messages are sent first. Returns delivered alarm counts per role.
+    """
+    import aiohttp  # only loaded once something is actually sent
+
+    api_url = api_url or telegram_api_url()
+    queue = asyncio.PriorityQueue()
+    for seq, job in enumerate(jobs):
+        queue.put_nowait((job["priority"], seq, job))
+
+    results = {}
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+
+        async def worker():
+            while not queue.empty():
+                _, seq, job = queue.get_nowait()
+                results[seq] = await _send_job(session, job, api_url, progress)
+
+        await asyncio.gather(*(worker() for _ in range(min(concurrency, len(jobs)))))
+
+    counts, failed = {}, 0
+    for seq, job in enumerate(jobs):
+        counts.setdefault(job["role"], 0)
+        job["delivered"] = results.get(seq, False)
+        if job["delivered"]:
+            counts[job["role"]] += job["alarms"]
+        else:
+            failed += 1
+
+    if failed:
+        logging.warning(f"⚠️ {failed} of {len(jobs)} escalation messages were not delivered")
+    return counts
+
+
+def run_dispatch(jobs, **kwargs):
+    """Blocking entry point for sync callers (CLI, Streamlit button handlers)."""
+    if not jobs:
+        return {}
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(dispatch_jobs(jobs, **kwargs))
+
+    # Already inside an event loop (e.g. a notebook) → run on a helper thread
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        return pool.submit(asyncio.run, dispatch_jobs(jobs, **kwargs)).result()
@@ -1,6 +1,27 @@
 import pandas as pd
-from utils.config import CLEANED_ALARM_FILE, MAPPING_FILE
-from telegram_bot.telegram_utils import send_site_message
+from utils.config import (
+    CLEANED_ALARM_FILE, MAPPING_FILE, ESCALATION_INCREMENTAL, SEND_CLEARED_NOTICES, ESCALATION_DIGEST,
+    OUTAGE_CORRELATION, OUTBOX_ENABLED, ESCALATION_SOURCE, ALARM_COLLECTION,
+)
+from telegram_bot.telegram_utils import (
+    SITE_INFO_COLUMNS, build_site_header, build_cleared_message, build_digest, build_incident_message,
+    render_alarm_lines, render_digest_lines, render_outage_site_lines, render_site_titles,
+)
+from telegram_bot.outage_correlation import correlate_outages, summarize_incidents
+from telegram_bot.async_dispatcher import make_job, run_dispatch
+from telegram_bot.escalation_ledger import LEDGER_KEYS, get_ledger, diff_deliveries, find_cleared, stamp
+from telegram_bot.escalation_rules import get_rules
+from utils.mapping_cache import load_mapping
+from utils.alarm_store import read_processed_alarms
+from utils.instrumentation import count, instrumented, span, traced
+
+# Chat-id column in the mapping file for each escalation role, and its escalation level
+ROLE_CHAT_COLUMNS = {
+    "Technician": "Technician_Chat_id",
+    "Supervisor": "Supervisor_Chat_id",
+    "Cluster Engineer": "CE_Chat_id",
+}
+ROLE_LEVEL = {"Technician": 1, "Supervisor": 2, "Cluster Engineer": 3}
 
 
 def valid_chat_id(x):
@@ -11,21 +32,30 @@ def valid_chat_id(x):
         return None
 
 
-def load_and_merge():
-    """Load alarms + mapping files, normalize columns, merge and return final DataFrame."""
-    alarm_df = pd.read_csv(CLEANED_ALARM_FILE)
-    mapping_df = pd.read_excel(MAPPING_FILE)
+@instrumented("escalation.load_and_merge")
+def load_and_merge(alarm_df=None, source=ESCALATION_SOURCE):
+    """
+    Load alarms + cached mapping, normalize columns, join on GLOBAL_ID and return final DataFrame.
+    alarm_df (an already cleaned frame) is used instead of reading CLEANED_ALARM_FILE when given;
+    source="mongo" reads the OPEN alarms of ALARM_COLLECTION instead of the file.
+    """
+    if alarm_df is None and source == "mongo":
+        from mongodb.async_repository import load_open_alarms_df, run
+        alarm_df = run(load_open_alarms_df(ALARM_COLLECTION))  # projected fields, streamed in batches
+    elif alarm_df is None:
+        alarm_df = read_processed_alarms(CLEANED_ALARM_FILE)  # Parquet (typed) or CSV fallback
+    else:
+        alarm_df = alarm_df.copy(deep=False)  # caller's frame is left untouched
+    mapping_df = load_mapping(MAPPING_FILE)  # normalized + indexed by GLOBAL_ID
 
     # Normalize columns
     alarm_df.columns = alarm_df.columns.str.strip().str.replace(" ", "_")
-    mapping_df.columns = mapping_df.columns.str.strip().str.replace(" ", "_")
 
     # Ensure IDs are strings
     alarm_df["SiteID"] = alarm_df["SiteID"].astype(str)
-    mapping_df["GLOBAL_ID"] = mapping_df["GLOBAL_ID"].astype(str)
 
-    # Merge
-    merged_df = pd.merge(alarm_df, mapping_df, left_on="SiteID", right_on="GLOBAL_ID", how="left")
+    # Indexed left join (same result as merging SiteID onto GLOBAL_ID)
+    merged_df = alarm_df.join(mapping_df, on="SiteID", lsuffix="_x", rsuffix="_y").reset_index(drop=True)
 
     # Normalize OpenTime & EventName
     merged_df["OpenTime"] = pd.to_datetime(merged_df["OpenTime"], errors="coerce")
@@ -34,44 +64,224 @@ def load_and_merge():
     return merged_df
 
 
-def escalate_alarms():
-    df = load_and_merge()
+@instrumented("escalation.plan_deliveries")
+def plan_deliveries(df, rules=None, now=None):
+    """
+    One row per (alarm, recipient) that is due for escalation, with the merged-frame row it came from.
+    Which roles are due is decided by the escalation matrix rules from the age of each alarm.
+    """
+    rules = rules or get_rules()
+    due = rules.due(df, now=now)
+
+    parts = []
+    for role, col in ROLE_CHAT_COLUMNS.items():
+        if col not in df or role not in due:
+            continue
+        role_df = df[due[role].to_numpy()]
+        part = pd.DataFrame({
+            "row": role_df.index,
+            "TTNumber": role_df["TTNumber"].astype(str).to_numpy(),
+            "SiteID": role_df["SiteID"].to_numpy(),
+            "EventName": role_df["EventName"].to_numpy(),
+            "chat_id": role_df[col].map(valid_chat_id).to_numpy(),
+            "role": role,
+            "level": ROLE_LEVEL[role],
+        })
+        part = part[part["chat_id"].notna() & (part["chat_id"] != 0)]
+        parts.append(part.astype({"chat_id": "int64"}))
+
+    if not parts:
+        return pd.DataFrame(columns=["row", "TTNumber", "SiteID", "EventName", "chat_id", "role", "level"])
+    return pd.concat(parts, ignore_index=True)
+
+
+@instrumented("escalation.build_jobs")
+def build_jobs(df, deliveries):
+    """
+    One job per (site, role, recipient) covering the alarms planned for that recipient.
+    Alarm lines are rendered once for the whole frame, and a message is built once per
+    distinct content and reused for every recipient who gets the same alarms.
+    """
+    alarm_lines = render_alarm_lines(df).to_numpy(dtype=object)
+    site_info = df[[c for c in SITE_INFO_COLUMNS if c in df]]
+    deliveries = deliveries.assign(pos=df.index.get_indexer(deliveries["row"]))
+    messages = {}
+
+    jobs = []
+    for (site_id, role, chat_id), group in deliveries.groupby(["SiteID", "role", "chat_id"], sort=False):
+        pos = group["pos"].to_numpy()
+        key = (site_id, role, pos.tobytes())
+        if key not in messages:
+            header = build_site_header(site_id, site_info.iloc[pos[0]:pos[0] + 1], role, site_down=(role == "Cluster Engineer"))
+            messages[key] = header + "".join(alarm_lines[pos])
+        jobs.append(make_job(chat_id, messages[key], role, deliveries=group.index))
+    return jobs
+
+
+@instrumented("escalation.build_digest_jobs")
+def build_digest_jobs(df, deliveries):
+    """
+    One digest per (recipient, role) instead of one message per site: a section per site,
+    packed into as few Telegram messages as possible. Same alarms, far fewer API calls for
+    recipients who cover many sites.
+    """
+    alarm_lines = render_digest_lines(df).to_numpy(dtype=object)
+    site_titles = render_site_titles(df).to_numpy(dtype=object)
+    deliveries = deliveries.assign(pos=df.index.get_indexer(deliveries["row"]))
+
+    jobs = []
+    for (chat_id, role), group in deliveries.groupby(["chat_id", "role"], sort=False):
+        sections = [
+            (site_titles[pos[0]], alarm_lines[pos])
+            for pos in (site["pos"].to_numpy() for _, site in group.groupby("SiteID", sort=False))
+        ]
+        parts = build_digest(role, sections)
+        jobs.append(make_job(chat_id, "".join(parts), role, deliveries=group.index, parts=parts))
+    return jobs
+
+
+def _alerted_sites(df, incident, sent):
+    """(CE chat, incident) → incident sites whose alarms that CE already received (per `sent`)."""
+    if sent is None or sent.empty:
+        return {}
+    member = incident.notna().to_numpy()
+    alarms = pd.DataFrame({
+        "TTNumber": df["TTNumber"].astype(str).to_numpy()[member],
+        "SiteID": df["SiteID"].astype(str).to_numpy()[member],
+        "incident": incident[member].astype("int64").to_numpy(),
+    })
+    received = alarms.merge(sent.loc[sent["role"] == "Cluster Engineer", ["TTNumber", "chat_id"]], on="TTNumber")
+    return {key: set(group["SiteID"]) for key, group in received.groupby(["chat_id", "incident"])}
+
+
+@instrumented("escalation.build_incident_jobs")
+def build_incident_jobs(df, deliveries, incident, sent=None):
+    """
+    One alert per (CE, mass outage) listing the affected sites, instead of a Site Down Alert
+    per site. incident is correlate_outages(df); sent holds deliveries already made (ledger and
+    queued outbox rows) so later sites go out as an update. A single site of an incident the CE
+    has not heard about stays a regular Site Down Alert.
+    Returns (jobs, deliveries not covered by them).
+    """
+    row_incident = incident.reindex(deliveries["row"]).to_numpy()
+    correlated = (deliveries["role"] == "Cluster Engineer").to_numpy() & pd.notna(row_incident)
+    if not correlated.any():
+        return [], deliveries
+
+    incidents = summarize_incidents(df, incident)
+    alerted = _alerted_sites(df, incident, sent)
+    outage_deliveries = deliveries[correlated].assign(incident=row_incident[correlated].astype("int64"))
+    jobs, covered = [], []
+    for (chat_id, number), group in outage_deliveries.groupby(["chat_id", "incident"], sort=False):
+        sites = set(df.loc[group["row"], "SiteID"].astype(str))
+        earlier = alerted.get((chat_id, number), set()) - sites
+        if len(sites) < 2 and not earlier:
+            continue
+        parts = build_incident_message(incidents.loc[number], render_outage_site_lines(df.loc[group["row"]]),
+                                       alerted=len(earlier))
+        jobs.append(make_job(chat_id, "".join(parts), "Cluster Engineer", deliveries=group.index, parts=parts))
+        covered.append(group.index)
+    if not jobs:
+        return [], deliveries
+    return jobs, deliveries.drop(index=covered[0].append(covered[1:]))
+
+
+def build_cleared_jobs(cleared):
+    """One cleared notice per recipient, listing each cleared alarm once."""
+    jobs = []
+    for chat_id, group in cleared.drop_duplicates(["TTNumber", "chat_id"]).groupby("chat_id"):
+        jobs.append(make_job(chat_id, build_cleared_message(group), "Cleared", alarms=len(group)))
+    return jobs
+
+
+@traced("escalation")
+def escalate_alarms(incremental=ESCALATION_INCREMENTAL, send_cleared=SEND_CLEARED_NOTICES, alarm_df=None,
+                    digest=ESCALATION_DIGEST, correlate=OUTAGE_CORRELATION, outbox=OUTBOX_ENABLED):
+    """
+    Escalate active alarms to Technician, Supervisor and CE chats.
+    In incremental mode only alarms not yet sent to a recipient (or newly reached levels)
+    are sent, and delivered messages are recorded in the escalation ledger.
+    alarm_df escalates a cleaned batch held in memory instead of the processed file.
+    digest=True sends each recipient one digest covering all their sites (build_digest_jobs).
+    correlate=True sends mass outages (correlate_outages) to the CE as one alert per incident.
+    outbox=True only enqueues the messages in the outbox (telegram_bot.outbox); its workers
+    deliver them and record the ledger. Returns the queued counts in that case.
+    """
+    df = load_and_merge(alarm_df)
 
     print("✅ Columns after merge:", df.columns.tolist())
     print("🔍 Total alarms loaded:", len(df))
 
-    tech_count, sup_count, ce_count = 0, 0, 0
-
-    # --- Group per SiteID ---
-    for site_id, site_df in df.groupby("SiteID"):
-
-        # Technician escalation → ALL alarms for this site
-        tech_ids = site_df["Technician_Chat_id"].dropna().unique() if "Technician_Chat_id" in site_df else []
-        for tid in tech_ids:
-            cid = valid_chat_id(tid)
-            if cid:
-                send_site_message(cid, site_id, site_df, "Technician")
-                tech_count += len(site_df)
-
-        # Supervisor escalation → ALL alarms for this site
-        sup_ids = site_df["Supervisor_Chat_id"].dropna().unique() if "Supervisor_Chat_id" in site_df else []
-        for sid in sup_ids:
-            cid = valid_chat_id(sid)
-            if cid:
-                send_site_message(cid, site_id, site_df, "Supervisor")
-                sup_count += len(site_df)
-
-        # CE escalation → ONLY outages (2G/3G/4G)
-        ce_df = site_df[site_df["EventName"].str.contains("2G OUTAGE|3G OUTAGE|4G OUTAGE", na=False)]
-        ce_ids = ce_df["CE_Chat_id"].dropna().unique() if "CE_Chat_id" in ce_df else []
-        for ceid in ce_ids:
-            cid = valid_chat_id(ceid)
-            if cid:
-                send_site_message(cid, site_id, ce_df, "Cluster Engineer", site_down=True)
-                ce_count += len(ce_df)
+    deliveries = plan_deliveries(df)
+
+    ledger = ledger_df = known = None
+    box = None
+    if outbox:
+        from telegram_bot.outbox import Outbox
+        box = Outbox()
+    count("escalation_alarms_total", len(df))
+    count("escalation_deliveries_planned_total", len(deliveries))
+
+    if incremental:
+        with span("escalation.ledger_diff"):
+            ledger = get_ledger()
+            ledger_df = ledger.load()
+            planned = len(deliveries)
+            known = ledger_df  # delivered, or queued for delivery
+            if box:
+                # Queued but not yet delivered counts as sent, so reruns don't queue it again
+                known = pd.concat([ledger_df[LEDGER_KEYS + ["level"]], box.pending_deliveries()], ignore_index=True)
+                known = known.groupby(LEDGER_KEYS, as_index=False)["level"].max()
+            deliveries = diff_deliveries(deliveries, known)
+        print(f"🧾 Ledger ({ledger.name}): {len(deliveries)} new of {planned} planned deliveries")
+
+    jobs, regular = [], deliveries
+    if correlate:
+        with span("escalation.correlate"):
+            incident = correlate_outages(df)
+        jobs, regular = build_incident_jobs(df, deliveries, incident, sent=known)
+        if jobs:
+            print(f"🧩 Mass outages: {len(deliveries) - len(regular)} site-down alerts collapsed into {len(jobs)} incident alerts")
+
+    site_jobs = (build_digest_jobs if digest else build_jobs)(df, regular)
+    if digest:
+        print(f"📦 Digest mode: {len(site_jobs)} digests ({sum(len(job['parts']) for job in site_jobs)} messages) "
+              f"for {regular['SiteID'].nunique()} sites")
+    jobs += site_jobs
+
+    cleared = None
+    if incremental:
+        cleared = find_cleared(ledger_df, df["TTNumber"].astype(str))
+        if send_cleared and not cleared.empty:
+            jobs += build_cleared_jobs(cleared)
+
+    # --- Send everything concurrently over one pooled session ---
+    count("escalation_jobs_total", len(jobs))
+    if box:
+        with span("escalation.enqueue"):
+            counts = box.enqueue(jobs, deliveries if incremental else None)
+        if incremental:
+            ledger.remove(cleared["TTNumber"].unique())
+        print(f"📮 Queued {len(jobs)} messages in the outbox → 👷 Technician: {counts.get('Technician', 0)}, "
+              f"🧑‍💼 Supervisor: {counts.get('Supervisor', 0)}, 👷‍♂️ CE: {counts.get('Cluster Engineer', 0)}")
+        return counts
+
+    with span("escalation.dispatch"):
+        counts = run_dispatch(jobs)
+
+    if incremental:
+        with span("escalation.ledger_record"):
+            delivered = [i for job in jobs if job["delivered"] and job["deliveries"] is not None for i in job["deliveries"]]
+            ledger.record(stamp(deliveries.loc[delivered].drop(columns="row")))
+            ledger.remove(cleared["TTNumber"].unique())
+
+    tech_count = counts.get("Technician", 0)
+    sup_count = counts.get("Supervisor", 0)
+    ce_count = counts.get("Cluster Engineer", 0)
 
     # ✅ Final status
     print(f"📢 Escalation completed → 👷 Technician: {tech_count}, 🧑‍💼 Supervisor: {sup_count}, 👷‍♂️ CE: {ce_count}")
+    return counts
 
 
 if __name__ == "__main__":
@@ -0,0 +1,293 @@
+import os
+import logging
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+
+from utils.config import settings, LEDGER_BACKEND, LEDGER_COLLECTION, LEDGER_SQLITE_FILE
+from utils.mongo_utils import get_probe_client
+
+# Ledger key: one row per alarm per recipient (chat + role)
+LEDGER_KEYS = ["TTNumber", "chat_id", "role"]
+LEDGER_COLUMNS = LEDGER_KEYS + ["level", "SiteID", "EventName", "sent_at"]
+
+
+def empty_ledger():
+    """Empty ledger frame with the dtypes used for diffing."""
+    return pd.DataFrame({
+        "TTNumber": pd.Series(dtype=str),
+        "chat_id": pd.Series(dtype="int64"),
+        "role": pd.Series(dtype=str),
+        "level": pd.Series(dtype="int64"),
+        "SiteID": pd.Series(dtype=str),
+        "EventName": pd.Series(dtype=str),
+        "sent_at": pd.Series(dtype=str),
+    })
+
+
+def _normalize(df):
+    """Coerce ledger rows to the canonical column set and dtypes."""
+    if df is None or df.empty:
+        return empty_ledger()
+    df = df.reindex(columns=LEDGER_COLUMNS)
+    df["TTNumber"] = df["TTNumber"].astype(str)
+    df["chat_id"] = df["chat_id"].astype("int64")
+    df["level"] = df["level"].astype("int64")
+    df["SiteID"] = df["SiteID"].astype(str)
+    return df
+
+
+# ---------------------------
+# Backends
+# ---------------------------
+class MongoLedger:
+    """Ledger stored in the EscalationLedger collection."""
+
+    name = "mongo"
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.collection.create_index([(k, 1) for k in LEDGER_KEYS], unique=True)
+
+    def load(self):
+        projection = {c: 1 for c in LEDGER_COLUMNS}
+        projection["_id"] = 0
+        return _normalize(pd.DataFrame(list(self.collection.find({}, projection))))
+
+    def record(self, rows):
+        from pymongo import UpdateOne
+
+        if rows.empty:
+            return 0
+        ops = [
+            UpdateOne({k: doc[k] for k in LEDGER_KEYS}, {"$set": doc}, upsert=True)
+            for doc in _normalize(rows).to_dict(orient="records")
+        ]
+        self.collection.bulk_write(ops, ordered=False)
+        return len(ops)
+
+    def remove(self, tt_numbers):
+        if not len(tt_numbers):
+            return 0
+        return self.collection.delete_many({"TTNumber": {"$in": list(tt_numbers)}}).deleted_count
+
+
+class SQLiteLedger:
+    """
+    Ledger in a single SQLite file: the store for LEDGER_BACKEND=sqlite and the mirror of the
+    Mongo ledger in auto mode. Changes MongoDB missed while it was down are queued in
+    ledger_pending_records / ledger_pending_removals until MirroredLedger replays them.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path=LEDGER_SQLITE_FILE):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS escalation_ledger ("
+                " TTNumber TEXT NOT NULL, chat_id INTEGER NOT NULL, role TEXT NOT NULL,"
+                " level INTEGER NOT NULL, SiteID TEXT, EventName TEXT, sent_at TEXT,"
+                " PRIMARY KEY (TTNumber, chat_id, role))"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS ledger_pending_records ("
+                " id INTEGER PRIMARY KEY, TTNumber TEXT NOT NULL, chat_id INTEGER NOT NULL, role TEXT NOT NULL)"
+            )
+            conn.execute("CREATE TABLE IF NOT EXISTS ledger_pending_removals (id INTEGER PRIMARY KEY, TTNumber TEXT NOT NULL)")
+
+    @contextmanager
+    def _connect(self):
+        """Connection that commits on success, rolls back on error and is always closed."""
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def load(self):
+        with self._connect() as conn:
+            df = pd.read_sql_query(f"SELECT {', '.join(LEDGER_COLUMNS)} FROM escalation_ledger", conn)
+        return _normalize(df)
+
+    def record(self, rows):
+        if rows.empty:
+            return 0
+        rows = _normalize(rows)
+        with self._connect() as conn:
+            conn.executemany(
+                f"INSERT INTO escalation_ledger ({', '.join(LEDGER_COLUMNS)}) VALUES ({', '.join('?' * len(LEDGER_COLUMNS))})"
+                " ON CONFLICT (TTNumber, chat_id, role) DO UPDATE SET"
+                " level = excluded.level, SiteID = excluded.SiteID,"
+                " EventName = excluded.EventName, sent_at = excluded.sent_at",
+                rows.itertuples(index=False, name=None),
+            )
+        return len(rows)
+
+    def remove(self, tt_numbers):
+        if not len(tt_numbers):
+            return 0
+        with self._connect() as conn:
+            conn.execute("CREATE TEMP TABLE cleared (TTNumber TEXT PRIMARY KEY)")
+            conn.executemany("INSERT OR IGNORE INTO cleared VALUES (?)", ((str(t),) for t in tt_numbers))
+            cur = conn.execute("DELETE FROM escalation_ledger WHERE TTNumber IN (SELECT TTNumber FROM cleared)")
+            return cur.rowcount
+
+    def replace(self, rows):
+        """Make the file an exact copy of rows (the Mongo ledger after a successful load)."""
+        rows = _normalize(rows)
+        with self._connect() as conn:
+            conn.execute("DELETE FROM escalation_ledger")
+            conn.executemany(
+                f"INSERT INTO escalation_ledger ({', '.join(LEDGER_COLUMNS)}) VALUES ({', '.join('?' * len(LEDGER_COLUMNS))})",
+                rows.itertuples(index=False, name=None),
+            )
+
+    # --- Changes MongoDB has not seen yet ---
+    def queue_records(self, rows):
+        keys = _normalize(rows)[LEDGER_KEYS]
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT INTO ledger_pending_records (TTNumber, chat_id, role) VALUES (?, ?, ?)",
+                keys.itertuples(index=False, name=None),
+            )
+
+    def queue_removals(self, tt_numbers):
+        with self._connect() as conn:
+            conn.executemany("INSERT INTO ledger_pending_removals (TTNumber) VALUES (?)", ((str(t),) for t in tt_numbers))
+
+    def pending(self):
+        """(removed TTNumbers, recorded ledger rows, marker for clear_pending) queued so far."""
+        with self._connect() as conn:
+            upto = conn.execute(
+                "SELECT (SELECT COALESCE(MAX(id), 0) FROM ledger_pending_removals),"
+                " (SELECT COALESCE(MAX(id), 0) FROM ledger_pending_records)"
+            ).fetchone()
+            removed = [r[0] for r in conn.execute(
+                "SELECT DISTINCT TTNumber FROM ledger_pending_removals WHERE id <= ?", (upto[0],)
+            )]
+            recorded = pd.read_sql_query(
+                f"SELECT DISTINCT {', '.join('l.' + c for c in LEDGER_COLUMNS)} FROM escalation_ledger l"
+                " JOIN ledger_pending_records p USING (TTNumber, chat_id, role) WHERE p.id <= ?",
+                conn, params=upto[1:],
+            )
+        return removed, _normalize(recorded), upto
+
+    def clear_pending(self, upto):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM ledger_pending_removals WHERE id <= ?", (upto[0],))
+            conn.execute("DELETE FROM ledger_pending_records WHERE id <= ?", (upto[1],))
+
+
+class MirroredLedger:
+    """
+    LEDGER_BACKEND=auto: the Mongo ledger, mirrored into SQLite on every change.
+    While MongoDB is unreachable the mirror is used instead (not an empty or stale store, which
+    would make every alarm look unsent), and the changes made meanwhile are replayed into
+    MongoDB on the first load after it is back.
+    """
+
+    def __init__(self, mirror=None):
+        self.mirror = mirror or SQLiteLedger()
+        self._mongo = None
+        self.name = "mongo"
+
+    def _primary(self):
+        """MongoLedger when MongoDB answers the ping (checked on every call), else None."""
+        try:
+            client = get_probe_client()  # short timeout: switch to the mirror quickly
+            client.admin.command("ping")
+            if self._mongo is None:
+                self._mongo = MongoLedger(client[settings.mongo_db][LEDGER_COLLECTION])
+            self.name = "mongo"
+            return self._mongo
+        except Exception as e:
+            if self.name == "mongo":
+                logging.warning(f"⚠️ MongoDB ledger unavailable ({e}). Using the SQLite mirror.")
+            self.name = "sqlite mirror"
+            return None
+
+    def load(self):
+        mongo = self._primary()
+        if mongo is not None:
+            try:
+                removed, recorded, upto = self.mirror.pending()
+                if removed or not recorded.empty:
+                    logging.info(f"🔁 Replaying {len(recorded)} ledger rows and {len(removed)} removals into MongoDB")
+                    mongo.remove(removed)
+                    mongo.record(recorded)
+                    self.mirror.clear_pending(upto)
+                df = mongo.load()
+                self.mirror.replace(df)
+                return df
+            except Exception as e:
+                logging.warning(f"⚠️ MongoDB ledger failed ({e}). Using the SQLite mirror.")
+                self.name = "sqlite mirror"
+        return self.mirror.load()
+
+    def record(self, rows):
+        n = self.mirror.record(rows)
+        if not self._write("record", rows):
+            self.mirror.queue_records(rows)
+        return n
+
+    def remove(self, tt_numbers):
+        n = self.mirror.remove(tt_numbers)
+        if len(tt_numbers) and not self._write("remove", tt_numbers):
+            self.mirror.queue_removals(tt_numbers)
+        return n
+
+    def _write(self, method, arg):
+        """Apply the change to MongoDB too; False when it has to be replayed later."""
+        mongo = self._primary()
+        if mongo is None:
+            return False
+        try:
+            getattr(mongo, method)(arg)
+            return True
+        except Exception as e:
+            logging.warning(f"⚠️ MongoDB ledger {method} failed ({e}); queued for replay.")
+            return False
+
+
+def get_ledger(backend=LEDGER_BACKEND):
+    """
+    auto: Mongo ledger with a SQLite mirror that takes over while MongoDB is down (MirroredLedger);
+    mongo: MongoDB only (raises when unreachable); sqlite: the local file only.
+    """
+    if backend == "auto":
+        return MirroredLedger()
+    if backend == "mongo":
+        client = get_probe_client()
+        client.admin.command("ping")
+        return MongoLedger(client[settings.mongo_db][LEDGER_COLLECTION])
+    return SQLiteLedger()
+
+
+# ---------------------------
+# Diffing
+# ---------------------------
+def diff_deliveries(deliveries, ledger_df):
+    """Keep only deliveries not yet sent to that recipient, or that reached a higher level."""
+    merged = deliveries.merge(
+        ledger_df[LEDGER_KEYS + ["level"]], on=LEDGER_KEYS, how="left", suffixes=("", "_sent")
+    )
+    merged.index = deliveries.index
+    is_new = merged["level_sent"].isna() | (merged["level"] > merged["level_sent"])
+    return deliveries[is_new.to_numpy()]
+
+
+def find_cleared(ledger_df, active_tt_numbers):
+    """Ledger rows whose alarm is no longer in the active set."""
+    return ledger_df[~ledger_df["TTNumber"].isin(set(active_tt_numbers))]
+
+
+def stamp(rows):
+    """Attach the send timestamp before recording rows in the ledger."""
+    rows = rows.copy()
+    rows["sent_at"] = datetime.now().isoformat(timespec="seconds")
+    return rows
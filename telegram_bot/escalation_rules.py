@@ -0,0 +1,89 @@
+import os
+import logging
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from utils.config import ESCALATION_MATRIX_FILE, ESCALATION_RULES_SHEET
+
+WILDCARD = "*"
+
+# Used when the matrix has no rules sheet: same behaviour as the original hard-coded escalation.
+# Technician & Supervisor → ALL alarms immediately, CE → ONLY outages (2G/3G/4G) immediately.
+DEFAULT_RULES = pd.DataFrame([
+    {"EventName": WILDCARD, "Role": "Technician", "After_Minutes": 0},
+    {"EventName": WILDCARD, "Role": "Supervisor", "After_Minutes": 0},
+    {"EventName": "2G OUTAGE", "Role": "Cluster Engineer", "After_Minutes": 0},
+    {"EventName": "3G OUTAGE", "Role": "Cluster Engineer", "After_Minutes": 0},
+    {"EventName": "4G OUTAGE", "Role": "Cluster Engineer", "After_Minutes": 0},
+])
+
+
+class EscalationRules:
+    """
+    Compiled escalation matrix.
+    Each rule says: alarms named EventName ("*" = any) are due for Role once they are
+    After_Minutes old. A specific EventName rule overrides the wildcard for that role.
+    """
+
+    def __init__(self, rules_df):
+        rules_df = rules_df.copy()
+        rules_df.columns = rules_df.columns.str.strip().str.replace(" ", "_")
+        rules_df = rules_df.dropna(subset=["EventName", "Role", "After_Minutes"])
+        rules_df["EventName"] = rules_df["EventName"].astype(str).str.strip().str.upper()
+        rules_df["Role"] = rules_df["Role"].astype(str).str.strip()
+        rules_df["After_Minutes"] = rules_df["After_Minutes"].astype(float)
+
+        # Index: role → ({event name → minutes}, wildcard minutes or NaN)
+        self.roles = list(dict.fromkeys(rules_df["Role"]))
+        self.index = {}
+        for role, role_rules in rules_df.groupby("Role", sort=False):
+            specific = role_rules[role_rules["EventName"] != WILDCARD]
+            wildcard = role_rules.loc[role_rules["EventName"] == WILDCARD, "After_Minutes"]
+            self.index[role] = (
+                dict(zip(specific["EventName"], specific["After_Minutes"])),
+                wildcard.min() if len(wildcard) else np.nan,
+            )
+
+    def thresholds(self, event_names):
+        """Minutes after which each alarm is due, per role (NaN = never)."""
+        codes, uniques = pd.factorize(event_names)
+        out = {}
+        for role, (specific, wildcard) in self.index.items():
+            # Trailing wildcard entry doubles as the lookup for missing names (code -1)
+            per_event = np.array([specific.get(name, wildcard) for name in uniques] + [wildcard], dtype=float)
+            out[role] = per_event[codes]
+        return pd.DataFrame(out, index=event_names.index)
+
+    def due(self, df, now=None):
+        """
+        Boolean frame (one column per role) telling which alarms are due at which level,
+        based on the age of OpenTime. Alarms with unknown OpenTime are treated as just opened.
+        """
+        now = pd.Timestamp.now() if now is None else pd.Timestamp(now)
+        open_time = pd.to_datetime(df["OpenTime"], errors="coerce")
+        age_minutes = ((now - open_time).dt.total_seconds() / 60).fillna(0).to_numpy()
+
+        thresholds = self.thresholds(df["EventName"].astype(str).str.strip().str.upper())
+        return pd.DataFrame(
+            {role: age_minutes >= thresholds[role].to_numpy() for role in thresholds.columns},
+            index=df.index,
+        )
+
+
+@lru_cache(maxsize=4)
+def _load_rules(path, mtime, sheet):
+    if path and os.path.exists(path):
+        with pd.ExcelFile(path) as workbook:
+            if sheet in workbook.sheet_names:
+                logging.info(f"📐 Loaded escalation rules from {path} [{sheet}]")
+                return EscalationRules(workbook.parse(sheet))
+    logging.info("📐 No escalation rules sheet found. Using default escalation rules.")
+    return EscalationRules(DEFAULT_RULES)
+
+
+def get_rules(path=ESCALATION_MATRIX_FILE, sheet=ESCALATION_RULES_SHEET):
+    """Compiled rules, loaded once and reloaded only when the matrix file changes."""
+    mtime = os.path.getmtime(path) if path and os.path.exists(path) else None
+    return _load_rules(path, mtime, sheet)
@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+
+from utils.config import CORRELATION_WINDOW_MINUTES, CORRELATION_MIN_SITES
+
+INCIDENT_COLUMNS = ["incident", "Cluster", "sites", "alarms", "first_open", "last_open"]
+
+
+def correlate_outages(df, window_minutes=CORRELATION_WINDOW_MINUTES, min_sites=CORRELATION_MIN_SITES):
+    """
+    Incident number of every site-down alarm that belongs to a mass outage (NA elsewhere),
+    aligned with df.index. Site-down alarms of one Cluster belong to the same incident while
+    each opened within window_minutes of the previous one; an incident needs min_sites sites.
+    One sort by (Cluster, OpenTime), then a single vectorized pass over the outages.
+    """
+    incident = pd.Series(pd.NA, index=df.index, dtype="Int64")
+    down = df[df["Is_SiteDown"].astype(bool).to_numpy() & df["OpenTime"].notna().to_numpy()]
+    if down.empty:
+        return incident
+
+    down = down.assign(Cluster=down["Cluster"].astype(str)).sort_values(["Cluster", "OpenTime"], kind="stable")
+    cluster = down["Cluster"].to_numpy()
+    open_time = down["OpenTime"].to_numpy()
+
+    # A new group starts at every cluster change and at every gap longer than the window
+    starts = np.ones(len(down), dtype=bool)
+    starts[1:] = (cluster[1:] != cluster[:-1]) | (np.diff(open_time) > np.timedelta64(int(window_minutes * 60), "s"))
+    group = np.cumsum(starts)
+
+    sites = pd.Series(down["SiteID"].astype(str).to_numpy()).groupby(group).transform("nunique").to_numpy()
+    mass = sites >= min_sites
+    if mass.any():
+        incident.loc[down.index[mass]] = pd.factorize(group[mass])[0] + 1
+    return incident
+
+
+def summarize_incidents(df, incident):
+    """One row per incident: cluster, distinct sites, alarms and the OpenTime span."""
+    member = df[incident.notna().to_numpy()]
+    if member.empty:
+        return pd.DataFrame(columns=INCIDENT_COLUMNS).set_index("incident")
+    return member.groupby(incident[incident.notna()].to_numpy()).agg(
+        Cluster=("Cluster", "first"),
+        sites=("SiteID", "nunique"),
+        alarms=("SiteID", "size"),
+        first_open=("OpenTime", "min"),
+        last_open=("OpenTime", "max"),
+    ).rename_axis("incident")
@@ -0,0 +1,359 @@
+"""
+Durable outbox between escalation and Telegram delivery.
+
+With OUTBOX=True escalate_alarms only enqueues rendered messages (and the ledger rows they
+cover) into a SQLite database in WAL mode; worker processes drain it concurrently:
+
+    python -m telegram_bot.outbox --workers 4    # deliver until Ctrl+C / SIGTERM
+    python -m telegram_bot.outbox --once         # deliver what is queued, then exit
+    python -m telegram_bot.outbox --stats
+
+Workers claim batches inside a write transaction, so each message is claimed by exactly one
+worker, and a chat is only ever claimed by one worker at a time (per-chat order and rate limit
+hold across processes). Progress is stored after every part and ledger rows are recorded once
+the last part went out. Claims of a crashed worker expire after OUTBOX_CLAIM_TIMEOUT and the
+message resumes at the first unsent part, so at most that one part can be sent twice.
+"""
+import os
+import json
+import time
+import signal
+import logging
+import sqlite3
+import argparse
+from contextlib import contextmanager
+
+import pandas as pd
+
+from utils.config import (
+    OUTBOX_FILE, OUTBOX_WORKERS, OUTBOX_BATCH_SIZE, OUTBOX_MAX_ATTEMPTS, OUTBOX_CLAIM_TIMEOUT,
+    TELEGRAM_GLOBAL_RATE,
+)
+from telegram_bot.escalation_ledger import LEDGER_COLUMNS, get_ledger, stamp
+from telegram_bot.telegram_utils import is_valid_chat_id, split_message
+from utils.instrumentation import count
+
+# Ledger rows carried by a queued message (sent_at is stamped on delivery)
+DELIVERY_COLUMNS = [c for c in LEDGER_COLUMNS if c != "sent_at"]
+
+RETRY_BASE = 30.0    # seconds before the first retry of a failed message, doubled per attempt
+RETRY_CAP = 3600.0
+POLL_INTERVAL = 2.0  # seconds an idle worker waits before claiming again
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    chat_id INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    priority INTEGER NOT NULL,
+    alarms INTEGER NOT NULL DEFAULT 0,
+    parts TEXT NOT NULL,
+    parts_sent INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    claimed_at REAL,
+    next_attempt_at REAL NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    sent_at REAL,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS outbox_queue ON outbox (status, priority, id);
+CREATE INDEX IF NOT EXISTS outbox_chat ON outbox (chat_id, status);
+CREATE TABLE IF NOT EXISTS outbox_deliveries (
+    message_id INTEGER NOT NULL REFERENCES outbox (id),
+    TTNumber TEXT NOT NULL, chat_id INTEGER NOT NULL, role TEXT NOT NULL,
+    level INTEGER NOT NULL, SiteID TEXT, EventName TEXT
+);
+CREATE INDEX IF NOT EXISTS outbox_deliveries_message ON outbox_deliveries (message_id);
+"""
+
+
+class Outbox:
+    """Queue of rendered messages in one SQLite file, shared by escalation and the workers."""
+
+    def __init__(self, path=OUTBOX_FILE):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        conn = sqlite3.connect(path, timeout=30)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")  # readers never block the writer and vice versa
+            conn.executescript(SCHEMA)
+        finally:
+            conn.close()
+
+    @contextmanager
+    def _transaction(self):
+        """Write transaction that takes the database lock up front (BEGIN IMMEDIATE)."""
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            conn.execute("PRAGMA synchronous=NORMAL")  # WAL: durable across process crashes
+            conn.execute("BEGIN IMMEDIATE")
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    # ---------------------------
+    # Producer side
+    # ---------------------------
+    def enqueue(self, jobs, deliveries=None):
+        """
+        Store dispatcher jobs (make_job) as pending messages in one transaction.
+        deliveries is the frame job["deliveries"] indexes into; its rows are recorded in the
+        ledger when the message is delivered. Returns queued alarm counts per role.
+        """
+        counts, now = {}, time.time()
+        with self._transaction() as conn:
+            for job in jobs:
+                counts.setdefault(job["role"], 0)
+                if not is_valid_chat_id(job["chat_id"]):
+                    continue
+                parts = list(job["parts"] or split_message(job["text"]))
+                cur = conn.execute(
+                    "INSERT INTO outbox (chat_id, role, priority, alarms, parts, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    (int(job["chat_id"]), job["role"], int(job["priority"]), int(job["alarms"]), json.dumps(parts), now),
+                )
+                if deliveries is not None and job["deliveries"] is not None:
+                    rows = deliveries.loc[job["deliveries"], DELIVERY_COLUMNS].astype({"TTNumber": str, "SiteID": str})
+                    conn.executemany(
+                        f"INSERT INTO outbox_deliveries (message_id, {', '.join(DELIVERY_COLUMNS)})"
+                        f" VALUES ({', '.join('?' * (len(DELIVERY_COLUMNS) + 1))})",
+                        ((cur.lastrowid, *row) for row in rows.astype(object).itertuples(index=False, name=None)),
+                    )
+                counts[job["role"]] += int(job["alarms"])
+        count("outbox_messages_total", len(jobs), result="queued")
+        return counts
+
+    def pending_deliveries(self):
+        """Highest queued level per ledger key of messages not delivered yet (for diff_deliveries)."""
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            return pd.read_sql_query(
+                "SELECT d.TTNumber, d.chat_id, d.role, MAX(d.level) AS level"
+                " FROM outbox_deliveries d JOIN outbox o ON o.id = d.message_id"
+                " WHERE o.status IN ('pending', 'claimed') GROUP BY d.TTNumber, d.chat_id, d.role",
+                conn,
+            ).astype({"TTNumber": str, "chat_id": "int64", "level": "int64"})
+        finally:
+            conn.close()
+
+    # ---------------------------
+    # Worker side
+    # ---------------------------
+    def claim(self, worker, limit=OUTBOX_BATCH_SIZE):
+        """
+        Atomically claim up to `limit` due messages for `worker`, highest priority first.
+        Chats another worker holds a claim on are skipped. Expired claims are released first.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE outbox SET status = 'pending', worker = NULL WHERE status = 'claimed' AND claimed_at < ?",
+                (now - OUTBOX_CLAIM_TIMEOUT,),
+            )
+            rows = conn.execute(
+                "SELECT id, chat_id, role, priority, alarms, parts, parts_sent, attempts FROM outbox"
+                " WHERE status = 'pending' AND next_attempt_at <= ?"
+                " AND chat_id NOT IN (SELECT chat_id FROM outbox WHERE status = 'claimed')"
+                " ORDER BY priority, id LIMIT ?",
+                (now, limit),
+            ).fetchall()
+            conn.executemany(
+                "UPDATE outbox SET status = 'claimed', worker = ?, claimed_at = ?, attempts = attempts + 1 WHERE id = ?",
+                ((worker, now, row[0]) for row in rows),
+            )
+        columns = ["id", "chat_id", "role", "priority", "alarms", "parts", "parts_sent", "attempts"]
+        messages = [dict(zip(columns, row)) for row in rows]
+        for message in messages:
+            message["parts"] = json.loads(message["parts"])
+            message["attempts"] += 1
+        return messages
+
+    def progress(self, message_id, worker, parts_sent):
+        """Remember how many parts went out (and keep the claim alive)."""
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE outbox SET parts_sent = ?, claimed_at = ? WHERE id = ? AND worker = ?",
+                (parts_sent, time.time(), message_id, worker),
+            )
+
+    def deliveries(self, message_ids):
+        """Ledger rows covered by the given messages."""
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            return pd.read_sql_query(
+                f"SELECT {', '.join(DELIVERY_COLUMNS)} FROM outbox_deliveries"
+                f" WHERE message_id IN ({', '.join('?' * len(message_ids))})",
+                conn, params=list(message_ids),
+            )
+        finally:
+            conn.close()
+
+    def mark_sent(self, message_ids, worker):
+        now = time.time()
+        with self._transaction() as conn:
+            conn.executemany(
+                "UPDATE outbox SET status = 'sent', sent_at = ?, worker = NULL, last_error = NULL WHERE id = ? AND worker = ?",
+                ((now, message_id, worker) for message_id in message_ids),
+            )
+            conn.executemany("DELETE FROM outbox_deliveries WHERE message_id = ?", ((i,) for i in message_ids))
+
+    def mark_failed(self, message_id, worker, attempts, error):
+        """Back off and retry later, or give up (status 'dead') after OUTBOX_MAX_ATTEMPTS."""
+        dead = attempts >= OUTBOX_MAX_ATTEMPTS
+        retry_at = time.time() + min(RETRY_CAP, RETRY_BASE * 2 ** (attempts - 1))
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE outbox SET status = ?, worker = NULL, next_attempt_at = ?, last_error = ? WHERE id = ? AND worker = ?",
+                ("dead" if dead else "pending", retry_at, error, message_id, worker),
+            )
+        return dead
+
+    def stats(self):
+        """Message count per status."""
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            return dict(conn.execute("SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall())
+        finally:
+            conn.close()
+
+    def purge(self, older_than_days=7):
+        """Delete sent and dead messages older than `older_than_days`."""
+        cutoff = time.time() - older_than_days * 86400
+        with self._transaction() as conn:
+            conn.execute(
+                "DELETE FROM outbox_deliveries WHERE message_id IN"
+                " (SELECT id FROM outbox WHERE status = 'dead' AND created_at < ?)",
+                (cutoff,),
+            )
+            return conn.execute(
+                "DELETE FROM outbox WHERE status IN ('sent', 'dead') AND created_at < ?", (cutoff,)
+            ).rowcount
+
+
+# ---------------------------
+# Workers
+# ---------------------------
+def deliver_batch(outbox, worker, messages):
+    """Dispatch claimed messages concurrently, then settle the batch. Returns delivered messages."""
+    from telegram_bot.async_dispatcher import make_job, run_dispatch
+
+    jobs = []
+    for message in messages:
+        job = make_job(message["chat_id"], "", message["role"], alarms=message["alarms"],
+                       priority=message["priority"], parts=message["parts"][message["parts_sent"]:])
+        job["outbox"] = message
+        jobs.append(job)
+
+    def progress(job, sent):
+        outbox.progress(job["outbox"]["id"], worker, job["outbox"]["parts_sent"] + sent)
+
+    run_dispatch(jobs, progress=progress)
+
+    for job in jobs:
+        message = job["outbox"]
+        if not job["delivered"] and outbox.mark_failed(message["id"], worker, message["attempts"], "send failed"):
+            count("outbox_messages_total", result="dead")
+            logging.error(f"💀 Outbox message {message['id']} to {message['chat_id']} gave up after {message['attempts']} attempts")
+
+    delivered = [job["outbox"]["id"] for job in jobs if job["delivered"]]
+    if delivered:
+        # Ledger first: if we die before mark_sent, the batch is settled again (idempotent upsert)
+        rows = outbox.deliveries(delivered)
+        if not rows.empty:
+            get_ledger().record(stamp(rows))
+        outbox.mark_sent(delivered, worker)
+        count("outbox_messages_total", len(delivered), result="sent")
+    return len(delivered)
+
+
+def drain(outbox, worker, batch_size=OUTBOX_BATCH_SIZE, stop=None, exit_when_empty=False):
+    """Claim and deliver batches until `stop` (a threading/multiprocessing Event) is set."""
+    delivered = 0
+    while not (stop and stop.is_set()):
+        try:
+            messages = outbox.claim(worker, batch_size)
+            if messages:
+                delivered += deliver_batch(outbox, worker, messages)
+                continue
+        except Exception as e:
+            # Claims left behind expire and resume; a fully sent message is only settled again
+            logging.exception(f"❌ Outbox worker {worker} failed: {e}")
+        if exit_when_empty and not outbox.stats().get("claimed"):
+            break
+        if stop:
+            stop.wait(POLL_INTERVAL)
+        else:
+            time.sleep(POLL_INTERVAL)
+    return delivered
+
+
+def _worker_main(path, index, workers, stop, exit_when_empty):
+    """Entry point of one worker process."""
+    from telegram_bot.rate_limiter import limiter, TokenBucket
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the parent sets `stop` instead
+    # Telegram's global limit is per bot, so the processes share it
+    limiter.global_bucket = TokenBucket(TELEGRAM_GLOBAL_RATE / workers)
+    worker = f"w{index}-{os.getpid()}"
+    delivered = drain(Outbox(path), worker, stop=stop, exit_when_empty=exit_when_empty)
+    logging.info(f"📮 Outbox worker {worker} stopped after {delivered} messages")
+
+
+def start_workers(workers=OUTBOX_WORKERS, path=OUTBOX_FILE, exit_when_empty=False):
+    """Start worker processes. Returns (processes, stop_event); set the event and join to stop."""
+    import multiprocessing
+
+    ctx = multiprocessing.get_context("spawn")
+    stop = ctx.Event()
+    processes = [
+        ctx.Process(target=_worker_main, args=(path, i, workers, stop, exit_when_empty), name=f"outbox-worker-{i}")
+        for i in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    return processes, stop
+
+
+def stop_workers(processes, stop, timeout=60):
+    stop.set()
+    for process in processes:
+        process.join(timeout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Deliver queued escalation messages from the outbox.")
+    parser.add_argument("--workers", type=int, default=OUTBOX_WORKERS, help="worker processes")
+    parser.add_argument("--once", action="store_true", help="exit once the outbox is drained")
+    parser.add_argument("--stats", action="store_true", help="print message counts per status and exit")
+    parser.add_argument("--purge", type=float, metavar="DAYS", help="delete sent/dead messages older than DAYS and exit")
+    parser.add_argument("--path", default=OUTBOX_FILE)
+    args = parser.parse_args()
+
+    outbox = Outbox(args.path)
+    if args.stats:
+        print(f"📮 Outbox {args.path}: {outbox.stats()}")
+        return
+    if args.purge is not None:
+        print(f"🧹 Purged {outbox.purge(args.purge)} messages")
+        return
+
+    print(f"📮 Starting {args.workers} outbox worker(s) on {args.path}: {outbox.stats()}")
+    processes, stop = start_workers(args.workers, args.path, exit_when_empty=args.once)
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        print("🛑 Stopping outbox workers...")
+        stop_workers(processes, stop)
+    print(f"📮 Outbox: {outbox.stats()}")
+
+
+if __name__ == "__main__":
+    main()
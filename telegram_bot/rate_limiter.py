@@ -0,0 +1,136 @@
+import asyncio
+import json
+import random
+import threading
+import time
+
+from utils.config import (
+    TELEGRAM_GLOBAL_RATE, TELEGRAM_CHAT_RATE, TELEGRAM_GLOBAL_PAUSE_CHATS, TELEGRAM_GLOBAL_PAUSE_WINDOW,
+)
+
+# --- Retry policy ---
+BACKOFF_BASE = 0.5   # seconds
+BACKOFF_CAP = 30.0   # seconds
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+# ---------------------------
+# Token Buckets
+# ---------------------------
+class TokenBucket:
+    """
+    Thread-safe token bucket usable from both threads and coroutines.
+    Each acquire reserves a token up front (the balance may go negative), so waiters are
+    served in arrival order and never spin.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        """Take one token and return how long the caller must wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            return max(wait, self.blocked_until - now)
+
+    def pause(self, seconds):
+        """Block the bucket for `seconds` (e.g. after a 429 retry_after)."""
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def acquire(self):
+        delay = self._reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    async def acquire_async(self):
+        delay = self._reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class RateLimiter:
+    """One global bucket (~30 msg/s) plus one bucket per chat (~1 msg/s), as Telegram enforces."""
+
+    def __init__(self, global_rate=TELEGRAM_GLOBAL_RATE, chat_rate=TELEGRAM_CHAT_RATE,
+                 global_pause_chats=TELEGRAM_GLOBAL_PAUSE_CHATS, global_pause_window=TELEGRAM_GLOBAL_PAUSE_WINDOW):
+        self.global_bucket = TokenBucket(global_rate)
+        self.chat_rate = chat_rate
+        self.global_pause_chats = global_pause_chats
+        self.global_pause_window = global_pause_window
+        self._chats = {}
+        self._throttled = {}  # chat_id → monotonic time of its last 429
+        self._lock = threading.Lock()
+
+    def bucket_for(self, chat_id):
+        with self._lock:
+            if chat_id not in self._chats:
+                self._chats[chat_id] = TokenBucket(self.chat_rate, capacity=1)
+            return self._chats[chat_id]
+
+    def acquire(self, chat_id):
+        # Chat first, so a global token is not held while waiting on a slow chat
+        self.bucket_for(chat_id).acquire()
+        self.global_bucket.acquire()
+
+    async def acquire_async(self, chat_id):
+        await self.bucket_for(chat_id).acquire_async()
+        await self.global_bucket.acquire_async()
+
+    def pause(self, chat_id, seconds):
+        """
+        Honour a 429: only that chat backs off for retry_after, the other chats keep sending.
+        When several chats are throttled within a short window the bot-wide limit was hit,
+        and the global budget backs off too.
+        """
+        self.bucket_for(chat_id).pause(seconds)
+        now = time.monotonic()
+        with self._lock:
+            self._throttled[chat_id] = now
+            self._throttled = {c: t for c, t in self._throttled.items() if now - t <= self.global_pause_window}
+            throttled = len(self._throttled)
+        if throttled >= self.global_pause_chats:
+            self.global_bucket.pause(seconds)
+
+
+# Shared by the sync and async send paths in this process
+limiter = RateLimiter()
+
+
+# ---------------------------
+# Retry Helpers
+# ---------------------------
+def is_retryable(status):
+    """Network errors (status None), 429 and 5xx are retried; other 4xx are permanent."""
+    return status is None or status in RETRYABLE_STATUS
+
+
+def parse_retry_after(body):
+    """Read `parameters.retry_after` from a Bot API error body, or None."""
+    try:
+        return float(json.loads(body)["parameters"]["retry_after"])
+    except (TypeError, ValueError, KeyError):
+        return None
+
+
+def backoff_delay(attempt, base=BACKOFF_BASE, cap=BACKOFF_CAP):
+    """Full-jitter exponential backoff."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def retry_delay(status, body, attempt):
+    """Seconds to wait before the next attempt: retry_after for 429, jittered backoff otherwise."""
+    if status == 429:
+        retry_after = parse_retry_after(body)
+        if retry_after is not None:
+            return retry_after
+    return backoff_delay(attempt)
@@ -1,16 +1,37 @@
 import logging
-import requests
+import time
+from functools import lru_cache
 import pandas as pd
 import re
-from utils.config import BOT_TOKEN, TEST_MODE, TEST_CHAT_ID
+from utils.config import settings, TELEGRAM_API_BASE, TELEGRAM_MAX_RETRIES
+from telegram_bot.rate_limiter import limiter, is_retryable, retry_delay
+from utils.instrumentation import count, instrumented, span
 
 # --- Config ---
-TELEGRAM_API_URL = f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage"
 MAX_LEN = 4000  # Telegram safe limit
 
+# Columns build_site_header reads the site name and cluster from
+SITE_INFO_COLUMNS = ["SiteName", "SITE_NAME", "Cluster", "ONE_ATC_CLUSTER"]
+
 # --- Logging ---
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
+# Reuse TCP/TLS connections across sends instead of a new connection per chunk (created on first send)
+_session = None
+
+
+def telegram_api_url() -> str:
+    """sendMessage endpoint; the bot token is only required once something is sent."""
+    return f"{TELEGRAM_API_BASE}/bot{settings.bot_token}/sendMessage"
+
+
+def _get_session():
+    global _session
+    if _session is None:
+        import requests
+        _session = requests.Session()
+    return _session
+
 
 # ---------------------------
 # Escape Helpers
@@ -25,42 +46,168 @@ def escape_markdown(text: str) -> str:
 # ---------------------------
 # Telegram Send Helpers
 # ---------------------------
+def resolve_target_chat(chat_id: int) -> int:
+    """Return the chat that should actually receive the message (TEST_CHAT_ID in TEST_MODE)."""
+    return int(settings.test_chat_id) if settings.test_mode and settings.test_chat_id else chat_id
+
+
+def is_valid_chat_id(chat_id) -> bool:
+    """True if chat_id is a valid numeric string."""
+    return pd.notna(chat_id) and str(chat_id).isdigit()
+
+
 def send_telegram_message(chat_id: int, text: str, parse_mode="HTML") -> bool:
-    """Send message to Telegram chat and log result. Redirect to TEST_CHAT_ID if TEST_MODE is enabled."""
-    target_chat = int(TEST_CHAT_ID) if TEST_MODE and TEST_CHAT_ID else chat_id
+    """
+    Send message to Telegram chat and log result. Redirect to TEST_CHAT_ID if TEST_MODE is enabled.
+    Sends are paced by the shared rate limiter; 429/5xx/network failures are retried.
+    A single blocking send, not ordered by priority: escalations go through async_dispatcher.
+    """
+    import requests
 
+    target_chat = resolve_target_chat(chat_id)
     payload = {"chat_id": target_chat, "text": text, "parse_mode": parse_mode}
-    response = requests.post(TELEGRAM_API_URL, data=payload)
+    api_url, session = telegram_api_url(), _get_session()
 
-    if response.status_code == 200:
-        logging.info(f"✅ Sent message to {target_chat} ({'TEST' if TEST_MODE else 'LIVE'})")
-        return True
-    else:
-        logging.error(f"❌ Failed to send to {target_chat}: {response.text}")
-        return False
+    for attempt in range(TELEGRAM_MAX_RETRIES + 1):
+        with span("telegram.rate_limit_wait"):
+            limiter.acquire(target_chat)
+        with span("telegram.round_trip"):
+            try:
+                response = session.post(api_url, data=payload, timeout=30)
+                status, body = response.status_code, response.text
+            except requests.RequestException as e:
+                status, body = None, str(e)
+        count("telegram_requests_total", status=status or "error")
+
+        if status == 200:
+            count("telegram_messages_total", result="sent")
+            logging.info(f"✅ Sent message to {target_chat} ({'TEST' if settings.test_mode else 'LIVE'})")
+            return True
+        if not is_retryable(status) or attempt == TELEGRAM_MAX_RETRIES:
+            break
+
+        delay = retry_delay(status, body, attempt)
+        if status == 429:
+            limiter.pause(target_chat, delay)
+        logging.warning(f"⏳ Retry {attempt + 1}/{TELEGRAM_MAX_RETRIES} for {target_chat} in {delay:.1f}s ({status})")
+        time.sleep(delay)
+
+    count("telegram_messages_total", result="failed")
+    logging.error(f"❌ Failed to send to {target_chat}: {body}")
+    return False
 
 
 def safe_send(chat_id, message):
     """Send only if chat_id is valid numeric string."""
-    if pd.notna(chat_id) and str(chat_id).isdigit():
+    if is_valid_chat_id(chat_id):
         return send_telegram_message(int(chat_id), message)
 
 
+def _pack(pieces, max_len):
+    """Greedily pack pieces into chunks of at most max_len characters."""
+    chunks, current = [], ""
+    for piece in pieces:
+        if current and len(current) + len(piece) > max_len:
+            chunks.append(current)
+            current = ""
+        current += piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+@lru_cache(maxsize=4096)
+def split_message(full_message, max_len=MAX_LEN):
+    """
+    Split long messages into safe chunks for Telegram, only at alarm-entry boundaries
+    (blank lines) so no HTML tag or alarm entry is cut in half. An entry that is itself
+    too long falls back to line breaks, and a single oversized line to a hard cut.
+    Cached, so a message shared by several recipients is only split once.
+    """
+    pieces = []
+    for entry in re.split(r"(?<=\n\n)", full_message):
+        if len(entry) <= max_len:
+            pieces.append(entry)
+            continue
+        for line in re.split(r"(?<=\n)", entry):
+            pieces.extend(line[i:i + max_len] for i in range(0, len(line), max_len))
+
+    return tuple(chunk for chunk in _pack(pieces, max_len) if chunk.strip())
+
+
 def split_and_send(chat_id, full_message):
     """Split long messages into safe chunks for Telegram."""
-    while len(full_message) > MAX_LEN:
-        part = full_message[:MAX_LEN]
+    for part in split_message(full_message):
         safe_send(chat_id, part)
-        full_message = full_message[MAX_LEN:]
-    if full_message.strip():
-        safe_send(chat_id, full_message)
 
 
 # ---------------------------
 # Message Builders
 # ---------------------------
-def build_site_message(site_id, site_df, role, site_down=False):
-    """Build grouped escalation message including site, operator, and alarms."""
+def _column_text(df, col, default):
+    return df[col].map(str) if col in df else pd.Series(default, index=df.index)
+
+
+def _alarm_fields(df):
+    """Alarm name, open time, TT number and operator of every row as text Series."""
+    if "OpenTime" in df:
+        open_time = pd.to_datetime(df["OpenTime"], errors="coerce")
+        time_str = open_time.dt.strftime("%Y-%m-%d %H:%M").fillna("Unknown").astype(object)
+    else:
+        time_str = pd.Series("Unknown", index=df.index)
+
+    alarm_text = _column_text(df, "Standard_Alarm_Name" if "Standard_Alarm_Name" in df else "EventName", "")
+    return alarm_text, time_str, _column_text(df, "TTNumber", "N/A"), _column_text(df, "SourceInput", "Unknown")
+
+
+@instrumented("telegram.render_alarm_lines")
+def render_alarm_lines(df):
+    """Format the alarm entry of every row in one vectorized pass (Series aligned with df.index)."""
+    alarm_text, time_str, tt_number, operator = _alarm_fields(df)
+    return (
+        "• <b>Alarm:</b> " + alarm_text
+        + "\n  🕐 " + time_str + " | 🎫 TT: " + tt_number
+        + "\n  👤 Operator: " + operator + "\n\n"
+    )
+
+
+@instrumented("telegram.render_digest_lines")
+def render_digest_lines(df):
+    """Same alarm details as render_alarm_lines, one line per alarm (for digests)."""
+    alarm_text, time_str, tt_number, operator = _alarm_fields(df)
+    return "• " + alarm_text + " · 🕐 " + time_str + " · 🎫 " + tt_number + " · 👤 " + operator + "\n"
+
+
+def render_site_titles(df):
+    """Digest section title (site ID, name, cluster) for every row."""
+    name_col = next((c for c in ("SiteName", "SITE_NAME") if c in df), None)
+    cluster_col = next((c for c in ("Cluster", "ONE_ATC_CLUSTER") if c in df), None)
+    return (
+        "🏗 <b>" + df["SiteID"].map(str) + "</b> · " + _column_text(df, name_col, "Unknown")
+        + " · " + _column_text(df, cluster_col, "Unknown") + "\n"
+    )
+
+
+def render_outage_site_lines(df):
+    """One line per site of a mass outage: site, name, first outage time and its outage alarms."""
+    alarm_text, _, tt_number, _ = _alarm_fields(df)
+    work = pd.DataFrame({
+        "SiteID": df["SiteID"].map(str),
+        "name": _column_text(df, next((c for c in ("SiteName", "SITE_NAME") if c in df), None), "Unknown"),
+        "OpenTime": pd.to_datetime(df["OpenTime"], errors="coerce"),
+        "alarm": alarm_text + " (🎫 " + tt_number + ")",
+    }).sort_values("OpenTime", kind="stable")
+    sites = work.groupby("SiteID", sort=False).agg(
+        name=("name", "first"), first_open=("OpenTime", "min"), alarms=("alarm", ", ".join)
+    )
+    return (
+        "🏗 <b>" + sites.index.to_series() + "</b> · " + sites["name"]
+        + " · 🕐 " + sites["first_open"].dt.strftime("%Y-%m-%d %H:%M").fillna("Unknown") + " · " + sites["alarms"] + "\n"
+    ).tolist()
+
+
+def build_site_header(site_id, site_df, role, site_down=False):
+    """Header block with site, name and cluster for a site message."""
 
     # --- Site Info ---
     if "SiteName" in site_df:
@@ -83,38 +230,99 @@ def build_site_message(site_id, site_df, role, site_down=False):
     else:
         header = f"🚨 <b>{role} Alarm Escalation</b>"
 
-    msg = (
+    return (
         f"{header}\n\n"
         f"<b>Site ID:</b> {site_id}\n"
         f"<b>Site Name:</b> {site_name}\n"
         f"<b>Cluster:</b> {cluster}\n\n"
     )
 
-    # --- Alarm Details ---
-    for _, row in site_df.iterrows():
-        time_str = (
-            row["OpenTime"].strftime("%Y-%m-%d %H:%M")
-            if "OpenTime" in row and pd.notna(row["OpenTime"])
-            else "Unknown"
-        )
-        tt_number = row.get("TTNumber", "N/A")
-        operator = row.get("SourceInput", "Unknown")
-        alarm_text = (
-            row.get("Standard_Alarm_Name")
-            if "Standard_Alarm_Name" in row
-            else row.get("EventName", "")
-        )
 
-        msg += (
-            f"• <b>Alarm:</b> {alarm_text}\n"
-            f"  🕐 {time_str} | 🎫 TT: {tt_number}\n"
-            f"  👤 Operator: {operator}\n\n"
-        )
+def build_site_message(site_id, site_df, role, site_down=False):
+    """Build grouped escalation message including site, operator, and alarms."""
+    return build_site_header(site_id, site_df, role, site_down) + "".join(render_alarm_lines(site_df))
 
-    return msg
+
+def send_site_messages(messages):
+    """
+    Build and send site messages, given as (chat_id, site_id, site_df, role, site_down) tuples,
+    in one async dispatch (one event loop and HTTP session for all of them), auto-splitting if needed.
+    With OUTBOX=True the messages are queued in the outbox instead.
+    """
+    from telegram_bot.async_dispatcher import make_job, run_dispatch
+    from utils.config import OUTBOX_ENABLED
+
+    jobs = [
+        make_job(chat_id, build_site_message(site_id, site_df, role, site_down), role, alarms=len(site_df))
+        for chat_id, site_id, site_df, role, site_down in messages
+    ]
+    if OUTBOX_ENABLED:
+        from telegram_bot.outbox import Outbox
+        return Outbox().enqueue(jobs)
+    return run_dispatch(jobs)
 
 
 def send_site_message(chat_id, site_id, site_df, role, site_down=False):
-    """Build and send site message, auto-splitting if needed."""
-    full_message = build_site_message(site_id, site_df, role, site_down)
-    split_and_send(chat_id, full_message)
+    """Send one site message; when sending several, pass them all to send_site_messages instead."""
+    return send_site_messages([(chat_id, site_id, site_df, role, site_down)])
+
+
+def _headed_parts(title, summary, pieces, max_len):
+    """Pack pieces into parts that each start with title (numbered when there are several) and summary."""
+    bodies = _pack(pieces, max_len - len(title) - len(summary) - 16)  # room for the " (i/n)" part number
+    total = len(bodies)
+    return [
+        f"{title}{f' ({i}/{total})' if total > 1 else ''}\n{summary}\n\n{body}"
+        for i, body in enumerate(bodies, 1)
+    ]
+
+
+def build_digest(role, sections, max_len=MAX_LEN):
+    """
+    Pack (site title, alarm lines) sections into as few digest parts of at most max_len
+    characters as possible. A site only spans parts when it does not fit in one on its own,
+    and then continues under its title again. Every part starts with the digest header.
+    """
+    title = "🚨 <b>Site Down Digest</b>" if role == "Cluster Engineer" else f"🚨 <b>{role} Alarm Digest</b>"
+    alarms = sum(len(lines) for _, lines in sections)
+    summary = f"{len(sections)} site(s) · {alarms} alarm(s)"
+    budget = max_len - len(title) - len(summary) - 16
+
+    pieces = []
+    for site_title, lines in sections:
+        current = site_title
+        for line in lines:
+            if current != site_title and len(current) + len(line) + 1 > budget:
+                pieces.append(current + "\n")
+                current = site_title
+            current += line
+        pieces.append(current + "\n")
+    return _headed_parts(title, summary, pieces, max_len)
+
+
+def build_incident_message(incident, site_lines, max_len=MAX_LEN, alerted=0):
+    """
+    One alert for a mass outage: the cluster, how many sites went down in which time span,
+    and a line per affected site. `incident` needs Cluster, sites, first_open and last_open;
+    `alerted` is how many other sites of it the recipient was already alerted about.
+    """
+    title = f"🚨 <b>Mass Outage: {incident['Cluster']}</b>"
+    first, last = incident["first_open"], incident["last_open"]
+    span_text = f"{first:%Y-%m-%d %H:%M} – {last:%H:%M}" if first.date() == last.date() else f"{first:%Y-%m-%d %H:%M} – {last:%Y-%m-%d %H:%M}"
+    summary = f"{incident['sites']} sites down · {span_text}"
+    if alerted:
+        summary += f" · {len(site_lines)} new below ({alerted} alerted earlier)"
+    elif len(site_lines) < incident["sites"]:
+        summary += f" · {len(site_lines)} of {incident['sites']} affected sites in your area"
+    return _headed_parts(title, summary, list(site_lines), max_len)
+
+
+def build_cleared_message(cleared_df):
+    """Build a notice listing alarms that were escalated earlier and are now cleared."""
+    msg = "✅ <b>Alarms Cleared</b>\n\n"
+    for row in cleared_df.itertuples(index=False):
+        msg += (
+            f"• <b>Alarm:</b> {row.EventName}\n"
+            f"  🏗 Site: {row.SiteID} | 🎫 TT: {row.TTNumber}\n\n"
+        )
+    return msg
@@ -0,0 +1,186 @@
+import os
+import logging
+import threading
+from importlib.util import find_spec
+
+import pandas as pd
+
+from utils.config import PROCESSED_FORMAT
+
+# pyarrow is only imported when Parquet is actually written or read
+PYARROW = find_spec("pyarrow") is not None
+
+# Low-cardinality text columns stored dictionary-encoded
+CATEGORICAL_COLUMNS = ["Cluster", "EventName", "SourceInput"]
+
+# Rows per CSV write, so large frames are not rendered to text in one go
+CSV_CHUNK_ROWS = 5000
+
+# Characters of a "%Y-%m-%d %H:%M:%S.%f" timestamp to_csv prints for a column, by its finest part:
+# date only | seconds | milliseconds | microseconds
+_TIMESTAMP_WIDTHS = (10, 19, 23, 26)
+
+
+def _sibling(path, ext):
+    return os.path.splitext(path)[0] + ext
+
+
+def _tmp_path(path):
+    """Private temp file next to path; os.replace then swaps it in, so readers never see a partial file."""
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+def write_processed_alarms(df: pd.DataFrame, output_path: str, fmt: str = PROCESSED_FORMAT) -> str:
+    """
+    Save cleaned alarms for escalation (atomically). Returns the path actually written.
+    Parquet keeps dtypes (OpenTime datetime, SiteID, Is_SiteDown bool) and stores
+    Cluster/EventName/SourceInput as categoricals; CSV is used when pyarrow is missing.
+    """
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+
+    if fmt == "parquet":
+        if PYARROW:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            path = _sibling(output_path, ".parquet")
+            typed = df.astype({c: "category" for c in CATEGORICAL_COLUMNS if c in df})
+            tmp = _tmp_path(path)
+            pq.write_table(pa.Table.from_pandas(typed, preserve_index=False), tmp)
+            os.replace(tmp, path)
+            return path
+        logging.warning("⚠️ pyarrow not installed. Saving processed alarms as CSV instead.")
+
+    path = _sibling(output_path, ".csv")
+    tmp = _tmp_path(path)
+    df.to_csv(tmp, index=False, chunksize=CSV_CHUNK_ROWS)
+    os.replace(tmp, path)
+    return path
+
+
+def _timestamp_precision(values: pd.Series) -> int:
+    """Index into _TIMESTAMP_WIDTHS of the finest part to_csv would print for these timestamps."""
+    values = values.dropna()
+    micros = values.dt.microsecond
+    if (micros % 1000 != 0).any():
+        return 3
+    if (micros != 0).any():
+        return 2
+    return int((values != values.dt.normalize()).any())
+
+
+class ProcessedAlarmWriter:
+    """
+    Write cleaned alarms chunk by chunk (streaming preprocess) into the file write_processed_alarms
+    would produce for the whole frame. Chunks are appended to a .part CSV as they are produced;
+    close() applies what is only known at the end (numeric dtypes, timestamp precision) in one
+    chunked pass and moves the result into place.
+    """
+
+    def __init__(self, output_path: str, fmt: str = PROCESSED_FORMAT, chunk_rows: int = CSV_CHUNK_ROWS):
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        if fmt == "parquet" and not PYARROW:
+            logging.warning("⚠️ pyarrow not installed. Saving processed alarms as CSV instead.")
+            fmt = "csv"
+        self.fmt = fmt
+        self.path = _sibling(output_path, ".parquet" if fmt == "parquet" else ".csv")
+        self.part = f"{self.path}.{os.getpid()}.{threading.get_ident()}.part"
+        self.chunk_rows = chunk_rows
+        self.started = False
+        self.flags = []       # bool columns
+        self.timestamps = {}  # datetime column → finest precision seen so far
+        self.dtypes = {}      # dtypes of the datetime columns, restored for Parquet
+
+    def append(self, chunk: pd.DataFrame) -> None:
+        if not self.started:
+            self.flags = [c for c in chunk if pd.api.types.is_bool_dtype(chunk[c])]
+            self.timestamps = {c: 0 for c in chunk if pd.api.types.is_datetime64_any_dtype(chunk[c])}
+            self.dtypes = {c: chunk[c].dtype for c in self.timestamps}
+        for col in self.timestamps:
+            self.timestamps[col] = max(self.timestamps[col], _timestamp_precision(chunk[col]))
+
+        chunk.to_csv(self.part, mode="a" if self.started else "w", header=not self.started,
+                     index=False, date_format="%Y-%m-%d %H:%M:%S.%f")
+        self.started = True
+
+    def close(self, numeric: dict = None) -> str:
+        """
+        Finish the file. numeric maps columns that are numeric over the whole file to
+        "int64"/"float64". Returns the path written.
+        """
+        numeric = numeric or {}
+        tmp = _tmp_path(self.path)
+        parquet = None
+        try:
+            chunks = pd.read_csv(self.part, dtype=str, keep_default_na=False, chunksize=self.chunk_rows)
+            for i, chunk in enumerate(chunks):
+                for col, dtype in numeric.items():
+                    chunk[col] = pd.to_numeric(chunk[col].mask(chunk[col].eq(""))).astype(dtype)
+                if self.fmt == "parquet":
+                    parquet = self._write_parquet(chunk, tmp, parquet)
+                    continue
+                for col, precision in self.timestamps.items():
+                    chunk[col] = chunk[col].str[:_TIMESTAMP_WIDTHS[precision]]
+                chunk.to_csv(tmp, mode="a" if i else "w", header=not i, index=False)
+        finally:
+            if parquet is not None:
+                parquet.close()
+            os.remove(self.part)
+        os.replace(tmp, self.path)
+        return self.path
+
+    def _write_parquet(self, chunk, tmp, writer):
+        """Restore dtypes of one chunk read back from the .part CSV and add it as a row group."""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        text = [c for c in chunk if pd.api.types.is_string_dtype(chunk[c])]
+        chunk[text] = chunk[text].mask(chunk[text].eq(""))
+        for col in self.timestamps:
+            chunk[col] = pd.to_datetime(chunk[col], format="%Y-%m-%d %H:%M:%S.%f").astype(self.dtypes[col])
+        for col in self.flags:
+            chunk[col] = chunk[col].eq("True")
+        chunk = chunk.astype({c: "category" for c in CATEGORICAL_COLUMNS if c in chunk})
+        table = pa.Table.from_pandas(chunk, preserve_index=False)
+
+        if writer is None:
+            # Same schema for every row group: all-blank columns of the first chunk are text,
+            # and dictionary indices are wide enough for any chunk's categories
+            fields = []
+            for field in table.schema:
+                if pa.types.is_null(field.type):
+                    field = field.with_type(pa.string())
+                elif pa.types.is_dictionary(field.type):
+                    values = field.type.value_type
+                    field = field.with_type(pa.dictionary(pa.int32(), pa.string() if pa.types.is_null(values) else values))
+                fields.append(field)
+            writer = pq.ParquetWriter(tmp, pa.schema(fields, metadata=table.schema.metadata))
+        writer.write_table(table.cast(writer.schema))
+        return writer
+
+
+def processed_alarms_exist(path: str) -> bool:
+    return any(os.path.exists(_sibling(path, ext)) for ext in (".csv", ".parquet"))
+
+
+def read_processed_alarms(path: str) -> pd.DataFrame:
+    """
+    Load cleaned alarms written by write_processed_alarms. Whichever of the Parquet/CSV
+    siblings was written last is used; Parquet is memory-mapped.
+    """
+    candidates = [p for p in (_sibling(path, ".parquet"), _sibling(path, ".csv")) if os.path.exists(p)]
+    if not PYARROW:
+        candidates = [p for p in candidates if p.endswith(".csv")]
+    if not candidates:
+        raise FileNotFoundError(f"❌ No processed alarm file found for {path}")
+
+    latest = max(candidates, key=os.path.getmtime)
+    if latest.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        return pq.read_table(latest, memory_map=True).to_pandas()
+
+    df = pd.read_csv(latest, dtype={"SiteID": str})
+    df["OpenTime"] = pd.to_datetime(df["OpenTime"], errors="coerce")
+    if "Is_SiteDown" in df:
+        df["Is_SiteDown"] = df["Is_SiteDown"].astype(str).str.upper().eq("TRUE")
+    return df
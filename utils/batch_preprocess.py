@@ -0,0 +1,174 @@
+"""
+Batch / historical preprocessing of many VNOC exports at once.
+
+    python -m utils.batch_preprocess "data/archive/*.xlsx" --workers 4
+    python -m utils.batch_preprocess data/archive --out data/processed/history --include-cleared
+
+Workbooks are parsed in parallel in a process pool, alarms are deduplicated across files
+by TTNumber (the state from the newest export wins) and the result is written as one
+date-partitioned dataset: <out>/date=YYYY-MM-DD/alarms.(csv|parquet), keyed by OpenTime.
+"""
+import os
+import sys
+import glob
+import json
+import time
+import shutil
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from utils.preprocessor import OUTAGE_KEYWORDS, read_alarm_rows, _normalize_alarms, _filter_active
+from utils.config import PROCESSED_FORMAT
+from utils.alarm_store import write_processed_alarms
+
+HISTORY_DIR = "data/processed/history"
+PARTITION_FILE = "alarms.csv"  # .parquet sibling with PROCESSED_FORMAT=parquet
+UNKNOWN_DATE = "unknown"       # partition for alarms without a parseable OpenTime
+
+
+# ---------------------------
+# Inputs
+# ---------------------------
+def expand_inputs(sources, order_by="mtime"):
+    """
+    Workbooks from directories and/or glob patterns, oldest export first.
+    order_by="mtime" uses the file modification time, "name" the (timestamped) file name.
+    """
+    paths = set()
+    for source in ([sources] if isinstance(sources, str) else sources):
+        if os.path.isdir(source):
+            source = os.path.join(source, "*.xlsx")
+        paths.update(p for p in glob.glob(source) if p.lower().endswith(".xlsx") and not os.path.basename(p).startswith("~$"))
+    key = os.path.getmtime if order_by == "mtime" else os.path.basename
+    return sorted(paths, key=lambda p: (key(p), p))
+
+
+def _parse_file(path):
+    """Process-pool worker: one workbook → normalized rows (cleared alarms kept, not filtered yet)."""
+    start = time.perf_counter()
+    df = _normalize_alarms(read_alarm_rows(path))
+    return df, time.perf_counter() - start
+
+
+def parse_files(paths, workers=None):
+    """Parse workbooks in parallel; returns one frame per file, in input order."""
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(paths) == 1:
+        return [_parse_file(p)[0] for p in paths]
+    with ProcessPoolExecutor(max_workers=min(workers, len(paths))) as pool:
+        return [df for df, _ in pool.map(_parse_file, paths)]
+
+
+# ---------------------------
+# Dedup & Partitioning
+# ---------------------------
+def deduplicate(frames):
+    """
+    Concatenate per-file frames (oldest export first) and keep the last state of every
+    TTNumber. Rows without a TTNumber are kept as they are.
+    """
+    if not frames:
+        return pd.DataFrame()
+    df = pd.concat(frames, ignore_index=True)
+
+    # SiteID turns float when files disagree on blanks; keep it integral so it still joins the mapping
+    if pd.api.types.is_float_dtype(df["SiteID"]) and (df["SiteID"].dropna() % 1 == 0).all():
+        df["SiteID"] = df["SiteID"].astype("Int64")
+
+    has_tt = df["TTNumber"].notna()
+    latest = ~df["TTNumber"].duplicated(keep="last") | ~has_tt
+    return df[latest].reset_index(drop=True)
+
+
+def write_partitions(df, out_dir=HISTORY_DIR, fmt=PROCESSED_FORMAT):
+    """Write one file per OpenTime date; partitions touched by this run are replaced. Returns {date: rows}."""
+    dates = df["OpenTime"].dt.strftime("%Y-%m-%d").fillna(UNKNOWN_DATE)
+    written = {}
+    for date, part in df.groupby(dates, sort=True):
+        partition_dir = os.path.join(out_dir, f"date={date}")
+        if os.path.isdir(partition_dir):
+            shutil.rmtree(partition_dir)  # no stale CSV/Parquet sibling from an earlier run
+        write_processed_alarms(part.sort_values("OpenTime"), os.path.join(partition_dir, PARTITION_FILE), fmt)
+        written[date] = len(part)
+    return written
+
+
+def read_partitions(out_dir=HISTORY_DIR, start=None, end=None):
+    """Load the partitioned dataset back, optionally only dates in [start, end] (YYYY-MM-DD)."""
+    from utils.alarm_store import read_processed_alarms
+
+    frames = []
+    for partition_dir in sorted(glob.glob(os.path.join(out_dir, "date=*"))):
+        date = os.path.basename(partition_dir).split("=", 1)[1]
+        if date != UNKNOWN_DATE and ((start and date < start) or (end and date > end)):
+            continue
+        frames.append(read_processed_alarms(os.path.join(partition_dir, PARTITION_FILE)))
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+# ---------------------------
+# Batch Run
+# ---------------------------
+def batch_preprocess(sources, out_dir=HISTORY_DIR, workers=None, include_cleared=False, order_by="mtime", fmt=PROCESSED_FORMAT):
+    """
+    Parse every export in sources in parallel, deduplicate by TTNumber (latest export wins)
+    and write a date-partitioned dataset. Cleared alarms are dropped after dedup, so an alarm
+    cleared in a later export does not survive from an earlier one; include_cleared keeps
+    them (with ClearedDateTime) for historical analysis. Returns a summary dict.
+    """
+    paths = expand_inputs(sources, order_by)
+    if not paths:
+        raise FileNotFoundError(f"❌ No .xlsx exports found for {sources}")
+
+    start = time.perf_counter()
+    frames = parse_files(paths, workers)
+    parse_seconds = time.perf_counter() - start
+    raw_rows = sum(len(f) for f in frames)
+
+    df = deduplicate(frames)
+    unique_rows = len(df)
+    if include_cleared:
+        df["Is_SiteDown"] = df["EventName"].str.upper().isin(OUTAGE_KEYWORDS)
+    else:
+        df = _filter_active(df)
+
+    partitions = write_partitions(df, out_dir, fmt)
+    summary = {
+        "files": len(paths),
+        "raw_rows": raw_rows,
+        "unique_alarms": unique_rows,
+        "written_rows": len(df),
+        "partitions": len(partitions),
+        "workers": workers or os.cpu_count() or 1,
+        "parse_seconds": round(parse_seconds, 2),
+        "rows_per_second": round(raw_rows / parse_seconds) if parse_seconds else None,
+        "total_seconds": round(time.perf_counter() - start, 2),
+    }
+    os.makedirs(out_dir, exist_ok=True)
+    with open(os.path.join(out_dir, "_manifest.json"), "w") as f:
+        json.dump({**summary, "sources": paths, "rows_by_date": partitions}, f, indent=2)
+
+    print(
+        f"✅ {summary['files']} files, {raw_rows} rows → {unique_rows} unique alarms → "
+        f"{len(df)} rows in {len(partitions)} date partitions under {out_dir} "
+        f"({summary['rows_per_second']} rows/s parsing)"
+    )
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("sources", nargs="+", help="directories and/or glob patterns of .xlsx exports")
+    parser.add_argument("--out", default=HISTORY_DIR)
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--include-cleared", action="store_true", help="keep cleared alarms (historical analysis)")
+    parser.add_argument("--order-by", choices=["mtime", "name"], default="mtime", help="which export counts as newest")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    batch_preprocess(args.sources, args.out, args.workers, args.include_cleared, args.order_by)
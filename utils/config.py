@@ -1,53 +1,200 @@
 import os
+import sys
+from functools import cached_property
 from dotenv import load_dotenv
 
-# Try importing Streamlit (only works if running inside Streamlit app)
-try:
-    import streamlit as st
-    STREAMLIT = True
-except ImportError:
-    STREAMLIT = False
-
 # Load .env when running locally
 load_dotenv()
 
+
+# -------------------------------
+# Credentials (resolved lazily)
+# -------------------------------
+def _load_toml(path):
+    try:
+        import tomllib
+    except ImportError:  # Python < 3.11
+        import toml
+        return toml.load(path)
+    with open(path, "rb") as f:
+        return tomllib.load(f)
+
+
+class Settings:
+    """
+    MongoDB, Telegram and VNOC credentials, each resolved on first access instead of at import,
+    so the preprocessor or a CLI run never needs secrets it does not use.
+    Lookup order per key: Streamlit secrets (inside the app) or .streamlit/secrets.toml, then env/.env.
+    """
+
+    @cached_property
+    def _secrets(self):
+        if "streamlit" in sys.modules:  # running inside Streamlit: use its secrets loader
+            try:
+                return dict(sys.modules["streamlit"].secrets)
+            except Exception:
+                return {}
+        # Same files Streamlit reads (project overrides global), without importing Streamlit
+        secrets = {}
+        for path in (os.path.expanduser("~/.streamlit/secrets.toml"), os.path.join(".streamlit", "secrets.toml")):
+            if os.path.exists(path):
+                secrets.update(_load_toml(path))
+        return secrets
+
+    def get(self, name, default=None):
+        value = self._secrets.get(name)
+        return str(value) if value is not None else os.getenv(name, default)
+
+    @cached_property
+    def mongo_uri(self):
+        return self.get("MONGO_URI", "mongodb://localhost:27017")
+
+    @cached_property
+    def mongo_db(self):
+        return self.get("MONGO_DB", "TELCOM_AI")
+
+    @cached_property
+    def bot_token(self):
+        token = self.get("BOT_TOKEN")
+        if not token:
+            raise ValueError("❌ BOT_TOKEN missing! Please set it in .env or Streamlit secrets.toml")
+        return token
+
+    @cached_property
+    def test_mode(self):
+        return self.get("TEST_MODE", "True") == "True"
+
+    @cached_property
+    def test_chat_id(self):
+        return self.get("TEST_CHAT_ID", "")
+
+    @cached_property
+    def vnoc_username(self):
+        return self.get("VNOC_USERNAME", "")
+
+    @cached_property
+    def vnoc_password(self):
+        return self.get("VNOC_PASSWORD", "")
+
+    def reload(self):
+        """Forget resolved values (e.g. after secrets.toml changed)."""
+        self.__dict__.clear()
+
+
+settings = Settings()
+
+# Old module-level names (`from utils.config import BOT_TOKEN`) still work, resolved when imported
+_LAZY_SETTINGS = {
+    "MONGO_URI": "mongo_uri", "MONGO_DB": "mongo_db", "BOT_TOKEN": "bot_token", "TEST_MODE": "test_mode",
+    "TEST_CHAT_ID": "test_chat_id", "VNOC_USERNAME": "vnoc_username", "VNOC_PASSWORD": "vnoc_password",
+}
+
+
+def __getattr__(name):
+    if name in _LAZY_SETTINGS:
+        return getattr(settings, _LAZY_SETTINGS[name])
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# -------------------------------
+# MongoDB Client Settings
+# -------------------------------
+MONGO_BATCH_SIZE = int(os.getenv("MONGO_BATCH_SIZE", "1000"))  # ops per bulk_write round trip
+# Connection pool shared by the sync (pymongo) and async (motor) clients
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_TIMEOUT_MS = int(os.getenv("MONGO_TIMEOUT_MS", "10000"))  # server selection timeout
+
+# -------------------------------
+# Telegram Dispatch Settings
+# -------------------------------
+# Point TELEGRAM_API_BASE at a local stand-in Bot API server for testing
+TELEGRAM_API_BASE = os.getenv("TELEGRAM_API_BASE", "https://api.telegram.org").rstrip("/")
+TELEGRAM_CONCURRENCY = int(os.getenv("TELEGRAM_CONCURRENCY", "8"))
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "30"))  # msgs/sec across all chats
+TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", "1"))      # msgs/sec per chat
+TELEGRAM_MAX_RETRIES = int(os.getenv("TELEGRAM_MAX_RETRIES", "5"))
+# A 429 pauses only that chat; this many throttled chats within the window pause every send
+TELEGRAM_GLOBAL_PAUSE_CHATS = int(os.getenv("TELEGRAM_GLOBAL_PAUSE_CHATS", "3"))
+TELEGRAM_GLOBAL_PAUSE_WINDOW = float(os.getenv("TELEGRAM_GLOBAL_PAUSE_WINDOW", "5"))  # seconds
+
+# -------------------------------
+# Escalation Ledger
 # -------------------------------
-# MongoDB Settings
+# Only new alarms / newly reached levels are sent when incremental escalation is on
+ESCALATION_INCREMENTAL = os.getenv("ESCALATION_INCREMENTAL", "True") == "True"
+SEND_CLEARED_NOTICES = os.getenv("SEND_CLEARED_NOTICES", "False") == "True"
+# One digest per recipient and role (a section per site) instead of one message per site
+ESCALATION_DIGEST = os.getenv("ESCALATION_DIGEST", "False") == "True"
+# Site-down alarms of one cluster opening within the window of each other form one mass outage
+# (at least CORRELATION_MIN_SITES sites), sent to the CE as a single aggregated alert
+OUTAGE_CORRELATION = os.getenv("OUTAGE_CORRELATION", "True") == "True"
+CORRELATION_WINDOW_MINUTES = float(os.getenv("CORRELATION_WINDOW_MINUTES", "15"))
+CORRELATION_MIN_SITES = int(os.getenv("CORRELATION_MIN_SITES", "3"))
+# Where escalation reads active alarms: "file" (the processed CSV/Parquet) or "mongo" (OPEN alarms
+# in ALARM_COLLECTION, streamed in batches by mongodb.async_repository)
+ESCALATION_SOURCE = os.getenv("ESCALATION_SOURCE", "file")
+ALARM_COLLECTION = "AlarmLogs"
+LEDGER_BACKEND = os.getenv("LEDGER_BACKEND", "auto")  # auto | mongo | sqlite
+LEDGER_COLLECTION = "EscalationLedger"
+
+# -------------------------------
+# Outbox (durable queue between escalation and delivery)
+# -------------------------------
+# With OUTBOX=True escalation only enqueues; `python -m telegram_bot.outbox` workers deliver
+OUTBOX_ENABLED = os.getenv("OUTBOX", "False") == "True"
+OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", "2"))            # worker processes
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "50"))     # messages claimed at a time
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))  # then the message is marked dead
+OUTBOX_CLAIM_TIMEOUT = float(os.getenv("OUTBOX_CLAIM_TIMEOUT", "300"))  # seconds before a crashed worker's claim expires
+
+# -------------------------------
+# Alarm Rollups (backlog analytics)
 # -------------------------------
-if STREAMLIT and "MONGO_URI" in st.secrets:
-    MONGO_URI = st.secrets["MONGO_URI"]
-    MONGO_DB = st.secrets["MONGO_DB"]
-else:
-    MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
-    MONGO_DB = os.getenv("MONGO_DB", "TELCOM_AI")
+ROLLUP_BACKEND = os.getenv("ROLLUP_BACKEND", "auto")  # auto | mongo | file
+ROLLUP_COLLECTION = "AlarmRollups"
 
 # -------------------------------
-# Telegram Bot Settings
+# Processed Alarm File
 # -------------------------------
-if STREAMLIT and "BOT_TOKEN" in st.secrets:
-    BOT_TOKEN = st.secrets["BOT_TOKEN"]
-    TEST_MODE = st.secrets.get("TEST_MODE", "True") == "True"
-    TEST_CHAT_ID = st.secrets.get("TEST_CHAT_ID", "")
-else:
-    BOT_TOKEN = os.getenv("BOT_TOKEN")
-    TEST_MODE = os.getenv("TEST_MODE", "True") == "True"
-    TEST_CHAT_ID = os.getenv("TEST_CHAT_ID", "")
+# "parquet" writes a typed columnar file next to the CSV path; "csv" keeps the plain CSV handoff
+PROCESSED_FORMAT = os.getenv("PROCESSED_FORMAT", "csv").lower()
 
-if not BOT_TOKEN:
-    raise ValueError("❌ BOT_TOKEN missing! Please set it in .env or Streamlit secrets.toml")
+# -------------------------------
+# Pipeline Daemon
+# -------------------------------
+PIPELINE_INTERVAL = float(os.getenv("PIPELINE_INTERVAL", "300"))  # seconds between cycles
+# Delta ingestion: skip byte-identical exports, store only inserted/changed/cleared alarms
+DELTA_INGEST = os.getenv("DELTA_INGEST", "True") == "True"
+# Ingested exports kept in data/raw; older ones are deleted so --fetch does not fill the disk
+RAW_EXPORTS_KEPT = int(os.getenv("RAW_EXPORTS_KEPT", "5"))
+
+# -------------------------------
+# Metrics & Traces (utils.instrumentation)
+# -------------------------------
+# Off by default; TRACE_FILE gets one JSON record per traced run, METRICS_PROM_FILE the Prometheus text file
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "False") == "True"
+TRACE_FILE = os.getenv("TRACE_FILE", "data/state/traces.jsonl")
+METRICS_PROM_FILE = os.getenv("METRICS_PROM_FILE", "data/state/alarm_pipeline.prom")
 
 # -------------------------------
-# VNOC Login (optional for auto-download)
+# VNOC (credentials: settings.vnoc_username / settings.vnoc_password)
 # -------------------------------
-if STREAMLIT and "VNOC_USERNAME" in st.secrets:
-    VNOC_USERNAME = st.secrets.get("VNOC_USERNAME", "")
-    VNOC_PASSWORD = st.secrets.get("VNOC_PASSWORD", "")
-else:
-    VNOC_USERNAME = os.getenv("VNOC_USERNAME", "")
-    VNOC_PASSWORD = os.getenv("VNOC_PASSWORD", "")
+VNOC_BASE_URL = os.getenv("VNOC_BASE_URL", "https://vnoc.atctower.in/vnoc")
+VNOC_EXPORT_TARGET = os.getenv("VNOC_EXPORT_TARGET", "")  # export button/postback name ("" = find the Excel button)
 
 # -------------------------------
 # File Paths
 # -------------------------------
+RAW_ALARM_DIR = "data/raw"
 CLEANED_ALARM_FILE = "data/processed/cleaned_alarms.csv"
 MAPPING_FILE = "data/mapping/site_escalation_mapping.xlsx"
+CACHE_DIR = "data/cache"  # compiled mapping etc., shared by the dashboard and CLI runs
+LEDGER_SQLITE_FILE = "data/state/escalation_ledger.db"
+OUTBOX_FILE = "data/state/outbox.db"
+ROLLUP_FILE = "data/state/alarm_rollups.json"
+PIPELINE_LOCK_FILE = "data/state/pipeline.lock"
+PIPELINE_METRICS_FILE = "data/state/pipeline_metrics.json"
+INGEST_INDEX_FILE = "data/state/ingest_index.pkl"  # TTNumber → row hash of the last ingested export
+ESCALATION_MATRIX_FILE = "data/reference/Alarm_Escalation_Matrix.xlsx"
+ESCALATION_RULES_SHEET = "Rules"  # columns: EventName ("*" = any), Role, After_Minutes
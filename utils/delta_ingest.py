@@ -0,0 +1,143 @@
+"""
+Delta ingestion: only alarms that changed since the last export go downstream.
+
+Consecutive VNOC pulls are mostly the same alarms. The last ingested export is remembered
+as its file sha256 plus a compact TTNumber → row hash index (INGEST_INDEX_FILE):
+- a byte-identical export is skipped before it is parsed;
+- otherwise the cleaned batch is diffed against the index into inserted, changed and
+  cleared alarms, so storage only writes those and escalation only wakes up on churn.
+A changed workbook still has to be parsed in full; every stage after that scales with churn.
+"""
+import os
+import logging
+
+import pandas as pd
+
+from utils.config import INGEST_INDEX_FILE
+from utils.alarm_store import processed_alarms_exist, write_processed_alarms
+from utils.mapping_cache import file_sha256
+from utils.preprocessor import load_and_preprocess_alarm_file
+from utils.instrumentation import count, span
+
+
+def _empty_hashes():
+    return pd.Series(dtype="uint64", index=pd.Index([], dtype=object, name="TTNumber"))
+
+
+# ---------------------------
+# Row Fingerprints
+# ---------------------------
+def latest_by_tt(df):
+    """Rows with a TTNumber, keeping the last row of repeated TTNumbers (same as the Mongo upsert)."""
+    keyed = df[df["TTNumber"].notna()]
+    return keyed[~keyed["TTNumber"].astype(str).duplicated(keep="last").to_numpy()]
+
+
+def row_hashes(keyed):
+    """uint64 hash of every row's values, indexed by TTNumber (as str)."""
+    hashes = pd.util.hash_pandas_object(keyed, index=False)
+    hashes.index = pd.Index(keyed["TTNumber"].astype(str).to_numpy(), name="TTNumber")
+    return hashes
+
+
+class AlarmDelta:
+    """What changed between two exports: new and changed rows of the batch, cleared TTNumbers."""
+
+    def __init__(self, inserted, changed, cleared, hashes, sha256=None):
+        self.inserted = inserted
+        self.changed = changed
+        self.cleared = cleared  # TTNumbers (str) active in the previous export, gone now
+        self.hashes = hashes    # index of this batch, saved once the delta is stored
+        self.sha256 = sha256
+
+    @property
+    def upserts(self):
+        return pd.concat([self.inserted, self.changed])
+
+    @property
+    def empty(self):
+        return self.inserted.empty and self.changed.empty and not len(self.cleared)
+
+    def summary(self):
+        return {"inserted": len(self.inserted), "changed": len(self.changed), "cleared": len(self.cleared)}
+
+    def __repr__(self):
+        return f"AlarmDelta({self.summary()})"
+
+
+def compute_delta(df, previous=None, sha256=None):
+    """Diff a cleaned batch against the previous TTNumber → hash index (None = everything is new)."""
+    keyed = latest_by_tt(df)
+    hashes = row_hashes(keyed)
+    if previous is None or previous.empty:
+        return AlarmDelta(keyed, keyed.iloc[:0], pd.Index([], dtype=object), hashes, sha256)
+
+    positions = previous.index.get_indexer(hashes.index)  # -1 → not in the previous export
+    is_new = positions < 0
+    is_changed = ~is_new & (previous.to_numpy()[positions] != hashes.to_numpy())
+    cleared = previous.index[~previous.index.isin(hashes.index)]
+    return AlarmDelta(keyed[is_new], keyed[is_changed], cleared, hashes, sha256)
+
+
+# ---------------------------
+# Index of the Last Export
+# ---------------------------
+class IngestIndex:
+    """File sha256 and row hashes of the last ingested export, pickled in one small file."""
+
+    def __init__(self, path=INGEST_INDEX_FILE):
+        self.path = path
+        self.sha256 = None
+        self.hashes = _empty_hashes()
+        if os.path.exists(path):
+            try:
+                state = pd.read_pickle(path)
+                self.sha256, self.hashes = state["sha256"], state["hashes"]
+            except Exception as e:
+                logging.warning(f"⚠️ Ignoring unreadable ingest index {path}: {e}")
+
+    def save(self, delta):
+        """Make delta's batch the new baseline (call after the delta was stored)."""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        pd.to_pickle({"sha256": delta.sha256, "hashes": delta.hashes}, tmp_path)
+        os.replace(tmp_path, self.path)
+        self.sha256, self.hashes = delta.sha256, delta.hashes
+
+    def reset(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.sha256, self.hashes = None, _empty_hashes()
+
+
+# ---------------------------
+# Public API
+# ---------------------------
+def preprocess_delta(file_path, output_path, index=None, streaming=False):
+    """
+    Preprocess an export against the last ingested one.
+    Returns None when the file is byte-identical to it, else (cleaned df, AlarmDelta).
+    The processed file is only rewritten when something changed. Call index.save(delta)
+    once the delta has been stored, so a failed store is retried with the next export.
+    """
+    index = index or IngestIndex()
+    with span("delta.file_hash"):
+        sha256 = file_sha256(file_path)
+    if sha256 == index.sha256 and (not output_path or processed_alarms_exist(output_path)):
+        count("delta_exports_total", result="unchanged")
+        print(f"⏭️ {os.path.basename(file_path)} is identical to the last ingested export. Skipped.")
+        return None
+
+    df = load_and_preprocess_alarm_file(file_path, None, streaming=streaming)
+    with span("delta.diff"):
+        delta = compute_delta(df, index.hashes, sha256)
+    for kind, n in delta.summary().items():
+        count("delta_alarms_total", n, kind=kind)
+    count("delta_exports_total", result="changed")
+    print(f"🔀 Delta vs last export → new: {len(delta.inserted)}, changed: {len(delta.changed)}, cleared: {len(delta.cleared)}")
+
+    if output_path and (not delta.empty or not processed_alarms_exist(output_path)):
+        with span("preprocess.save"):
+            saved_path = write_processed_alarms(df, output_path)
+        print(f"✅ Cleaned & filtered file saved at: {saved_path}")
+    return df, delta
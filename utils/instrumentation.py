@@ -0,0 +1,284 @@
+"""
+Lightweight timers, counters and per-run traces for the alarm pipeline.
+
+Off by default (METRICS_ENABLED=True turns it on): every span/count call then returns after
+one flag check. When on, stage timings feed a Prometheus histogram, counters a Prometheus
+counter, and each traced run (preprocess, escalation, Mongo upsert, daemon batch) appends one
+JSON record to TRACE_FILE and rewrites the Prometheus text file METRICS_PROM_FILE.
+"""
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+from bisect import bisect_left
+from contextvars import ContextVar
+from functools import wraps
+
+from utils.config import METRICS_ENABLED, METRICS_PROM_FILE, TRACE_FILE
+
+METRIC_PREFIX = "alarm_pipeline"
+
+# Stage duration histogram buckets, in seconds
+DURATION_BUCKETS = (0.005, 0.025, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+_enabled = METRICS_ENABLED
+_current_trace = ContextVar("current_trace", default=None)
+
+
+def enabled():
+    return _enabled
+
+
+def enable(on=True):
+    """Turn instrumentation on (or off) for this process, e.g. from a CLI flag."""
+    global _enabled
+    _enabled = on
+
+
+# ---------------------------
+# Registry & Prometheus Text
+# ---------------------------
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    escape = lambda v: v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in pairs) + "}"
+
+
+class Registry:
+    """Process-wide counters and duration histograms (thread-safe)."""
+
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self.counters = {}    # (name, labels) → value
+        self.histograms = {}  # (name, labels) → [bucket counts..., +Inf count, sum]
+
+    def inc(self, name, value, labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, seconds, labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = [0] * (len(self.buckets) + 2)
+            hist[bisect_left(self.buckets, seconds)] += 1
+            hist[-1] += seconds
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted((k, list(v)) for k, v in self.histograms.items())
+
+        lines, typed = [], set()
+        for (name, key), value in counters:
+            metric = f"{METRIC_PREFIX}_{name}"
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} counter")
+                typed.add(metric)
+            lines.append(f"{metric}{_format_labels(key)} {value:g}")
+
+        for (name, key), hist in histograms:
+            metric = f"{METRIC_PREFIX}_{name}"
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} histogram")
+                typed.add(metric)
+            cumulative = 0
+            for edge, n in zip(list(self.buckets) + ["+Inf"], hist[:-1]):
+                cumulative += n
+                lines.append(f"{metric}_bucket{_format_labels(key, [('le', str(edge))])} {cumulative}")
+            lines.append(f"{metric}_sum{_format_labels(key)} {hist[-1]:.6f}")
+            lines.append(f"{metric}_count{_format_labels(key)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def render_prometheus():
+    return registry.render()
+
+
+def write_prometheus(path=METRICS_PROM_FILE):
+    """Atomically rewrite the Prometheus text file (node_exporter textfile collector format)."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(registry.render())
+    os.replace(tmp_path, path)
+    return path
+
+
+def start_metrics_server(port, host="0.0.0.0"):
+    """Serve /metrics on a daemon thread and turn instrumentation on. Returns the server."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip("/") not in ("", "/metrics"):
+                self.send_error(404)
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass  # scrapes are not worth a log line each
+
+    enable()
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logging.info(f"📊 Serving Prometheus metrics on http://{host}:{server.server_port}/metrics")
+    return server
+
+
+# ---------------------------
+# Spans, Counters & Traces
+# ---------------------------
+class _NoOp:
+    """Shared do-nothing context manager returned while instrumentation is off."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoOp()
+
+
+class _Span:
+    def __init__(self, stage, labels):
+        self.stage = stage
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        registry.observe("stage_duration_seconds", elapsed, {"stage": self.stage, **self.labels})
+        if exc_type is not None:
+            registry.inc("stage_errors_total", 1, {"stage": self.stage})
+
+        run = _current_trace.get()
+        if run is not None:
+            stats = run["stages"].get(self.stage)
+            if stats is None:
+                stats = run["stages"][self.stage] = {"calls": 0, "total_ms": 0.0, "max_ms": 0.0, "errors": 0}
+            ms = elapsed * 1000
+            stats["calls"] += 1
+            stats["total_ms"] += ms
+            stats["max_ms"] = max(stats["max_ms"], ms)
+            stats["errors"] += exc_type is not None
+        return False
+
+
+def span(stage, **labels):
+    """Time a block: `with span("preprocess.read_excel"): ...`."""
+    if not _enabled:
+        return _NOOP
+    return _Span(stage, labels)
+
+
+def count(name, value=1, **labels):
+    """Add to a counter (exported as alarm_pipeline_<name>) and to the current trace."""
+    if not _enabled:
+        return
+    registry.inc(name, value, labels)
+    run = _current_trace.get()
+    if run is not None:
+        key = name + _format_labels(_label_key(labels))
+        run["counters"][key] = run["counters"].get(key, 0) + value
+
+
+def instrumented(stage):
+    """Decorator form of span()."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _Span(stage, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class _Trace:
+    """One pipeline run: stage timings and counters aggregated into a single record."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.record = {
+            "run_id": uuid.uuid4().hex[:12], "name": self.name,
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "stages": {}, "counters": {},
+        }
+        self.token = _current_trace.set(self.record)
+        self.start = time.perf_counter()
+        return self.record
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        _current_trace.reset(self.token)
+        status = "failed" if exc_type is not None else "ok"
+        record = self.record
+        record["duration_ms"] = round(elapsed * 1000, 2)
+        record["status"] = status
+        for stats in record["stages"].values():
+            stats["total_ms"] = round(stats["total_ms"], 2)
+            stats["max_ms"] = round(stats["max_ms"], 2)
+
+        registry.observe("run_duration_seconds", elapsed, {"run": self.name})
+        registry.inc("runs_total", 1, {"run": self.name, "status": status})
+        try:
+            os.makedirs(os.path.dirname(TRACE_FILE) or ".", exist_ok=True)
+            with open(TRACE_FILE, "a") as f:
+                f.write(json.dumps(record) + "\n")
+            write_prometheus()
+        except OSError as e:
+            logging.warning(f"⚠️ Could not write metrics: {e}")
+        return False
+
+
+def trace(name):
+    """
+    Record a run. Only the outermost trace writes a record; a trace started inside
+    another one (e.g. preprocessing inside a daemon batch) is timed as a span of it.
+    """
+    if not _enabled:
+        return _NOOP
+    if _current_trace.get() is not None:
+        return _Span(name, {})
+    return _Trace(name)
+
+
+def traced(name):
+    """Decorator form of trace()."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with trace(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,96 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+
+import pandas as pd
+
+from utils.config import MAPPING_FILE, CACHE_DIR
+
+# In-process copy, so Streamlit reruns and repeated CLI calls skip even the pickle load
+_memo = {}
+_lock = threading.Lock()
+
+
+def file_sha256(path, block_size=1 << 20):
+    """Hex sha256 of a file, read in blocks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _cache_paths(path):
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(CACHE_DIR, f"{stem}.pkl"), os.path.join(CACHE_DIR, f"{stem}.meta.json")
+
+
+def normalize_mapping(mapping_df):
+    """Normalize mapping columns and index rows by GLOBAL_ID (as string) for indexed joins."""
+    mapping_df.columns = mapping_df.columns.str.strip().str.replace(" ", "_")
+    mapping_df["GLOBAL_ID"] = mapping_df["GLOBAL_ID"].astype(str)
+    mapping_df.index = pd.Index(mapping_df["GLOBAL_ID"].to_numpy())
+    return mapping_df
+
+
+def _rebuild(path, data_path, meta_path, meta):
+    logging.info(f"📘 Building mapping cache from {path}")
+    mapping_df = normalize_mapping(pd.read_excel(path))
+
+    # Write-then-rename so concurrent readers (Streamlit + CLI) never see a partial cache
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp_data, tmp_meta = f"{data_path}.{os.getpid()}.tmp", f"{meta_path}.{os.getpid()}.tmp"
+    mapping_df.to_pickle(tmp_data)
+    with open(tmp_meta, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp_data, data_path)
+    os.replace(tmp_meta, meta_path)
+    return mapping_df
+
+
+def load_mapping(path=MAPPING_FILE):
+    """
+    Return the normalized site escalation mapping, indexed by GLOBAL_ID.
+    The xlsx is only parsed when its mtime/size changed and its content hash differs
+    from the cached copy; otherwise the compiled pickle in CACHE_DIR is used.
+    """
+    stat = os.stat(path)
+    fingerprint = (stat.st_mtime_ns, stat.st_size)
+
+    with _lock:
+        cached = _memo.get(path)
+        if cached and cached[0] == fingerprint:
+            return cached[1]
+
+        data_path, meta_path = _cache_paths(path)
+        meta = {}
+        if os.path.exists(meta_path) and os.path.exists(data_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+
+        mapping_df = None
+        if meta.get("source") == os.path.abspath(path):
+            if (meta.get("mtime_ns"), meta.get("size")) == fingerprint:
+                mapping_df = pd.read_pickle(data_path)
+            else:
+                sha256 = file_sha256(path)
+                if meta.get("sha256") == sha256:
+                    # Touched or copied but unchanged → keep cache, refresh fingerprint
+                    mapping_df = pd.read_pickle(data_path)
+                    meta.update(mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+                    with open(meta_path, "w") as f:
+                        json.dump(meta, f)
+
+        if mapping_df is None:
+            meta = {
+                "source": os.path.abspath(path),
+                "mtime_ns": stat.st_mtime_ns,
+                "size": stat.st_size,
+                "sha256": file_sha256(path),
+            }
+            mapping_df = _rebuild(path, data_path, meta_path, meta)
+
+        _memo[path] = (fingerprint, mapping_df)
+        return mapping_df
@@ -1,13 +1,100 @@
-import pandas as pd
+from itertools import islice
+
+from utils.config import settings, MONGO_BATCH_SIZE, MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE, MONGO_TIMEOUT_MS
+
+DOCUMENT_BATCH_SIZE = 1000
+
+# Bulk upsert batch size (ops per bulk_write round trip)
+BULK_BATCH_SIZE = MONGO_BATCH_SIZE
+
+# Indexes used by the upsert key and the open-alarm queries: (field, unique)
+ALARM_INDEXES = [("TTNumber", True), ("EsclationStatus", False), ("SiteID", False), ("OpenTime", False)]
+
+# Connection pool tuning shared by the sync (pymongo) and async (motor) clients
+MONGO_CLIENT_OPTIONS = {
+    "maxPoolSize": MONGO_MAX_POOL_SIZE,
+    "minPoolSize": MONGO_MIN_POOL_SIZE,
+    "maxIdleTimeMS": 60_000,
+    "serverSelectionTimeoutMS": MONGO_TIMEOUT_MS,
+}
+
+# Optional Mongo-backed stores (ledger, rollups) probe with a short timeout and fall back to local files
+PROBE_TIMEOUT_MS = 2000
+_probe_client = None
+
+
+def get_probe_client():
+    """Shared short-timeout MongoClient for stores that fall back to local files; created on first use."""
+    global _probe_client
+    if _probe_client is None:
+        from pymongo import MongoClient
+
+        _probe_client = MongoClient(settings.mongo_uri, serverSelectionTimeoutMS=PROBE_TIMEOUT_MS)
+    return _probe_client
+
+
+def _column_values(series):
+    """Column as Python objects (BSON-encodable) with NaN/NaT replaced by None via one mask."""
+    values = series.to_numpy(dtype=object)
+    missing = series.isna().to_numpy()
+    if missing.any():
+        values[missing] = None
+    return values
+
+
+def iter_document_batches(df, batch_size=DOCUMENT_BATCH_SIZE):
+    """
+    Yield lists of Mongo-ready dicts, converting one slice of rows at a time.
+    No full-frame copies are made, and the input frame is not modified.
+    """
+    columns = list(df.columns)
+    for start in range(0, len(df), batch_size):
+        part = df.iloc[start:start + batch_size]
+        arrays = [_column_values(part[col]) for col in columns]
+        yield [dict(zip(columns, row)) for row in zip(*arrays)]
+
+
+def iter_documents(df, batch_size=DOCUMENT_BATCH_SIZE):
+    """Flat generator of documents, e.g. to feed mongo_crud.upsert_bulk_alarms directly."""
+    for batch in iter_document_batches(df, batch_size):
+        yield from batch
+
 
 def df_to_dicts(df):
-    import numpy as np
+    """Convert a DataFrame to a list of Mongo documents (NaN/NaT → None)."""
+    return list(iter_documents(df))
+
+
+# ---------------------------
+# Bulk Write Helpers
+# ---------------------------
+def batched(records, size):
+    """Yield lists of up to `size` items from any iterable."""
+    it = iter(records)
+    while batch := list(islice(it, size)):
+        yield batch
+
+
+def build_upsert_ops(batch):
+    """
+    UpdateOne upserts keyed on TTNumber for one batch (last state wins for repeated TTNumbers).
+    Returns (ops, skipped) where skipped counts records without a TTNumber.
+    """
+    from pymongo import UpdateOne
 
-    # Convert datetime columns (NaT → None)
-    for col in df.select_dtypes(include=["datetime64[ns]"]).columns:
-        df[col] = df[col].apply(lambda x: x if pd.notnull(x) else None)
+    latest, skipped = {}, 0
+    for record in batch:
+        tt_number = record.get("TTNumber")
+        if tt_number is None:
+            skipped += 1
+            continue
+        latest[tt_number] = record
+    ops = [UpdateOne({"TTNumber": tt}, {"$set": record}, upsert=True) for tt, record in latest.items()]
+    return ops, skipped
 
-    # Replace NaN in all other columns with None
-    df = df.replace({np.nan: None})
 
-    return df.to_dict(orient="records")
+def add_write_counts(counts, result):
+    """Accumulate a BulkWriteResult into inserted/updated/unchanged counts."""
+    counts["inserted"] += result.upserted_count
+    counts["updated"] += result.modified_count
+    counts["unchanged"] += result.matched_count - result.modified_count
@@ -5,56 +5,216 @@ from datetime import datetime
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
+from utils.alarm_store import ProcessedAlarmWriter, write_processed_alarms
+from utils.instrumentation import count, span, traced
 
-def load_and_preprocess_alarm_file(file_path: str, output_path: str) -> pd.DataFrame:
-    """
-    Load, clean, and preprocess the raw TTLog alarm file.
-    - Keeps only required columns
-    - Normalizes headers
-    - Parses timestamps
-    - Removes cleared alarms
-    - Detects site-down alarms (2G/3G/4G outage)
-    - Saves cleaned CSV for escalation
-    """
+# Required columns
+REQUIRED_COLUMNS = [
+    "OpenTime", "TTNumber", "Cluster", "SiteID", "SiteName",
+    "SourceInput", "EventName", "ClusterEngineer", "Technician",
+    "EsclationStatus", "ClearedDateTime"
+]
+OUTAGE_KEYWORDS = ["2G OUTAGE", "3G OUTAGE", "4G OUTAGE"]
 
-    # Load Excel, row 1 is actual header
-    df = pd.read_excel(file_path, header=1)
+# Streaming mode: rows parsed per chunk
+STREAM_CHUNK_ROWS = 5000
 
-    # Required columns
-    required_columns = [
-        "OpenTime", "TTNumber", "Cluster", "SiteID", "SiteName",
-        "SourceInput", "EventName", "ClusterEngineer", "Technician",
-        "EsclationStatus", "ClearedDateTime"
-    ]
+# Strings read_excel treats as missing
+_NA_STRINGS = {
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND",
+    "1.#QNAN", "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+}
 
-    missing = [col for col in required_columns if col not in df.columns]
-    if missing:
-        raise KeyError(f"⚠️ Missing required columns in alarm file: {missing}")
 
-    # Subset + normalize
-    df = df[required_columns].copy()
+def _normalize_alarms(df: pd.DataFrame) -> pd.DataFrame:
+    """Normalize headers and parse timestamps (cleared alarms are kept)."""
     df.columns = [col.strip().replace(" ", "_") for col in df.columns]
 
     # Parse timestamps
     df["OpenTime"] = pd.to_datetime(df["OpenTime"], errors="coerce")
     df["ClearedDateTime"] = pd.to_datetime(df["ClearedDateTime"], errors="coerce")
+    return df
 
+
+def _filter_active(df: pd.DataFrame) -> pd.DataFrame:
+    """Drop cleared alarms and flag site-down alarms."""
     # Keep only active alarms
-    before_count = len(df)
     df = df[df["ClearedDateTime"].isna()].copy()
-    after_count = len(df)
-    print(f"⚡ Removed {before_count - after_count} cleared alarms. Remaining active: {after_count}")
 
     # Detect site-down based on EventName
-    outage_keywords = ["2G OUTAGE", "3G OUTAGE", "4G OUTAGE"]
-    df["Is_SiteDown"] = df["EventName"].str.upper().isin(outage_keywords)
+    df["Is_SiteDown"] = df["EventName"].str.upper().isin(OUTAGE_KEYWORDS)
 
     # Drop ClearedDateTime (not needed anymore)
     df.drop(columns=["ClearedDateTime"], inplace=True)
+    return df
+
+
+def _clean_alarms(df: pd.DataFrame) -> pd.DataFrame:
+    """Normalize headers, parse timestamps, drop cleared alarms and flag site-down alarms."""
+    return _filter_active(_normalize_alarms(df))
+
+
+def read_alarm_rows(file_path) -> pd.DataFrame:
+    """Required columns of a raw TTLog export, all rows (row 1 is the actual header)."""
+    df = pd.read_excel(file_path, header=1)
+
+    missing = [col for col in REQUIRED_COLUMNS if col not in df.columns]
+    if missing:
+        raise KeyError(f"⚠️ Missing required columns in alarm file: {missing}")
+    return df[REQUIRED_COLUMNS].copy()
+
+
+@traced("preprocess")
+def load_and_preprocess_alarm_file(file_path: str, output_path: str, streaming: bool = False,
+                                   keep_frame: bool = True) -> pd.DataFrame:
+    """
+    Load, clean, and preprocess the raw TTLog alarm file.
+    - Keeps only required columns
+    - Normalizes headers
+    - Parses timestamps
+    - Removes cleared alarms
+    - Detects site-down alarms (2G/3G/4G outage)
+    - Saves cleaned CSV (or Parquet, see utils.alarm_store) for escalation (unless output_path is None)
+    With streaming=True the workbook is read row by row instead (flat memory for large exports);
+    keep_frame=False then only writes the file and returns None.
+    """
+    if streaming:
+        return stream_preprocess_alarm_file(file_path, output_path, keep_frame=keep_frame)
+
+    # Subset + clean
+    with span("preprocess.read_excel"):
+        df = read_alarm_rows(file_path)
+    before_count = len(df)
+    with span("preprocess.clean"):
+        df = _clean_alarms(df)
+    after_count = len(df)
+    count("alarms_read_total", before_count)
+    count("alarms_active_total", after_count)
+    print(f"⚡ Removed {before_count - after_count} cleared alarms. Remaining active: {after_count}")
+
+    # Save (skipped when output_path is None, e.g. for cached parses in the dashboard)
+    if output_path:
+        with span("preprocess.save"):
+            saved_path = write_processed_alarms(df, output_path)
+        print(f"✅ Cleaned & filtered file saved at: {saved_path}")
+    return df
+
+
+# ---------------------------
+# Streaming Mode
+# ---------------------------
+def _convert_cell(value):
+    """Convert an openpyxl value the way pandas.read_excel does (integral floats → int, blanks → None)."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str) and value in _NA_STRINGS:
+        return None
+    return value
+
+
+def _iter_alarm_rows(file_path: str):
+    """
+    Yield only the required columns of each data row (row 1 is the header), with the same
+    row semantics as read_excel: blank rows inside the data are kept, trailing ones dropped.
+    """
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[0]
+        sheet.reset_dimensions()
+        rows = sheet.iter_rows(values_only=True)
+
+        next(rows, None)  # title row
+        header = next(rows, None) or ()
+        positions = {}
+        for i, name in enumerate(header):
+            positions.setdefault(name, i)
+
+        missing = [col for col in REQUIRED_COLUMNS if col not in positions]
+        if missing:
+            raise KeyError(f"⚠️ Missing required columns in alarm file: {missing}")
+
+        idx = [positions[col] for col in REQUIRED_COLUMNS]
+        blank = [None] * len(idx)
+        pending_blank = 0
+        for row in rows:
+            if all(v is None or v == "" for v in row):
+                pending_blank += 1  # only emitted if more data follows
+                continue
+            for _ in range(pending_blank):
+                yield blank
+            pending_blank = 0
+            yield [_convert_cell(row[i]) if i < len(row) else None for i in idx]
+    finally:
+        workbook.close()
+
+
+def _track_numeric(chunk: pd.DataFrame, stats: dict) -> None:
+    """Record per column whether all values are numeric and whether read_excel would upcast to float."""
+    for col, (all_numeric, needs_float) in stats.items():
+        if not all_numeric:
+            continue
+        values = pd.to_numeric(chunk[col], errors="coerce")
+        missing = chunk[col].isna()
+        if (values.isna() & ~missing).any():
+            stats[col] = (False, False)
+        else:
+            stats[col] = (True, needs_float or missing.any() or bool((values.dropna() % 1 != 0).any()))
+
+
+def stream_preprocess_alarm_file(file_path: str, output_path: str, chunk_rows: int = STREAM_CHUNK_ROWS,
+                                 keep_frame: bool = True) -> pd.DataFrame:
+    """
+    Streaming variant of load_and_preprocess_alarm_file.
+    Rows are read with openpyxl in read-only mode, projected to the required columns and
+    filtered chunk by chunk; each cleaned chunk is appended to the output as soon as it is
+    produced. Column types are inferred over the whole file as read_excel does and applied
+    when the file is closed, so the saved file matches. With keep_frame=False the active
+    alarms are not collected either (memory stays flat) and None is returned.
+    """
+    stats = {col: (True, False) for col in REQUIRED_COLUMNS if col not in ("OpenTime", "ClearedDateTime")}
+    before_count, active_count, active_chunks, buffer = 0, 0, [], []
+    writer = ProcessedAlarmWriter(output_path, chunk_rows=chunk_rows) if output_path else None
+
+    def flush():
+        nonlocal active_count
+        index = pd.RangeIndex(before_count - len(buffer), before_count)
+        chunk = pd.DataFrame(buffer, columns=REQUIRED_COLUMNS, index=index, dtype=object)
+        _track_numeric(chunk, stats)
+        active = _clean_alarms(chunk)
+        active_count += len(active)
+        if writer:
+            writer.append(active)
+        if keep_frame:
+            active_chunks.append(active)
+        buffer.clear()
+
+    with span("preprocess.stream_read"):
+        for row in _iter_alarm_rows(file_path):
+            buffer.append(row)
+            before_count += 1
+            if len(buffer) >= chunk_rows:
+                flush()
+        if buffer or not before_count:
+            flush()
+
+    numeric = {col: "float64" if needs_float else "int64" for col, (all_numeric, needs_float) in stats.items() if all_numeric}
+    count("alarms_read_total", before_count)
+    count("alarms_active_total", active_count)
+    print(f"⚡ Removed {before_count - active_count} cleared alarms. Remaining active: {active_count}")
 
-    # Save
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    df.to_csv(output_path, index=False)
+    # Save (skipped when output_path is None, e.g. for cached parses in the dashboard)
+    if writer:
+        with span("preprocess.save"):
+            saved_path = writer.close(numeric)
+        print(f"✅ Cleaned & filtered file saved at: {saved_path}")
 
-    print(f"✅ Cleaned & filtered file saved at: {output_path}")
+    if not keep_frame:
+        return None
+    df = pd.concat(active_chunks).infer_objects()
+    for col, dtype in numeric.items():
+        df[col] = pd.to_numeric(df[col]).astype(dtype)
     return df
@@ -0,0 +1,197 @@
+import os
+import json
+import logging
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from utils.config import settings, ROLLUP_BACKEND, ROLLUP_COLLECTION, ROLLUP_FILE
+from utils.mongo_utils import get_probe_client
+
+# Rollup dimension → grouping columns of the cleaned alarm frame
+ROLLUP_DIMENSIONS = {
+    "cluster": ["Cluster"],
+    "site": ["SiteID"],
+    "event": ["EventName"],
+    "cluster_event": ["Cluster", "EventName"],
+}
+
+# Alarm age histogram: bucket label → lower edge in hours
+AGE_BUCKETS = {"<1h": 0, "1-4h": 1, "4-12h": 4, "12-24h": 12, "1-3d": 24, ">3d": 72}
+
+ROLLUP_COLUMNS = (
+    ["_id", "dimension", "key", "Cluster", "SiteID", "SiteName", "EventName",
+     "open", "site_down", "sites", "oldest_open"] + list(AGE_BUCKETS)
+)
+
+
+# ---------------------------
+# Computing Rollups
+# ---------------------------
+def compute_rollups(df, now=None):
+    """
+    Open-alarm counts per cluster, site, event and cluster/event from a cleaned alarm batch,
+    with site-down counts, distinct sites, the oldest OpenTime and an age histogram.
+    One pass of groupbys over the batch; nothing is read back from AlarmLogs.
+    """
+    now = pd.Timestamp(now or datetime.now())
+    work = pd.DataFrame({
+        "Cluster": df["Cluster"].astype(str).str.strip(),
+        "SiteID": df["SiteID"].astype(str),
+        "SiteName": df["SiteName"].astype(str) if "SiteName" in df else "",
+        "EventName": df["EventName"].astype(str).str.strip().str.upper(),
+        "Is_SiteDown": df["Is_SiteDown"].astype(bool) if "Is_SiteDown" in df else False,
+        "OpenTime": pd.to_datetime(df["OpenTime"], errors="coerce"),
+    })
+
+    # Unknown OpenTime counts as just opened (same as the escalation rules)
+    age_hours = ((now - work["OpenTime"]).dt.total_seconds() / 3600).fillna(0).clip(lower=0)
+    edges = list(AGE_BUCKETS.values()) + [np.inf]
+    work["age_bucket"] = pd.cut(age_hours, bins=edges, right=False, labels=list(AGE_BUCKETS))
+
+    parts = []
+    for dimension, keys in ROLLUP_DIMENSIONS.items():
+        grouped = work.groupby(keys, sort=False)
+        stats = grouped.agg(
+            open=("SiteID", "size"),
+            site_down=("Is_SiteDown", "sum"),
+            sites=("SiteID", "nunique"),
+            oldest_open=("OpenTime", "min"),
+            **({"Cluster": ("Cluster", "first"), "SiteName": ("SiteName", "first")} if dimension == "site" else {}),
+        )
+        hist = (
+            work.groupby(keys + ["age_bucket"], sort=False, observed=False).size()
+            .unstack("age_bucket", fill_value=0)
+            .reindex(columns=list(AGE_BUCKETS), fill_value=0)
+        )
+        part = stats.join(hist).reset_index()
+        part.insert(0, "dimension", dimension)
+        part.insert(1, "key", part[keys].astype(str).agg(" / ".join, axis=1) if len(keys) > 1 else part[keys[0]])
+        parts.append(part)
+
+    rollups = pd.concat(parts, ignore_index=True).reindex(columns=ROLLUP_COLUMNS[1:])
+    rollups.insert(0, "_id", rollups["dimension"] + ":" + rollups["key"])
+    counts = ["open", "site_down", "sites"] + list(AGE_BUCKETS)
+    rollups[counts] = rollups[counts].fillna(0).astype("int64")
+    return rollups
+
+
+def _to_records(rollups):
+    """Rollup rows as plain dicts (NaN → None, Timestamp → datetime) for JSON/BSON."""
+    out = rollups.astype(object).where(rollups.notna(), None)
+    records = out.to_dict(orient="records")
+    for record in records:
+        if record["oldest_open"] is not None:
+            record["oldest_open"] = pd.Timestamp(record["oldest_open"]).to_pydatetime()
+    return records
+
+
+def _from_records(records):
+    rollups = pd.DataFrame(records).reindex(columns=ROLLUP_COLUMNS)
+    rollups["oldest_open"] = pd.to_datetime(rollups["oldest_open"], errors="coerce")
+    return rollups
+
+
+def _changed(records, previous):
+    """Records whose content differs from the stored version, and stored ids that are gone."""
+    old = {r["_id"]: r for r in previous}
+    changed = [r for r in records if old.get(r["_id"]) != r]
+    current = {r["_id"] for r in records}
+    stale = [rid for rid in old if rid not in current]
+    return changed, stale
+
+
+# ---------------------------
+# Rollup Stores
+# ---------------------------
+class MongoRollupStore:
+    """Rollups as one small document per (dimension, key) plus a _meta document."""
+
+    name = "mongo"
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def load(self):
+        docs = list(self.collection.find({}))
+        meta = next((d for d in docs if d["_id"] == "_meta"), {})
+        return [d for d in docs if d["_id"] != "_meta"], meta.get("as_of")
+
+    def save(self, records, as_of):
+        from pymongo import ReplaceOne, DeleteMany
+
+        previous, _ = self.load()
+        changed, stale = _changed(records, previous)
+        ops = [ReplaceOne({"_id": r["_id"]}, r, upsert=True) for r in changed]
+        if stale:
+            ops.append(DeleteMany({"_id": {"$in": stale}}))
+        ops.append(ReplaceOne({"_id": "_meta"}, {"_id": "_meta", "as_of": as_of, "groups": len(records)}, upsert=True))
+        self.collection.bulk_write(ops, ordered=False)
+        return len(changed), len(stale)
+
+
+class FileRollupStore:
+    """Local fallback: all rollups in one JSON file, replaced atomically."""
+
+    name = "file"
+
+    def __init__(self, path=ROLLUP_FILE):
+        self.path = path
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return [], None
+        with open(self.path) as f:
+            data = json.load(f)
+        for record in data["rollups"]:
+            if record["oldest_open"]:
+                record["oldest_open"] = datetime.fromisoformat(record["oldest_open"])
+        return data["rollups"], datetime.fromisoformat(data["as_of"])
+
+    def save(self, records, as_of):
+        previous, _ = self.load()
+        changed, stale = _changed(records, previous)
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"as_of": as_of, "rollups": records}, f, default=lambda v: v.isoformat())
+        os.replace(tmp_path, self.path)
+        return len(changed), len(stale)
+
+
+def get_rollup_store(backend=ROLLUP_BACKEND):
+    """Return the Mongo rollup store when reachable (or forced), otherwise the JSON file."""
+    if backend in ("auto", "mongo"):
+        try:
+            client = get_probe_client()
+            client.admin.command("ping")
+            return MongoRollupStore(client[settings.mongo_db][ROLLUP_COLLECTION])
+        except Exception as e:
+            if backend == "mongo":
+                raise
+            logging.warning(f"⚠️ MongoDB rollups unavailable ({e}). Using {ROLLUP_FILE}.")
+    return FileRollupStore()
+
+
+# ---------------------------
+# Public API
+# ---------------------------
+def update_rollups(df, now=None, store=None):
+    """Recompute rollups from a cleaned alarm batch and write only the groups that changed."""
+    as_of = (pd.Timestamp(now) if now is not None else pd.Timestamp.now()).to_pydatetime().replace(microsecond=0)
+    rollups = compute_rollups(df, now=as_of)
+    store = store or get_rollup_store()
+    changed, stale = store.save(_to_records(rollups), as_of)
+    logging.info(f"📈 Rollups ({store.name}): {len(rollups)} groups, {changed} changed, {stale} removed")
+    return rollups
+
+
+def load_rollups(store=None, dimension=None):
+    """Latest rollups as (DataFrame, as_of). Reads the small rollup store, never AlarmLogs."""
+    store = store or get_rollup_store()
+    records, as_of = store.load()
+    rollups = _from_records(records)
+    if dimension:
+        rollups = rollups[rollups["dimension"] == dimension].reset_index(drop=True)
+    return rollups, as_of